@@ -0,0 +1,213 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Admission control for chat turns.
+
+Expense analyses hold an o3 stream for tens of seconds and vision calls are
+slow and quota-hungry, so a handful of users asking for them at once could use
+up the Azure quota and worker threads that quick flight lookups need.
+AdmissionController gives each query intent its own pool of turn slots:
+
+- each pool admits a fixed number of concurrent turns, plus a short FIFO queue
+- each user may hold only a few slots (running or queued) in a pool; requests
+  without a user identity are only bounded by the pool itself, since counting
+  them under one shared key would turn the per-user cap into a site-wide one
+- a turn that would wait longer than the pool's deadline is rejected straight
+  away, using the pool's recent turn durations to estimate the wait, so users
+  get a fast "busy" answer instead of a long hang
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PoolLimits:
+    """Capacity of one admission pool."""
+
+    concurrency: int  # Turns running at once
+    per_user: int  # Turns one user may have running or queued
+    max_queue: int  # Turns waiting for a slot
+    max_wait: float  # Seconds a turn may wait before it is rejected
+
+
+class AdmissionRejected(Exception):
+    """A turn was not admitted."""
+
+    def __init__(self, pool: str, reason: str, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.pool = pool
+        self.reason = reason
+        self.message = message
+        self.retry_after = retry_after
+
+
+class AdmissionSlot:
+    """A granted slot. Call release() when the turn ends."""
+
+    def __init__(self, pool: "_Pool", user: str | None):
+        self._pool = pool
+        self._user = user
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        """Give the slot to the next queued turn. Safe to call more than once."""
+        if not self._released:
+            self._released = True
+            self._pool.release(self._user, time.monotonic() - self._started)
+
+
+class _Pool:
+    """Slots, FIFO wait queue and statistics for one intent."""
+
+    def __init__(self, name: str, limits: PoolLimits):
+        self.name = name
+        self.limits = limits
+        self.active = 0
+        self.waiters: deque[tuple[str | None, asyncio.Future[None]]] = deque()
+        self.users: Counter[str] = Counter()  # Running or queued turns per user
+
+        self.avg_hold: float | None = None  # Moving average of turn duration
+        self.admitted = 0
+        self.rejected: Counter[str] = Counter()
+        self.waits: deque[float] = deque(maxlen=500)
+
+    def expected_wait(self) -> float:
+        """Estimated wait for a turn joining the back of the queue."""
+        if self.active < self.limits.concurrency and not self.waiters:
+            return 0.0
+        rounds = math.ceil((len(self.waiters) + 1) / self.limits.concurrency)
+        return rounds * (self.avg_hold or 0.0)
+
+    def reject(self, reason: str, message: str, retry_after: float | None = None) -> AdmissionRejected:
+        self.rejected[reason] += 1
+        logger.info(f"Admission rejected for {self.name}: {reason}")
+        return AdmissionRejected(self.name, reason, message, retry_after)
+
+    async def acquire(self, user: str | None) -> AdmissionSlot:
+        limits = self.limits
+        if user is not None and self.users[user] >= limits.per_user:
+            raise self.reject(
+                "per_user", f"You already have {self.users[user]} {self.name} request(s) in progress."
+            )
+        if len(self.waiters) >= limits.max_queue:
+            raise self.reject("queue_full", f"Too many {self.name} requests are queued.", self.avg_hold)
+        expected = self.expected_wait()
+        if expected > limits.max_wait:
+            raise self.reject(
+                "deadline", f"{self.name.title()} requests are busy, the wait would be about {expected:.0f}s.", expected
+            )
+
+        started = time.monotonic()
+        if user is not None:
+            self.users[user] += 1
+        if self.active < limits.concurrency and not self.waiters:
+            self.active += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append((user, waiter))
+            try:
+                await asyncio.wait_for(waiter, limits.max_wait)
+            except BaseException as e:
+                if waiter.done() and not waiter.cancelled():
+                    if isinstance(e, asyncio.TimeoutError):
+                        pass  # The slot was handed over just as the deadline passed
+                    else:
+                        self.release(user, None)  # Handed over as we were cancelled - pass it on
+                        raise
+                else:
+                    self._forget(user, waiter)
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise self.reject(
+                            "timeout",
+                            f"{self.name.title()} requests are busy, please try again shortly.",
+                            self.avg_hold,
+                        ) from None
+                    raise
+
+        self.admitted += 1
+        self.waits.append(time.monotonic() - started)
+        return AdmissionSlot(self, user)
+
+    def _forget(self, user: str | None, waiter: asyncio.Future[None] | None = None) -> None:
+        """Stop counting a turn against its user, and drop it from the queue if it gave up waiting."""
+        if user is not None:
+            self.users[user] -= 1
+            if self.users[user] <= 0:
+                del self.users[user]
+        if waiter is not None:
+            try:
+                self.waiters.remove((user, waiter))
+            except ValueError:
+                pass
+
+    def release(self, user: str | None, held: float | None) -> None:
+        self._forget(user)
+        if held is not None:
+            self.avg_hold = held if self.avg_hold is None else 0.8 * self.avg_hold + 0.2 * held
+        # Hand the slot straight to the next live waiter, keeping it counted as active
+        while self.waiters:
+            _, waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def metrics(self) -> dict[str, Any]:
+        waits = sorted(self.waits)
+        return {
+            "concurrency": self.limits.concurrency,
+            "active": self.active,
+            "queued": len(self.waiters),
+            "max_queue": self.limits.max_queue,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "wait_p50_seconds": round(waits[len(waits) // 2], 3) if waits else 0.0,
+            "wait_p95_seconds": round(waits[int(len(waits) * 0.95)], 3) if waits else 0.0,
+            "avg_turn_seconds": round(self.avg_hold, 2) if self.avg_hold is not None else None,
+        }
+
+
+class AdmissionController:
+    """Per-intent concurrency pools with per-user caps and deadline-aware queueing.
+
+    Features:
+    - Separate slot pool and FIFO queue per query intent
+    - Per-user cap on running and queued turns in each pool
+    - Immediate rejection when the estimated wait exceeds the pool deadline
+    - Queue depth, wait time and rejection metrics for the /metrics/admission endpoint
+    """
+
+    def __init__(self, pools: dict[str, PoolLimits]):
+        """Initialize the controller.
+
+        Args:
+            pools: Limits per pool name, usually a QueryIntent value
+        """
+        self._pools = {name: _Pool(name, limits) for name, limits in pools.items()}
+
+    async def acquire(self, pool: str, user: str | None) -> AdmissionSlot:
+        """Wait for a slot in ``pool``.
+
+        Args:
+            pool: Pool to admit the turn to
+            user: Key identifying the user for per-user caps, or None to apply only the pool limits
+
+        Returns:
+            The slot; release it when the turn ends
+
+        Raises:
+            AdmissionRejected: If the turn can't be admitted within the pool's limits
+        """
+        return await self._pools[pool].acquire(user)
+
+    def metrics(self) -> dict[str, Any]:
+        """Slot usage, queue depth, wait times and rejections per pool."""
+        return {name: pool.metrics() for name, pool in self._pools.items()}
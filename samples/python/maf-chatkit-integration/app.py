@@ -9,22 +9,40 @@ parking sign analysis, and o3 reasoning model for expense analysis.
 
 import asyncio
 import base64
+import csv
+import functools
+import io
 import json
 import logging
 import os
+import re
+import time
 from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+from dataclasses import asdict
 from datetime import datetime
 from typing import Annotated, Any
 
 import httpx
+import openai
 import uvicorn
 
 # Agent Framework imports
-from agent_framework import AgentRunResponseUpdate, ChatAgent, ChatMessage, FunctionCallContent, FunctionResultContent, Role, TextContent
+from agent_framework import (
+    AgentRunResponseUpdate,
+    AIFunction,
+    ChatAgent,
+    ChatMessage,
+    FunctionCallContent,
+    FunctionResultContent,
+    Role,
+    TextContent,
+    UsageContent,
+)
 from agent_framework.azure import AzureOpenAIChatClient
 
 # Agent Framework ChatKit integration
-from agent_framework_chatkit import ThreadItemConverter, stream_agent_response
+from agent_framework_chatkit import stream_agent_response
 
 # ChatKit imports
 from chatkit.actions import Action
@@ -40,12 +58,14 @@ from chatkit.types import (
     ThreadItem,
     ThreadItemAddedEvent,
     ThreadItemDoneEvent,
+    ThreadItemReplacedEvent,
     ThreadItemUpdatedEvent,
     ThreadStreamEvent,
     ThreadMetadata,
     ThoughtTask,
     UserMessageItem,
     WidgetItem,
+    WidgetRootUpdated,
     Workflow,
     WorkflowItem,
     WorkflowTaskAdded,
@@ -55,21 +75,31 @@ from chatkit.widgets import WidgetRoot
 from openai import OpenAI
 from fastapi import FastAPI, Request, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
 from pydantic import Field
 
+from admission import AdmissionController, AdmissionRejected, AdmissionSlot, PoolLimits
+from attachment_cache import EncodedAttachmentCache
+from attachment_gc import AttachmentGarbageCollector
 from attachment_store import FileBasedAttachmentStore
+from aviationstack import decode_flights
+from blob_backend import S3BlobBackend
+from command_router import WidgetCommand, match_widget_command
+from flight_tracker import FlightKey, FlightTracker
 from flight_widget import (
-    AirportInfo,
     FlightStatusData,
-    LiveFlightData,
     airport_selector_copy_text,
+    flight_list_copy_text,
     flight_widget_copy_text,
     render_airport_selector_widget,
     render_error_widget,
+    render_flight_list_widget,
     render_flight_widget,
     render_route_selector_widget,
 )
+from history_compaction import HistoryCompactor, HistoryConverter
+from image_preprocess import VisionImagePreprocessor
+from parking_rules import ParkingSchedule, normalise_restrictions, parse_time_query, reevaluate_analysis
 from parking_widget import (
     ParkingAnalysisData,
     ParkingRestriction,
@@ -78,7 +108,17 @@ from parking_widget import (
     render_parking_upload_prompt,
     render_parking_widget,
 )
+from prompt_cache import PromptCacheStats
+from quota import Priority, QuotaExceededError, QuotaManager
+from resilience import CircuitBreaker, CircuitOpenError, Upstream, UpstreamStatusError, raise_for_retryable_status
+from resumable_stream import ResumableStreams
+from single_flight import ThreadLocks, turn_fingerprint
 from store import SQLiteStore
+from stream_guard import StreamGuard
+from streaming_json import IncrementalJSONParser
+from token_budget import ContextBudget, TokenCounter
+from tool_executor import ToolExecutor, ToolLimits
+from upload_pipeline import THUMBNAIL_SUFFIX, VISION_SUFFIX, UploadPipeline
 
 # ============================================================================
 # Logging Setup
@@ -99,6 +139,151 @@ SERVER_PORT = 8001
 DB_PATH = "data/chatkit_demo.db"
 UPLOADS_DIR = "data/uploads"
 
+# Flight lookups - shared cap on concurrent AviationStack requests
+FLIGHT_LOOKUP_CONCURRENCY = 4
+MAX_BATCH_FLIGHTS = 10
+
+# AviationStack quota - match these to your subscription plan
+AVIATIONSTACK_PER_MINUTE = 30
+AVIATIONSTACK_PER_MONTH = 10000
+
+# Hedged AviationStack requests spend extra quota, so they are off by default.
+# Set to a number of seconds to race a second GET when the first is slow.
+AVIATIONSTACK_HEDGE_AFTER: float | None = None
+
+# Encoded attachment payloads kept in memory across turns
+ATTACHMENT_CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+# Seconds respond waits for a just-uploaded image to finish post-upload processing
+UPLOAD_PROCESSING_WAIT = 2.0
+
+# Parking signs - images analysed per message, and a shared cap on concurrent vision calls
+MAX_PARKING_IMAGES = 6
+VISION_CALL_CONCURRENCY = 3
+
+# Upload retention - least recently used files are evicted above the disk budget,
+# and attachments never sent in a message are deleted after the grace period
+UPLOADS_MAX_BYTES = 5 * 1024 * 1024 * 1024
+ORPHAN_ATTACHMENT_GRACE = 24 * 3600
+
+# Optional S3-compatible storage (AWS S3, MinIO, ...) for uploads; local disk when unset.
+# Direct uploads hand clients a presigned PUT URL, so only enable them for clients that
+# PUT the raw bytes - the /upload endpoint also accepts multipart forms.
+UPLOADS_S3_BUCKET = os.environ.get("UPLOADS_S3_BUCKET")
+UPLOADS_S3_ENDPOINT_URL = os.environ.get("UPLOADS_S3_ENDPOINT_URL")
+UPLOADS_S3_DIRECT = os.environ.get("UPLOADS_S3_DIRECT", "").lower() in ("1", "true", "yes")
+
+# SSE streams - events buffered per client, and how long a client may stop reading
+# before its turn is cancelled
+STREAM_BUFFER_EVENTS = 64
+STREAM_STALL_TIMEOUT = 30.0
+STREAM_DISCONNECT_POLL = 1.0
+
+# Resumable turns - events kept per turn for Last-Event-ID replay, how far a turn may run
+# ahead of its client, and how long a turn without a client waits for a reconnect
+STREAM_REPLAY_EVENTS = 1024
+STREAM_MAX_UNSENT_EVENTS = 512
+STREAM_RESUME_GRACE = 15.0
+STREAM_RETENTION = 60.0
+
+# o3 stream events buffered between the SDK thread and the response
+REASONING_EVENT_BUFFER = 256
+
+# Admission control per query intent:
+# (concurrent turns, turns per user, queued turns, seconds a turn may wait for a slot)
+ADMISSION_POOLS = {
+    "flight": (16, 4, 32, 5.0),
+    "parking": (4, 2, 8, 10.0),
+    "expense": (2, 1, 4, 15.0),
+    "general": (16, 4, 32, 5.0),
+}
+
+# Per-browser id the frontend sends when there is no signed-in user, keying the per-user caps above
+CLIENT_ID_HEADER = "x-client-id"
+CLIENT_ID_PATTERN = re.compile(r"[A-Za-z0-9-]{16,64}")
+
+# Agent tool calls: (calls running at once across all turns, seconds per call including the wait)
+TOOL_LIMITS = {
+    "get_flight_status": (8, 20.0),
+    "get_flight_statuses": (4, 30.0),
+    "analyse_expense_report": (1, 120.0),
+}
+TOOL_DEFAULT_LIMITS = (8, 10.0)
+
+# Prompt token budgets per query intent, counted locally with this tiktoken encoding
+# (or an offline approximation of it); older images and then the oldest messages are
+# dropped from agent input over budget, and expense prompts are sent in compact form
+TOKEN_ENCODING = "o200k_base"
+CONTEXT_BUDGETS = {
+    "flight": 24000,
+    "parking": 32000,
+    "expense": 16000,
+    "general": 16000,
+}
+CONTEXT_BUDGET_DEFAULT = 16000
+
+# Thread history - turns always sent verbatim, unsummarised tokens outside them that trigger
+# a background summary update, transcript tokens per summary call, and newest items loaded per turn
+HISTORY_KEEP_TURNS = 6
+HISTORY_SUMMARISE_AFTER_TOKENS = 4000
+HISTORY_SUMMARY_CHUNK_TOKENS = 12000
+HISTORY_WINDOW_ITEMS = 400
+
+
+# =============================================================================
+# Upstream Resilience
+# =============================================================================
+
+# OpenAI SDK errors worth retrying (APITimeoutError is an APIConnectionError)
+OPENAI_RETRYABLE_ERRORS = (openai.APIConnectionError, openai.InternalServerError)
+
+# Classification, vision and history summaries share the gpt-5.1 deployment, so they share a breaker
+gpt_breaker = CircuitBreaker("Azure OpenAI gpt-5.1")
+
+aviationstack_upstream = Upstream(
+    "AviationStack",
+    attempt_timeout=10.0,
+    deadline=20.0,
+    hedge_after=AVIATIONSTACK_HEDGE_AFTER,
+)
+vision_upstream = Upstream(
+    "Azure OpenAI vision",
+    attempt_timeout=45.0,
+    deadline=60.0,
+    max_attempts=2,
+    breaker=gpt_breaker,
+)
+classifier_upstream = Upstream(
+    "Azure OpenAI classifier",
+    attempt_timeout=10.0,
+    deadline=15.0,
+    max_attempts=2,
+    retry_on=OPENAI_RETRYABLE_ERRORS,
+    breaker=gpt_breaker,
+)
+summary_upstream = Upstream(
+    "Azure OpenAI summaries",
+    attempt_timeout=60.0,
+    deadline=90.0,
+    max_attempts=2,
+    retry_on=OPENAI_RETRYABLE_ERRORS,
+    breaker=gpt_breaker,
+)
+reasoning_upstream = Upstream(
+    "Azure OpenAI o3",
+    attempt_timeout=120.0,
+    deadline=180.0,
+    max_attempts=2,
+    retry_on=OPENAI_RETRYABLE_ERRORS,
+)
+
+# Cached vs uncached prompt tokens and time to first token of every model call
+prompt_cache_stats = PromptCacheStats()
+
+# Local prompt token counts and per-intent context budgets
+token_counter = TokenCounter(TOKEN_ENCODING)
+context_budget = ContextBudget(token_counter, CONTEXT_BUDGETS, CONTEXT_BUDGET_DEFAULT)
+
 
 # =============================================================================
 # Response wrapper classes for widget detection
@@ -114,6 +299,19 @@ class FlightResponse(str):
         return instance
 
 
+class FlightListResponse(str):
+    """String subclass carrying several flights for the multi-flight widget."""
+
+    flights: list[FlightStatusData]
+    errors: list[str]
+
+    def __new__(cls, text: str, flights: list[FlightStatusData], errors: list[str]) -> "FlightListResponse":
+        instance = super().__new__(cls, text)
+        instance.flights = flights
+        instance.errors = errors
+        return instance
+
+
 class ShowAirportSelector(str):
     """Marker string for airport selector widget."""
     pass
@@ -213,6 +411,106 @@ async def stream_widget(
     yield ThreadItemDoneEvent(type="thread.item.done", item=widget_item)
 
 
+async def _merge_streams(streams: list[AsyncIterator[ThreadStreamEvent]]) -> AsyncIterator[ThreadStreamEvent]:
+    """Run several event streams concurrently, yielding events as they arrive.
+
+    An exception in any stream is re-raised here and cancels the others. The queue is
+    bounded, so a client that stops reading pauses the streams instead of buffering them.
+    """
+    if len(streams) == 1:
+        async for event in streams[0]:
+            yield event
+        return
+
+    # Fan the streams into one queue; None marks a finished stream, an exception a failed one
+    queue: asyncio.Queue[ThreadStreamEvent | Exception | None] = asyncio.Queue(maxsize=STREAM_BUFFER_EVENTS)
+
+    async def pump(stream: AsyncIterator[ThreadStreamEvent]) -> None:
+        try:
+            async for event in stream:
+                await queue.put(event)
+        except Exception as e:
+            await queue.put(e)
+        else:
+            await queue.put(None)
+
+    tasks = [asyncio.create_task(pump(stream)) for stream in streams]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            item = await queue.get()
+            if item is None:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def render_busy_widget(rejection: AdmissionRejected) -> WidgetRoot:
+    """Render the fast "busy" answer for a turn that admission control turned away."""
+    message = rejection.message
+    if rejection.retry_after:
+        message += f" Please try again in about {max(5, round(rejection.retry_after / 5) * 5)} seconds."
+    return render_error_widget("Busy Right Now", message)
+
+
+# Widgets rendered without the agent: (renderer, copy text or None)
+WIDGET_COMMANDS: dict[str, tuple[Callable[[], WidgetRoot], Callable[[], str] | None]] = {
+    WidgetCommand.AIRPORT_SELECTOR: (render_airport_selector_widget, airport_selector_copy_text),
+    WidgetCommand.ROUTE_SELECTOR: (render_route_selector_widget, None),
+    WidgetCommand.PARKING_PROMPT: (render_parking_upload_prompt, None),
+}
+
+# Marker strings returned by the widget tools
+_MARKER_COMMANDS: dict[type, str] = {
+    ShowAirportSelector: WidgetCommand.AIRPORT_SELECTOR,
+    ShowRouteSelector: WidgetCommand.ROUTE_SELECTOR,
+    ShowParkingPrompt: WidgetCommand.PARKING_PROMPT,
+}
+
+
+def _tool_result_widget(result: Any) -> tuple[WidgetRoot, str | None] | None:
+    """Render the widget, and its copy text, for an agent tool result that has one."""
+    if isinstance(result, FlightResponse):
+        logger.info(f"Creating flight widget for: {result.data.flight_iata}")
+        return render_flight_widget(result.data), flight_widget_copy_text(result.data)
+    if isinstance(result, FlightListResponse):
+        logger.info(f"Creating multi-flight widget for {len(result.flights)} flight(s)")
+        return (
+            render_flight_list_widget(result.flights, result.errors),
+            flight_list_copy_text(result.flights, result.errors),
+        )
+    command = _MARKER_COMMANDS.get(type(result))
+    if command is not None:
+        logger.info(f"Creating {command} widget")
+        render, copy_text_for = WIDGET_COMMANDS[command]
+        return render(), copy_text_for() if copy_text_for else None
+    return None
+
+
+def _admission_user(context: dict[str, Any]) -> str | None:
+    """Key for per-user admission caps.
+
+    The authenticated user if an auth layer sets ``context["user_id"]``, otherwise
+    the random id the frontend keeps per browser and sends as X-Client-Id. That id
+    is a fairness key, not an identity - a client that drops or rotates it escapes
+    its per-user cap, but is still bounded by the pool's concurrency and queue.
+
+    The client address is no substitute: behind the Vite proxy every request comes
+    from 127.0.0.1, which would make each per-user cap a site-wide one.
+    """
+    user_id = context.get("user_id")
+    if user_id:
+        return str(user_id)
+    request: Request | None = context.get("request")
+    client_id = request.headers.get(CLIENT_ID_HEADER, "") if request is not None else ""
+    return f"client:{client_id}" if CLIENT_ID_PATTERN.fullmatch(client_id) else None
+
+
 # =============================================================================
 # AviationStack API Integration
 # =============================================================================
@@ -229,13 +527,30 @@ MULTI_LEG_FLIGHTS: dict[str, str] = {
     "BA16": "SYD",  # Sydney → Singapore → London
 }
 
+# Shared by every caller so batch lookups can't flood the API
+_flight_lookup_semaphore = asyncio.Semaphore(FLIGHT_LOOKUP_CONCURRENCY)
 
-async def fetch_flight_status(
+# Central quota for every AviationStack request
+aviationstack_quota = QuotaManager(
+    "AviationStack",
+    per_minute=AVIATIONSTACK_PER_MINUTE,
+    per_month=AVIATIONSTACK_PER_MONTH,
+)
+
+
+async def fetch_flight_legs(
     flight_iata: str | None = None,
     dep_iata: str | None = None,
     arr_iata: str | None = None,
-) -> FlightStatusData | str:
-    """Fetch flight status from AviationStack API."""
+    limit: int | None = None,
+    priority: Priority = Priority.INTERACTIVE,
+) -> list[FlightStatusData] | str:
+    """Fetch matching flights from AviationStack API.
+
+    Returns every leg of the response unless ``limit`` is set, in which case
+    only the first ``limit`` records are decoded. Requests wait for the shared
+    AviationStack quota, and background requests are shed first when it runs low.
+    """
     api_key = os.environ.get("AVIATIONSTACK_KEY")
     if not api_key:
         return "AVIATIONSTACK_KEY environment variable is not configured. Please set it to use flight tracking."
@@ -268,11 +583,37 @@ async def fetch_flight_status(
     logger.info(f"AviationStack API params: {params}")  # Log the actual params sent
 
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                "http://api.aviationstack.com/v1/flights",
-                params=params,
-            )
+        await aviationstack_quota.acquire(priority)
+    except QuotaExceededError as e:
+        retry_hint = f" Please try again in {int(e.retry_after) + 1}s." if e.retry_after else ""
+        return f"Flight lookups are temporarily limited: {e}{retry_hint}"
+
+    try:
+        async with _flight_lookup_semaphore, httpx.AsyncClient(timeout=30.0) as client:
+            requests_sent = 0
+
+            async def get_flights() -> httpx.Response:
+                # Every request is billed, so retries and hedges take a quota token of their own.
+                # They don't queue for one - the wait would count against the attempt timeout
+                nonlocal requests_sent
+                requests_sent += 1
+                if requests_sent > 1:
+                    await aviationstack_quota.acquire(priority, max_wait=0)
+                response = await client.get(
+                    "http://api.aviationstack.com/v1/flights",
+                    params=params,
+                )
+                return raise_for_retryable_status(response)
+
+            # GETs are idempotent, so they may be hedged
+            response = await aviationstack_upstream.call(get_flights, idempotent=True)
+
+            if response.status_code == 429:
+                retry_after = response.headers.get("retry-after")
+                aviationstack_quota.report_throttled(
+                    float(retry_after) if retry_after and retry_after.isdigit() else None
+                )
+                return "AviationStack rate limit reached. Please try again in a minute."
 
             if response.status_code != 200:
                 return f"AviationStack API error: {response.status_code}"
@@ -283,207 +624,278 @@ async def fetch_flight_status(
                 error_info = data["error"]
                 return f"AviationStack error: {error_info.get('message', 'Unknown error')}"
 
-            flights = data.get("data", [])
+            # Only decode the records we need - route searches can return hundreds
+            flights = decode_flights(data, limit=limit)
             if not flights:
                 if flight_iata:
                     return f"No flight found with code {flight_iata.upper()}. Please verify the flight number."
                 return "No flights found for the specified route."
 
-            flight = flights[0]
-
-            # Parse departure info
-            dep = flight.get("departure", {})
-            departure = AirportInfo(
-                airport=dep.get("airport", ""),
-                iata=dep.get("iata", ""),
-                icao=dep.get("icao", ""),
-                terminal=dep.get("terminal"),
-                gate=dep.get("gate"),
-                delay=dep.get("delay"),
-                scheduled=dep.get("scheduled"),
-                estimated=dep.get("estimated"),
-                actual=dep.get("actual"),
-                timezone=dep.get("timezone"),
-            )
+            return flights
 
-            # Parse arrival info
-            arr = flight.get("arrival", {})
-            arrival = AirportInfo(
-                airport=arr.get("airport", ""),
-                iata=arr.get("iata", ""),
-                icao=arr.get("icao", ""),
-                terminal=arr.get("terminal"),
-                gate=arr.get("gate"),
-                baggage=arr.get("baggage"),
-                delay=arr.get("delay"),
-                scheduled=arr.get("scheduled"),
-                estimated=arr.get("estimated"),
-                actual=arr.get("actual"),
-                timezone=arr.get("timezone"),
-            )
+    except CircuitOpenError as e:
+        return f"Flight tracking is degraded: {e}"
+    except QuotaExceededError as e:
+        return f"Flight lookups are temporarily limited: {e}"
+    except UpstreamStatusError as e:
+        return f"AviationStack API error: {e.response.status_code}"
+    except (httpx.TimeoutException, asyncio.TimeoutError):
+        return "Flight API request timed out. Please try again."
+    except Exception as e:
+        return f"Error fetching flight data: {str(e)}"
 
-            # Parse live data if available
-            live_data = None
-            live = flight.get("live")
-            if live:
-                live_data = LiveFlightData(
-                    updated=live.get("updated"),
-                    latitude=live.get("latitude"),
-                    longitude=live.get("longitude"),
-                    altitude=live.get("altitude"),
-                    direction=live.get("direction"),
-                    speed_horizontal=live.get("speed_horizontal"),
-                    speed_vertical=live.get("speed_vertical"),
-                    is_ground=live.get("is_ground", False),
-                )
 
-            flight_info = flight.get("flight", {})
-            airline = flight.get("airline", {})
+async def fetch_flight_status(
+    flight_iata: str | None = None,
+    dep_iata: str | None = None,
+    arr_iata: str | None = None,
+    priority: Priority = Priority.INTERACTIVE,
+) -> FlightStatusData | str:
+    """Fetch flight status from AviationStack API."""
+    result = await fetch_flight_legs(flight_iata, dep_iata, arr_iata, limit=1, priority=priority)
+    if isinstance(result, str):
+        return result
+    return result[0]
+
 
-            # Determine actual flight status - if we have live data with altitude > 0, it's in flight
-            raw_status = flight.get("flight_status", "scheduled")
-            if live_data and live_data.altitude and live_data.altitude > 0 and not live_data.is_ground:
-                actual_status = "active"  # In flight
-            elif live_data and live_data.is_ground and departure.actual:
-                actual_status = "landed" if arrival.actual else "active"  # Taxiing or landed
-            else:
-                actual_status = raw_status
-
-            return FlightStatusData(
-                flight_date=flight.get("flight_date", ""),
-                flight_status=actual_status,
-                flight_iata=flight_info.get("iata", ""),
-                flight_number=flight_info.get("number", ""),
-                airline_name=airline.get("name", ""),
-                airline_iata=airline.get("iata", ""),
-                departure=departure,
-                arrival=arrival,
-                live=live_data,
-            )
+def parse_flight_query(query: str) -> tuple[str | None, str | None, str | None]:
+    """Parse a batch lookup entry into (flight_iata, dep_iata, arr_iata).
 
-    except httpx.TimeoutException:
-        return "Flight API request timed out. Please try again."
-    except Exception as e:
-        return f"Error fetching flight data: {str(e)}"
+    Accepts a flight code ("QF1"), a flight code with departure ("QF1 SYD")
+    or a route ("SYD-MEL").
+    """
+    text = query.strip().upper()
+    if "-" in text:
+        dep, _, arr = text.partition("-")
+        return None, dep.strip() or None, arr.strip() or None
+    parts = text.split()
+    if len(parts) >= 2:
+        return parts[0], parts[-1], None
+    return text or None, None, None
+
+
+async def fetch_flight_statuses(queries: list[str]) -> list[FlightStatusData | str]:
+    """Fetch the status of several flights concurrently.
+
+    Lookups run in parallel, bounded by the shared AviationStack semaphore.
+    Results are returned in the same order as ``queries``.
+    """
+    lookups = [fetch_flight_status(*parse_flight_query(query)) for query in queries]
+    return list(await asyncio.gather(*lookups))
+
+
+async def _poll_flight(key: FlightKey) -> FlightStatusData | str:
+    """Background refresh for live tracking - yields quota to interactive lookups."""
+    return await fetch_flight_status(*key, priority=Priority.BACKGROUND)
+
+
+# One shared poller per tracked flight, across all users and threads
+flight_tracker = FlightTracker(_poll_flight)
 
 
 # =============================================================================
 # Parking Sign Analysis (GPT-4o Vision)
 # =============================================================================
 
+# Downscales and re-encodes uploads before they are sent to the vision model
+vision_preprocessor = VisionImagePreprocessor()
 
-async def analyse_parking_sign(
-    image_data: bytes,
-    image_content_type: str,
-    current_time: str | None = None,
-) -> ParkingAnalysisData | str:
-    """Analyse a parking sign image using GPT-5.1 vision."""
-    # Use the same credentials as the rest of the app
-    endpoint = os.environ.get("AOI_ENDPOINT_SWDN")
-    api_key = os.environ.get("AOI_KEY_SWDN")
-    deployment = "gpt-5.1"  # Hardcoded for vision tasks
-
-    if not endpoint or not api_key:
-        return "Azure OpenAI is not configured. Please set AOI_ENDPOINT_SWDN and AOI_KEY_SWDN."
+# Shared by every request so multi-image messages can't flood the vision deployment
+_vision_call_semaphore = asyncio.Semaphore(VISION_CALL_CONCURRENCY)
 
-    try:
-        api_version = os.environ.get("AZURE_OPENAI_API_VERSION", "2024-06-01")
+# Thread metadata key holding the latest analysed signs and their normalised schedules.
+# Only set while the last turn was a parking answer, so time questions about anything else reach the agent
+PARKING_SIGNS_KEY = "parking_signs"
 
-        image_base64 = base64.b64encode(image_data).decode("utf-8")
-        image_url = f"data:{image_content_type};base64,{image_base64}"
 
-        time_context = f"\nCurrent time context: {current_time}" if current_time else ""
-        prompt = f"""Analyse this parking sign image and determine if parking is allowed.
+# Vision instructions, sent first and unchanged on every call so they form a cacheable prefix
+PARKING_ANALYSIS_INSTRUCTIONS = """Analyse the parking sign image and determine if parking is allowed.
 
 Provide your analysis in the following JSON format:
-{{
+{
     "can_park": true/false,
     "verdict": "Short one-sentence verdict",
     "confidence": "high/medium/low",
     "restrictions": [
-        {{
+        {
             "type": "Type of restriction",
             "hours": "Operating hours if applicable",
             "days": "Days if applicable",
             "duration": "Time limit if applicable",
             "notes": "Any additional notes"
-        }}
+        }
     ],
     "time_limit": "Maximum parking duration if any",
     "detailed_analysis": "Detailed explanation of what the sign says",
     "advice": "Practical advice for the driver",
     "sign_description": "Description of signs visible in the image"
-}}{time_context}
+}
 
 Be thorough but practical. Focus on giving a clear yes/no answer."""
 
+
+async def analyse_parking_sign_streaming(
+    image_data: bytes,
+    image_content_type: str,
+    current_time: str | None = None,
+    vision_ready: bool = False,
+) -> AsyncIterator[tuple[str, Any]]:
+    """Async generator that streams a parking sign analysis using GPT-5.1 vision.
+
+    Pass ``vision_ready=True`` for images already prepared by the upload pipeline.
+
+    Yields tuples of (event_type, data) where:
+    - ("partial", dict) - Early fields (can_park, verdict) as soon as they are readable
+    - ("complete", ParkingAnalysisData) - Final result
+    - ("error", str) - Error message
+    """
+    # Use the same credentials as the rest of the app
+    endpoint = os.environ.get("AOI_ENDPOINT_SWDN")
+    api_key = os.environ.get("AOI_KEY_SWDN")
+    deployment = "gpt-5.1"  # Hardcoded for vision tasks
+
+    if not endpoint or not api_key:
+        yield ("error", "Azure OpenAI is not configured. Please set AOI_ENDPOINT_SWDN and AOI_KEY_SWDN.")
+        return
+
+    try:
+        api_version = os.environ.get("AZURE_OPENAI_API_VERSION", "2024-06-01")
+
+        if not vision_ready:
+            image_data, image_content_type = await vision_preprocessor.prepare(image_data, image_content_type)
+        image_base64 = base64.b64encode(image_data).decode("utf-8")
+        image_url = f"data:{image_content_type};base64,{image_base64}"
+
+        # The current time varies per call, so it follows the static instructions
+        user_content: list[dict[str, Any]] = []
+        if current_time:
+            user_content.append({"type": "text", "text": f"Current time context: {current_time}"})
+        user_content.append({"type": "image_url", "image_url": {"url": image_url, "detail": "high"}})
+
         # Ensure endpoint doesn't have trailing slash
         endpoint = endpoint.rstrip("/")
         
         async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                f"{endpoint}/openai/deployments/{deployment}/chat/completions?api-version={api_version}",
-                headers={
-                    "api-key": api_key,
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": prompt},
-                                {"type": "image_url", "image_url": {"url": image_url, "detail": "high"}},
-                            ],
-                        }
-                    ],
-                    "max_completion_tokens": 1500,
-                    "temperature": 0.1,
-                },
-            )
 
-            if response.status_code != 200:
-                return f"Azure OpenAI API error: {response.status_code} - {response.text}"
-
-            result = response.json()
-            content = result["choices"][0]["message"]["content"]
-
-            # Extract JSON from possible markdown
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0]
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0]
-
-            analysis = json.loads(content.strip())
-
-            restrictions = []
-            for r in analysis.get("restrictions", []):
-                restrictions.append(
-                    ParkingRestriction(
-                        type=r.get("type", ""),
-                        hours=r.get("hours"),
-                        days=r.get("days"),
-                        duration=r.get("duration"),
-                        notes=r.get("notes"),
-                    )
+            async def open_completion_stream() -> httpx.Response:
+                request = client.build_request(
+                    "POST",
+                    f"{endpoint}/openai/deployments/{deployment}/chat/completions?api-version={api_version}",
+                    headers={
+                        "api-key": api_key,
+                        "Content-Type": "application/json",
+                    },
+                    json={
+                        "messages": [
+                            {"role": "system", "content": PARKING_ANALYSIS_INSTRUCTIONS},
+                            {"role": "user", "content": user_content},
+                        ],
+                        "max_completion_tokens": 1500,
+                        "temperature": 0.1,
+                        "stream": True,
+                        "stream_options": {"include_usage": True},
+                    },
                 )
+                response = await client.send(request, stream=True)
+                if response.status_code != 200:
+                    await response.aread()  # Load the error body, this also closes the stream
+                return raise_for_retryable_status(response)
 
-            return ParkingAnalysisData(
-                can_park=analysis.get("can_park", False),
-                verdict=analysis.get("verdict", ""),
-                confidence=analysis.get("confidence", "medium"),
-                restrictions=restrictions,
-                time_limit=analysis.get("time_limit"),
-                detailed_analysis=analysis.get("detailed_analysis", ""),
-                advice=analysis.get("advice", ""),
-                current_time_context=current_time,
-                sign_description=analysis.get("sign_description", ""),
-            )
+            # Only opening the stream is retried - a stream that fails mid-way is reported
+            started = time.monotonic()
+            response = await vision_upstream.call(open_completion_stream)
+
+            if response.status_code != 200:
+                yield ("error", f"Azure OpenAI API error: {response.status_code} - {response.text}")
+                return
+
+            parser = IncrementalJSONParser()
+            first_token: float | None = None
+            try:
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: ") or line == "data: [DONE]":
+                        continue
+                    chunk = json.loads(line[len("data: "):])
+                    if chunk.get("usage"):
+                        prompt_cache_stats.record_usage("vision", chunk["usage"], first_token)
+                    choices = chunk.get("choices") or []
+                    if not choices:
+                        continue
+                    delta = (choices[0].get("delta") or {}).get("content")
+                    if not delta:
+                        continue
+                    if first_token is None:
+                        first_token = time.monotonic() - started
+
+                    # The parser skips any markdown fence and reports fields as they close
+                    new_fields = parser.feed(delta)
+                    if new_fields.keys() & _EARLY_PARKING_FIELDS:
+                        yield ("partial", {k: v for k, v in parser.fields.items() if k in _EARLY_PARKING_FIELDS})
+            finally:
+                await response.aclose()
+
+            analysis = parser.result()
+            yield ("complete", _parking_analysis_from_json(analysis, current_time))
 
     except json.JSONDecodeError as e:
-        return f"Failed to parse AI response: {str(e)}"
+        yield ("error", f"Failed to parse AI response: {str(e)}")
+    except CircuitOpenError as e:
+        yield ("error", f"Parking sign analysis is degraded: {e}")
+    except UpstreamStatusError as e:
+        yield ("error", f"Azure OpenAI API error: {e.response.status_code} - {e.response.text}")
+    except (httpx.TimeoutException, asyncio.TimeoutError):
+        yield ("error", "Parking sign analysis timed out. Please try again.")
     except Exception as e:
-        return f"Error analysing parking sign: {str(e)}"
+        yield ("error", f"Error analysing parking sign: {str(e)}")
+
+
+# Fields shown in the analysing widget before the full answer has arrived
+_EARLY_PARKING_FIELDS = frozenset({"can_park", "verdict"})
+
+
+def _parking_analysis_from_json(analysis: dict[str, Any], current_time: str | None) -> ParkingAnalysisData:
+    """Build ParkingAnalysisData from the model's JSON answer."""
+    restrictions = []
+    for r in analysis.get("restrictions", []):
+        restrictions.append(
+            ParkingRestriction(
+                type=r.get("type", ""),
+                hours=r.get("hours"),
+                days=r.get("days"),
+                duration=r.get("duration"),
+                notes=r.get("notes"),
+            )
+        )
+
+    return ParkingAnalysisData(
+        can_park=analysis.get("can_park", False),
+        verdict=analysis.get("verdict", ""),
+        confidence=analysis.get("confidence", "medium"),
+        restrictions=restrictions,
+        time_limit=analysis.get("time_limit"),
+        detailed_analysis=analysis.get("detailed_analysis", ""),
+        advice=analysis.get("advice", ""),
+        current_time_context=current_time,
+        sign_description=analysis.get("sign_description", ""),
+    )
+
+
+def _parking_analysis_from_dict(data: dict[str, Any]) -> ParkingAnalysisData:
+    """Rebuild ParkingAnalysisData saved in thread metadata with dataclasses.asdict."""
+    restrictions = [ParkingRestriction(**r) for r in data.get("restrictions", [])]
+    return ParkingAnalysisData(**{**data, "restrictions": restrictions})
+
+
+async def analyse_parking_sign(
+    image_data: bytes,
+    image_content_type: str,
+    current_time: str | None = None,
+) -> ParkingAnalysisData | str:
+    """Analyse a parking sign image using GPT-5.1 vision."""
+    async for event_type, data in analyse_parking_sign_streaming(image_data, image_content_type, current_time):
+        if event_type in ("complete", "error") and isinstance(data, (ParkingAnalysisData, str)):
+            return data
+    return "No analysis generated."
 
 
 # =============================================================================
@@ -505,6 +917,7 @@ def get_reasoning_client() -> OpenAI | None:
                 api_key=api_key,
                 base_url=f"{endpoint.rstrip('/')}/openai/v1/",
                 default_headers={"api-key": api_key},
+                max_retries=0,  # Retries are handled by the Upstream policies
             )
     return _reasoning_client
 
@@ -541,7 +954,8 @@ async def classify_intent(user_message: str, has_image: bool = False) -> str:
         return _keyword_intent_fallback(user_message)
     
     try:
-        response = client.responses.create(
+        classify_call = functools.partial(
+            client.with_options(timeout=classifier_upstream.attempt_timeout).responses.create,
             model="gpt-5.1",  # Fast model for classification
             input=[
                 {
@@ -562,6 +976,9 @@ Respond with ONLY the category name, nothing else."""
             ],
             max_output_tokens=20,  # Minimum is 16, use 20 for safety
         )
+        started = time.monotonic()
+        response = await classifier_upstream.call(lambda: asyncio.to_thread(classify_call))
+        prompt_cache_stats.record_usage("classifier", response.usage, time.monotonic() - started)
         
         intent = response.output_text.strip().lower()
         logger.info(f"Intent classified as: {intent}")
@@ -599,6 +1016,94 @@ def _keyword_intent_fallback(user_message: str) -> str:
         return QueryIntent.GENERAL
 
 
+HISTORY_SUMMARY_INSTRUCTIONS = """You maintain a running summary of a conversation between a traveller and SwiftRover, \
+an AI travel assistant. You are given the summary so far and the next part of the conversation.
+
+Return an updated summary that keeps everything the assistant may need later: flights, routes and \
+airports discussed with their latest known status, parking verdicts, expense findings, the user's \
+plans and preferences, and open questions. Drop greetings and repetition. Write at most 300 words \
+of plain prose."""
+
+
+async def summarise_history(summary: str, transcript: str) -> str:
+    """Fold the next part of a conversation into its rolling summary with gpt-5.1.
+
+    Args:
+        summary: The summary so far, empty for the first part
+        transcript: Condensed transcript of the next part
+
+    Returns:
+        The updated summary
+    """
+    client = get_reasoning_client()
+    if not client:
+        raise RuntimeError("No OpenAI client configured for history summaries")
+
+    summarise_call = functools.partial(
+        client.with_options(timeout=summary_upstream.attempt_timeout).responses.create,
+        model="gpt-5.1",
+        input=[
+            {"role": "developer", "content": HISTORY_SUMMARY_INSTRUCTIONS},
+            {
+                "role": "user",
+                "content": f"SUMMARY SO FAR:\n{summary or '(none)'}\n\nNEXT PART OF THE CONVERSATION:\n{transcript}",
+            },
+        ],
+        max_output_tokens=1000,
+    )
+    started = time.monotonic()
+    response = await summary_upstream.call(lambda: asyncio.to_thread(summarise_call))
+    prompt_cache_stats.record_usage("summary", response.usage, time.monotonic() - started)
+    return response.output_text.strip()
+
+
+# Static instructions go first and are byte-identical on every call, so the provider can
+# serve them from its prompt cache; each period's report follows
+EXPENSE_ANALYSIS_INSTRUCTIONS = """You analyse department expense reports against company policy and budget.
+
+Please provide a thorough analysis including:
+1. Total spending vs budget
+2. Any policy violations or concerns
+3. Spending patterns by category and employee
+4. Specific items that need review
+5. Recommendations for cost optimisation
+
+Be specific and cite actual expense items when identifying issues."""
+
+
+def expense_analysis_input(expense_data: dict[str, Any], compact: bool = False) -> list[dict[str, str]]:
+    """Build the Responses API input for an expense analysis, static prefix first.
+
+    Args:
+        expense_data: One period of SAMPLE_EXPENSES
+        compact: Send the expenses as CSV rows and the policy as unindented JSON,
+            for reports that would otherwise exceed the expense context budget
+    """
+    if compact:
+        policy_text = json.dumps(expense_data["company_policy"], separators=(",", ":"))
+        rows = io.StringIO()
+        writer = csv.DictWriter(rows, fieldnames=list(expense_data["expenses"][0]), lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(expense_data["expenses"])
+        expenses_text = rows.getvalue()
+    else:
+        policy_text = json.dumps(expense_data["company_policy"], indent=2)
+        expenses_text = json.dumps(expense_data["expenses"], indent=2)
+    report = f"""COMPANY POLICY:
+{policy_text}
+
+Analyse the following expense report for the {expense_data['department']} department ({expense_data['period']}).
+
+BUDGET: ${expense_data['budget']:,.2f}
+
+EXPENSE DATA:
+{expenses_text}"""
+    return [
+        {"role": "developer", "content": EXPENSE_ANALYSIS_INSTRUCTIONS},
+        {"role": "user", "content": report},
+    ]
+
+
 async def analyse_expenses_with_reasoning_streaming(
     period: str = "Q4_2024",
 ):
@@ -621,7 +1126,7 @@ async def analyse_expenses_with_reasoning_streaming(
     if not client:
         yield ("error", "Azure OpenAI credentials not configured for reasoning model.")
         return
-    
+
     deployment = "o3"
     
     expense_data = SAMPLE_EXPENSES.get(period)
@@ -629,39 +1134,37 @@ async def analyse_expenses_with_reasoning_streaming(
         yield ("error", f"No expense data found for period: {period}")
         return
     
-    expenses_text = json.dumps(expense_data["expenses"], indent=2)
-    policy_text = json.dumps(expense_data["company_policy"], indent=2)
-    
-    prompt = f"""Analyse the following expense report for the {expense_data['department']} department ({expense_data['period']}).
-
-EXPENSE DATA:
-{expenses_text}
-
-COMPANY POLICY:
-{policy_text}
-
-BUDGET: ${expense_data['budget']:,.2f}
-
-Please provide a thorough analysis including:
-1. Total spending vs budget
-2. Any policy violations or concerns
-3. Spending patterns by category and employee
-4. Specific items that need review
-5. Recommendations for cost optimisation
+    analysis_input = context_budget.fit_input(
+        QueryIntent.EXPENSE,
+        expense_analysis_input(expense_data),
+        compact=lambda: expense_analysis_input(expense_data, compact=True),
+    )
 
-Be specific and cite actual expense items when identifying issues."""
+    # Use a bounded queue to pass events from the sync stream to the async generator, so
+    # a slow consumer throttles the o3 stream instead of buffering it. Setting stop_event
+    # (the consumer went away) makes the thread close the stream and end the o3 run.
+    event_queue: queue.Queue[Any] = queue.Queue(maxsize=REASONING_EVENT_BUFFER)
+    stop_event = threading.Event()
 
-    # Use a queue to pass events from the sync stream to the async generator
-    event_queue: queue.Queue = queue.Queue()
+    def emit(item: Any) -> bool:
+        """Queue an event for the consumer, giving up once the consumer has stopped."""
+        while not stop_event.is_set():
+            try:
+                event_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
     
     def stream_in_thread():
         """Run the streaming API call in a separate thread."""
+        stream = None
         try:
             start_time = time.time()
             
             stream = client.responses.create(
                 model=deployment,
-                input=[{"role": "user", "content": prompt}],
+                input=analysis_input,
                 reasoning={
                     "effort": "low",
                     "summary": "auto",
@@ -671,24 +1174,34 @@ Be specific and cite actual expense items when identifying issues."""
             
             reasoning_summary = ""
             output_text = ""
+            first_token: float | None = None
             
             for event in stream:
+                if stop_event.is_set():
+                    logger.info("Expense analysis consumer went away, closing the o3 stream")
+                    return
                 event_type = getattr(event, "type", None)
                 
                 # Log all events for debugging
                 logger.debug(f"Streaming event: {event_type}")
                 
+                if first_token is None and event_type in (
+                    "response.reasoning_summary_text.delta",
+                    "response.output_text.delta",
+                ):
+                    first_token = time.time() - start_time
+
                 # Handle reasoning summary delta events (correct event name)
                 if event_type == "response.reasoning_summary_text.delta":
                     delta = getattr(event, "delta", "")
                     if delta:
                         reasoning_summary += delta
-                        event_queue.put(("reasoning_delta", delta))
+                        emit(("reasoning_delta", delta))
                         logger.info(f"Reasoning delta: {delta[:50]}...")
                 
                 # Handle reasoning summary done (correct event name)
                 elif event_type == "response.reasoning_summary_text.done":
-                    event_queue.put(("reasoning_done", None))
+                    emit(("reasoning_done", None))
                     logger.info("Reasoning summary complete")
                 
                 # Handle output text delta events
@@ -696,11 +1209,14 @@ Be specific and cite actual expense items when identifying issues."""
                     delta = getattr(event, "delta", "")
                     if delta:
                         output_text += delta
-                        event_queue.put(("output_delta", delta))
+                        emit(("output_delta", delta))
                 
                 # Handle completion
                 elif event_type == "response.completed":
                     logger.info("Response completed event received")
+                    prompt_cache_stats.record_usage(
+                        "expense_stream", getattr(event.response, "usage", None), first_token
+                    )
                 
                 # Log other events we're not handling
                 elif event_type and not event_type.startswith("response.created") and not event_type.startswith("response.in_progress"):
@@ -719,19 +1235,30 @@ Be specific and cite actual expense items when identifying issues."""
                 reasoning_time, 
                 reasoning_summary.strip() if reasoning_summary else None
             )
-            event_queue.put(("complete", result))
+            emit(("complete", result))
             
         except Exception as e:
             logger.error(f"Error in expense analysis: {e}")
-            event_queue.put(("error", f"Error analysing expenses: {str(e)}"))
+            emit(("error", f"Error analysing expenses: {str(e)}"))
         finally:
-            event_queue.put(None)  # Signal end of stream
+            if stream is not None:
+                stream.close()  # Drops the HTTP connection, which also stops generation
+            emit(None)  # Signal end of stream
     
+    # Streams can't be retried mid-way, but still fail fast while o3 is unhealthy. The call is
+    # reserved only now, so every exit from here on settles it in the finally block below
+    try:
+        reasoning_upstream.breaker.before_call()
+    except CircuitOpenError as e:
+        yield ("error", f"Expense analysis is degraded: {e}")
+        return
+
     # Start the streaming in a background thread
     thread = threading.Thread(target=stream_in_thread, daemon=True)
     thread.start()
     
     # Yield events as they come in
+    outcome: str | None = None
     try:
         while True:
             # Check for events with a small timeout to not block forever
@@ -739,12 +1266,21 @@ Be specific and cite actual expense items when identifying issues."""
                 event = await asyncio.to_thread(event_queue.get, timeout=0.1)
                 if event is None:
                     break  # End of stream
+                if event[0] in ("complete", "error"):
+                    outcome = event[0]
                 yield event
             except queue.Empty:
                 # No event yet, continue waiting
                 await asyncio.sleep(0.01)
     finally:
-        thread.join(timeout=1.0)  # Clean up thread
+        if outcome == "complete":
+            reasoning_upstream.breaker.record_success()
+        elif outcome == "error":
+            reasoning_upstream.breaker.record_failure()
+        else:
+            reasoning_upstream.breaker.release()
+        stop_event.set()
+        await asyncio.to_thread(thread.join, 1.0)  # Clean up thread
 
 
 async def analyse_expenses_with_reasoning(
@@ -772,27 +1308,11 @@ async def analyse_expenses_with_reasoning(
         return f"No expense data found for period: {period}"
     
     # Build the analysis prompt
-    expenses_text = json.dumps(expense_data["expenses"], indent=2)
-    policy_text = json.dumps(expense_data["company_policy"], indent=2)
-    
-    prompt = f"""Analyse the following expense report for the {expense_data['department']} department ({expense_data['period']}).
-
-EXPENSE DATA:
-{expenses_text}
-
-COMPANY POLICY:
-{policy_text}
-
-BUDGET: ${expense_data['budget']:,.2f}
-
-Please provide a thorough analysis including:
-1. Total spending vs budget
-2. Any policy violations or concerns
-3. Spending patterns by category and employee
-4. Specific items that need review
-5. Recommendations for cost optimisation
-
-Be specific and cite actual expense items when identifying issues."""
+    analysis_input = context_budget.fit_input(
+        QueryIntent.EXPENSE,
+        expense_analysis_input(expense_data),
+        compact=lambda: expense_analysis_input(expense_data, compact=True),
+    )
 
     try:
         start_time = time.time()
@@ -801,16 +1321,17 @@ Be specific and cite actual expense items when identifying issues."""
         def call_reasoning():
             return client.responses.create(
                 model=deployment,
-                input=[{"role": "user", "content": prompt}],
+                input=analysis_input,
                 reasoning={
                     "effort": "low",
                     "summary": "auto",  # Enable reasoning summary
                 },
             )
         
-        response = await asyncio.to_thread(call_reasoning)
+        response = await reasoning_upstream.call(lambda: asyncio.to_thread(call_reasoning))
         
         end_time = time.time()
+        prompt_cache_stats.record_usage("expense", response.usage, end_time - start_time)
         reasoning_time = end_time - start_time
         
         # Extract response text and reasoning summary
@@ -884,6 +1405,46 @@ async def get_flight_status(
     return FlightResponse(summary, result)
 
 
+async def get_flight_statuses(
+    flights: Annotated[
+        list[str],
+        Field(
+            description="Flights to look up in one go. Each entry is an IATA flight code ('QF1'), "
+            "a flight code plus departure airport ('QF1 SYD') for multi-leg flights, or a route as "
+            "'DEP-ARR' ('SYD-MEL'). Always use uppercase IATA codes."
+        ),
+    ],
+) -> str:
+    """Get real-time status for several flights or routes at once.
+
+    ALWAYS use this instead of calling get_flight_status repeatedly when the user
+    asks about more than one flight (e.g., 'check QF1, QF2 and EK448') or about an
+    outbound and return flight. All lookups run in parallel.
+    """
+    queries = [query for query in flights if query.strip()][:MAX_BATCH_FLIGHTS]
+    if not queries:
+        return "Please provide at least one flight number or route."
+
+    results = await fetch_flight_statuses(queries)
+
+    found: list[FlightStatusData] = []
+    errors: list[str] = []
+    lines: list[str] = []
+    for query, result in zip(queries, results):
+        if isinstance(result, str):
+            errors.append(f"{query.upper()}: {result}")
+            lines.append(f"{query.upper()}: {result}")
+        else:
+            found.append(result)
+            lines.append(
+                f"Flight {result.flight_iata} ({result.airline_name}): "
+                f"{result.departure.iata} → {result.arrival.iata}, "
+                f"Status: {result.flight_status.title()}"
+            )
+
+    return FlightListResponse("\n".join(lines), found, errors)
+
+
 def show_airport_selector() -> str:
     """Show an interactive airport selector widget.
 
@@ -976,32 +1537,197 @@ class SwiftRoverChatKitServer(ChatKitServer[dict[str, Any]]):
                     "step-by-step, showing 'Thought for X seconds' in the UI.\n\n"
                     "Available tools:\n"
                     "- get_flight_status: Get real-time flight information\n"
+                    "- get_flight_statuses: Get real-time information for several flights or routes at once\n"
                     "- show_airport_selector: Show popular airports to choose from\n"
                     "- show_route_selector: Show popular flight routes\n"
                     "- show_parking_analysis_prompt: Show parking sign upload instructions\n"
                     "- analyse_expense_report: Analyse expense reports with advanced reasoning\n\n"
                     "Be concise and helpful. For parking questions, give clear yes/no answers."
                 ),
-                tools=[get_flight_status, show_airport_selector, show_route_selector, show_parking_analysis_prompt, analyse_expense_report],
+                tools=tool_executor.wrap_all(
+                    [
+                        get_flight_status,
+                        get_flight_statuses,
+                        show_airport_selector,
+                        show_route_selector,
+                        show_parking_analysis_prompt,
+                        analyse_expense_report,
+                    ]
+                ),
+            )
+            # Instructions and tool schemas are sent with every agent request
+            options = self.agent.chat_options
+            tool_schemas = json.dumps(
+                [tool.to_json_schema_spec() for tool in options.tools or [] if isinstance(tool, AIFunction)]
+            )
+            instruction_tokens = token_counter.count(options.instructions or "")
+            self.agent_overhead_tokens = instruction_tokens + token_counter.count(tool_schemas)
+            logger.info(
+                f"Agent initialized successfully ({self.agent_overhead_tokens} tokens of instructions and tools)"
             )
-            logger.info("Agent initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize agent: {e}")
             raise
 
-        self.converter = ThreadItemConverter(
-            attachment_data_fetcher=self._fetch_attachment_data,
+        # Historical images are re-sent every turn, so their encoded payloads are cached;
+        # widgets are sent as their copy text
+        self.converter = HistoryConverter(attachment_store, attachment_payload_cache, upload_pipeline)
+        # Older turns are replaced by a rolling summary kept in the thread's metadata
+        self.history = HistoryCompactor(
+            data_store,
+            self.converter,
+            summarise_history,
+            keep_turns=HISTORY_KEEP_TURNS,
+            summarise_after_tokens=HISTORY_SUMMARISE_AFTER_TOKENS,
+            chunk_tokens=HISTORY_SUMMARY_CHUNK_TOKENS,
+            window_items=HISTORY_WINDOW_ITEMS,
+            count_tokens=token_counter.count,
         )
 
-    async def _fetch_attachment_data(self, attachment_id: str) -> bytes:
-        """Fetch attachment binary data for the converter."""
-        return await attachment_store.read_attachment_bytes(attachment_id)
+    async def _load_parking_image(self, attachment_id: str, declared_type: str) -> tuple[bytes, str, bool]:
+        """Load an uploaded photo for analysis, preferring the pipeline's vision-ready copy.
+
+        Returns:
+            (image bytes, MIME type, whether the image is already vision-ready)
+        """
+        processing = await upload_pipeline.ensure(attachment_id, wait=UPLOAD_PROCESSING_WAIT)
+        if processing and processing.vision_path and processing.vision_mime_type:
+            try:
+                data = await attachment_store.read_derived_bytes(attachment_id, VISION_SUFFIX)
+                return data, processing.vision_mime_type, True
+            except OSError as e:
+                logger.warning(f"Vision-ready copy of {attachment_id} unavailable: {e}")
+
+        data = await attachment_store.read_attachment_bytes(attachment_id)
+        # Trust the file's magic bytes over the type the client declared
+        sniffed_type = processing.mime_type if processing else None
+        return data, sniffed_type or declared_type, False
+
+    async def _parking_image_events(
+        self,
+        widget_item: WidgetItem,
+        attachment_id: str,
+        declared_type: str,
+        title: str,
+        analyses: dict[str, ParkingAnalysisData],
+    ) -> AsyncIterator[ThreadStreamEvent]:
+        """Analyse one parking sign photo, streaming updates to its widget item.
+
+        Successful analyses are added to ``analyses`` under the widget item's id.
+
+        The shared vision semaphore is held from loading the image until the answer
+        has streamed, so queued images don't hold decoded bytes in memory meanwhile.
+        """
+        current_time = datetime.now().strftime("%A, %I:%M %p")
+        async with _vision_call_semaphore:
+            started = time.monotonic()
+            logger.info(f"Loading image attachment: {attachment_id}")
+            try:
+                image_data, content_type, vision_ready = await self._load_parking_image(attachment_id, declared_type)
+            except Exception as e:
+                logger.warning(f"Parking image {attachment_id} unavailable: {e}")
+                error_widget = render_error_widget("Analysis Failed", "The uploaded image is no longer available.")
+                final_item = widget_item.model_copy(update={"widget": error_widget})
+                yield ThreadItemDoneEvent(type="thread.item.done", item=final_item)
+                return
+
+            logger.info(f"Analysing parking sign from uploaded image {attachment_id}")
+            verdict_shown = False
+            async for event_type, data in analyse_parking_sign_streaming(
+                image_data, content_type, current_time, vision_ready=vision_ready
+            ):
+                if event_type == "partial":
+                    if not verdict_shown and "can_park" in data:
+                        verdict_shown = True
+                        logger.info(f"Parking verdict visible after {time.monotonic() - started:.2f}s")
+                    yield ThreadItemUpdatedEvent(
+                        type="thread.item.updated",
+                        item_id=widget_item.id,
+                        update=WidgetRootUpdated(
+                            type="widget.root.updated",
+                            widget=render_analysing_widget(data.get("can_park"), data.get("verdict"), title),
+                        ),
+                    )
+                elif event_type == "complete":
+                    # Success - show parking widget
+                    logger.info(f"Parking analysis complete after {time.monotonic() - started:.2f}s")
+                    analyses[widget_item.id] = data
+                    final_item = widget_item.model_copy(
+                        update={"widget": render_parking_widget(data), "copy_text": parking_widget_copy_text(data)}
+                    )
+                    yield ThreadItemDoneEvent(type="thread.item.done", item=final_item)
+                elif event_type == "error":
+                    # Error - show error widget
+                    final_item = widget_item.model_copy(
+                        update={"widget": render_error_widget("Analysis Failed", data)}
+                    )
+                    yield ThreadItemDoneEvent(type="thread.item.done", item=final_item)
+
+    async def _analyse_parking_images(
+        self,
+        thread: ThreadMetadata,
+        images: list[tuple[str, str]],
+    ) -> AsyncIterator[ThreadStreamEvent]:
+        """Analyse every parking sign photo in a message concurrently.
+
+        Each image gets its analysing widget straight away. Images are then analysed
+        in parallel under the shared vision semaphore, and their early verdicts and
+        final results are streamed in whatever order the analyses finish.
+
+        The analyses and their normalised schedules are saved in the thread's
+        metadata, so follow-up questions about other times are answered locally.
+
+        Args:
+            thread: Thread the widgets are added to
+            images: (attachment id, declared MIME type) of each photo, in message order
+        """
+        analyses: dict[str, ParkingAnalysisData] = {}
+        item_ids = []
+        streams = []
+        for index, (attachment_id, declared_type) in enumerate(images, start=1):
+            title = "Analysing parking sign..." if len(images) == 1 else f"Analysing sign {index} of {len(images)}..."
+            widget_item = WidgetItem(
+                id=default_generate_id("message"),
+                thread_id=thread.id,
+                created_at=datetime.now(),
+                widget=render_analysing_widget(title=title),
+            )
+            yield ThreadItemAddedEvent(type="thread.item.added", item=widget_item)
+            item_ids.append(widget_item.id)
+            streams.append(self._parking_image_events(widget_item, attachment_id, declared_type, title, analyses))
+
+        async for event in _merge_streams(streams):
+            yield event
+
+        if analyses:
+            thread.metadata[PARKING_SIGNS_KEY] = [
+                {
+                    "analysis": asdict(analyses[item_id]),
+                    "schedule": normalise_restrictions(analyses[item_id].restrictions).to_dict(),
+                }
+                for item_id in item_ids
+                if item_id in analyses
+            ]
+        else:
+            # Follow-ups shouldn't re-answer an earlier sign after this one failed
+            thread.metadata.pop(PARKING_SIGNS_KEY, None)
 
     async def respond(
         self,
         thread: ThreadMetadata,
         input_user_message: UserMessageItem | None,
         context: dict[str, Any],
+    ) -> AsyncIterator[ThreadStreamEvent]:
+        """Handle incoming user messages, one turn per thread at a time."""
+        async with thread_locks.hold(thread.id):
+            async for event in self._respond_turn(thread, input_user_message, context):
+                yield event
+
+    async def _respond_turn(
+        self,
+        thread: ThreadMetadata,
+        input_user_message: UserMessageItem | None,
+        context: dict[str, Any],
     ) -> AsyncIterator[ThreadStreamEvent]:
         """Handle incoming user messages and generate responses."""
 
@@ -1010,10 +1736,12 @@ class SwiftRoverChatKitServer(ChatKitServer[dict[str, Any]]):
 
         logger.info(f"Processing message for thread: {thread.id}")
 
+        # Slot from admission control, held for the rest of the turn
+        admission_slot: AdmissionSlot | None = None
+
         try:
-            # Check for image attachments (parking sign analysis)
-            parking_image: bytes | None = None
-            parking_content_type: str | None = None
+            # Check for image attachments (parking sign analysis) as (attachment id, MIME type)
+            parking_images: list[tuple[str, str]] = []
 
             # Debug: log the user message content
             logger.info(f"User message content: {input_user_message.content}")
@@ -1029,61 +1757,70 @@ class SwiftRoverChatKitServer(ChatKitServer[dict[str, Any]]):
                     
                     if attachment_type == "image" or (mime_type and mime_type.startswith("image/")):
                         if attachment_id:
-                            logger.info(f"Loading image attachment: {attachment_id}")
-                            parking_image = await self._fetch_attachment_data(attachment_id)
-                            parking_content_type = mime_type or "image/jpeg"
-                            break
+                            parking_images.append((attachment_id, mime_type or "image/jpeg"))
 
             # Also check content for inline images
-            if not parking_image and input_user_message.content:
+            if not parking_images and input_user_message.content:
                 for content_part in input_user_message.content:
                     logger.info(f"Content part: {content_part}, type={getattr(content_part, 'type', None)}")
                     if hasattr(content_part, "type") and content_part.type == "image":
                         # Get attachment ID from the image
                         attachment_id = getattr(content_part, "attachment_id", None)
                         if attachment_id:
-                            parking_image = await self._fetch_attachment_data(attachment_id)
-                            parking_content_type = "image/jpeg"  # Default
-                            break
-
-            # If image was uploaded, analyse parking sign directly
-            if parking_image and parking_content_type:
-                logger.info("Analysing parking sign from uploaded image")
-
-                current_time = datetime.now().strftime("%A, %I:%M %p")
-                result = await analyse_parking_sign(parking_image, parking_content_type, current_time)
-
-                if isinstance(result, str):
-                    # Error - show error widget
-                    widget = render_error_widget("Analysis Failed", result)
-                    async for event in stream_widget(thread_id=thread.id, widget=widget):
-                        yield event
-                else:
-                    # Success - show parking widget
-                    widget = render_parking_widget(result)
-                    copy_text = parking_widget_copy_text(result)
-                    async for event in stream_widget(thread_id=thread.id, widget=widget, copy_text=copy_text):
+                            parking_images.append((attachment_id, "image/jpeg"))  # Default type
+
+            # If images were uploaded, analyse the parking signs directly
+            parking_images = list(dict.fromkeys(parking_images))[:MAX_PARKING_IMAGES]
+            if parking_images:
+                try:
+                    admission_slot = await admission_controller.acquire(QueryIntent.PARKING, _admission_user(context))
+                except AdmissionRejected as e:
+                    async for event in stream_widget(thread_id=thread.id, widget=render_busy_widget(e)):
                         yield event
+                    return
+                async for event in self._analyse_parking_images(thread, parking_images):
+                    yield event
                 return
 
-            # Track widget flags
-            flight_data: FlightStatusData | None = None
-            show_airport_sel = False
-            show_route_sel = False
-            show_parking_prompt = False
-
-            # Load thread history
-            thread_items_page = await self.store.load_thread_items(
-                thread_id=thread.id,
-                after=None,
-                limit=1000,
-                order="asc",
-                context=context,
+            content = input_user_message.content
+            message_text = content if isinstance(content, str) else " ".join(
+                part.text for part in content or [] if hasattr(part, "text")
             )
-            thread_items = thread_items_page.data
 
-            # Convert to agent messages
-            agent_messages = await self.converter.to_agent_input(thread_items)
+            # Follow-ups like "what about 6pm Saturday?" re-check the last signs locally
+            if thread.metadata.get(PARKING_SIGNS_KEY):
+                when = parse_time_query(message_text, datetime.now())
+                if when is not None:
+                    started = time.perf_counter()
+                    for sign in thread.metadata[PARKING_SIGNS_KEY]:
+                        analysis = _parking_analysis_from_dict(sign["analysis"])
+                        data = reevaluate_analysis(analysis, ParkingSchedule.from_dict(sign["schedule"]), when)
+                        widget = render_parking_widget(data)
+                        async for event in stream_widget(
+                            thread_id=thread.id, widget=widget, copy_text=parking_widget_copy_text(data)
+                        ):
+                            yield event
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    logger.info(f"Parking re-checked locally for {when:%A %I:%M %p} in {elapsed_ms:.2f}ms")
+                    return
+
+                # The conversation has moved on, so later time questions are no longer about the sign
+                del thread.metadata[PARKING_SIGNS_KEY]
+
+            # Parameter-free requests like "show me popular airports" skip the classifier and agent
+            command = match_widget_command(message_text)
+            if command is not None:
+                started = time.perf_counter()
+                render, copy_text_for = WIDGET_COMMANDS[command]
+                async for event in stream_widget(
+                    thread_id=thread.id, widget=render(), copy_text=copy_text_for() if copy_text_for else None
+                ):
+                    yield event
+                logger.info(f"Rendered {command} directly in {(time.perf_counter() - started) * 1000:.2f}ms")
+                return
+
+            # Recent turns plus a summary of older ones, converted to agent messages
+            agent_messages = await self.history.agent_input(thread, context)
 
             if not agent_messages:
                 logger.warning("No messages after conversion")
@@ -1112,11 +1849,18 @@ class SwiftRoverChatKitServer(ChatKitServer[dict[str, Any]]):
             intent = await classify_intent(user_text, has_image)
             logger.info(f"Query intent: {intent}")
 
+            # Expensive intents have their own small pools, so they can't starve flight lookups
+            try:
+                admission_slot = await admission_controller.acquire(intent, _admission_user(context))
+            except AdmissionRejected as e:
+                async for event in stream_widget(thread_id=thread.id, widget=render_busy_widget(e)):
+                    yield event
+                return
+
             # Handle expense queries with o3 reasoning model
             if intent == QueryIntent.EXPENSE:
                 logger.info("Expense intent detected - using o3 reasoning model")
                 
-                import time
                 start_time = time.time()
                 
                 # Create workflow item ID upfront
@@ -1231,63 +1975,68 @@ class SwiftRoverChatKitServer(ChatKitServer[dict[str, Any]]):
                 logger.info(f"Completed expense analysis for thread: {thread.id}")
                 return  # Done with expense query - skip agent
 
-            # For non-expense queries, use the agent as normal
+            # For non-expense queries, use the agent as normal, within the intent's context budget
+            agent_messages = context_budget.fit_messages(intent, agent_messages, overhead=self.agent_overhead_tokens)
             agent_stream = self.agent.run_stream(agent_messages)
 
-            # Simple intercept stream for non-expense queries
+            # Widgets are streamed the moment their tool result arrives, while the model is still
+            # writing its reply, instead of after the whole reply; None ends the widget stream
+            pending_widgets: asyncio.Queue[tuple[WidgetRoot, str | None] | None] = asyncio.Queue()
+
             async def intercept_stream() -> AsyncIterator[AgentRunResponseUpdate]:
-                nonlocal flight_data, show_airport_sel, show_route_sel, show_parking_prompt
-                async for update in agent_stream:
-                    if update.contents:
-                        for content in update.contents:
-                            if isinstance(content, FunctionResultContent):
+                rendered_markers: set[type] = set()
+                # Each model call in the agent's tool loop starts at the turn start or after tool results
+                call_started = time.monotonic()
+                first_token: float | None = None
+                try:
+                    async for update in agent_stream:
+                        if first_token is None and update.contents:
+                            first_token = time.monotonic() - call_started
+                        for content in update.contents or []:
+                            if isinstance(content, UsageContent):
+                                prompt_cache_stats.record_usage("agent", content.details, first_token)
+                                call_started, first_token = time.monotonic(), None
+                            elif isinstance(content, FunctionResultContent):
+                                call_started, first_token = time.monotonic(), None
                                 result = content.result
+                                if type(result) in _MARKER_COMMANDS:
+                                    if type(result) in rendered_markers:
+                                        continue  # Selectors are shown once per turn
+                                    rendered_markers.add(type(result))
+                                widget = _tool_result_widget(result)
+                                if widget is not None:
+                                    pending_widgets.put_nowait(widget)
+                        yield update
+                finally:
+                    pending_widgets.put_nowait(None)
+
+            async def widget_stream() -> AsyncIterator[ThreadStreamEvent]:
+                while (pending := await pending_widgets.get()) is not None:
+                    widget, copy_text = pending
+                    async for event in stream_widget(thread_id=thread.id, widget=widget, copy_text=copy_text):
+                        yield event
 
-                                if isinstance(result, FlightResponse):
-                                    flight_data = result.data
-                                    logger.info(f"Flight data extracted: {flight_data.flight_iata}")
-                                elif isinstance(result, ShowAirportSelector):
-                                    show_airport_sel = True
-                                elif isinstance(result, ShowRouteSelector):
-                                    show_route_sel = True
-                                elif isinstance(result, ShowParkingPrompt):
-                                    show_parking_prompt = True
-                    yield update
-
-            async for event in stream_agent_response(intercept_stream(), thread_id=thread.id):
-                yield event
-
-            # Render widgets based on captured data
-            if flight_data:
-                logger.info(f"Creating flight widget for: {flight_data.flight_iata}")
-                widget = render_flight_widget(flight_data)
-                copy_text = flight_widget_copy_text(flight_data)
-                async for event in stream_widget(thread_id=thread.id, widget=widget, copy_text=copy_text):
-                    yield event
-
-            if show_airport_sel:
-                logger.info("Creating airport selector widget")
-                widget = render_airport_selector_widget()
-                copy_text = airport_selector_copy_text()
-                async for event in stream_widget(thread_id=thread.id, widget=widget, copy_text=copy_text):
-                    yield event
-
-            if show_route_sel:
-                logger.info("Creating route selector widget")
-                widget = render_route_selector_widget()
-                async for event in stream_widget(thread_id=thread.id, widget=widget):
+            async def reply_stream() -> AsyncIterator[ThreadStreamEvent]:
+                # The finished reply keeps the timestamp it was added with, so a reloaded thread
+                # lists it above the widgets that arrived while it was being written
+                added_at: dict[str, datetime] = {}
+                async for event in stream_agent_response(intercept_stream(), thread_id=thread.id):
+                    if isinstance(event, ThreadItemAddedEvent):
+                        added_at[event.item.id] = event.item.created_at
+                    elif isinstance(event, ThreadItemDoneEvent) and event.item.id in added_at:
+                        event.item.created_at = added_at[event.item.id]
                     yield event
 
-            if show_parking_prompt:
-                logger.info("Creating parking prompt widget")
-                widget = render_parking_upload_prompt()
-                async for event in stream_widget(thread_id=thread.id, widget=widget):
-                    yield event
+            async for event in _merge_streams([reply_stream(), widget_stream()]):
+                yield event
 
             logger.info(f"Completed processing for thread: {thread.id}")
 
         except Exception as e:
             logger.error(f"Error processing message: {e}", exc_info=True)
+        finally:
+            if admission_slot is not None:
+                admission_slot.release()
 
     async def action(
         self,
@@ -1337,6 +2086,35 @@ class SwiftRoverChatKitServer(ChatKitServer[dict[str, Any]]):
                 async for event in stream_widget(thread_id=thread.id, widget=widget, copy_text=copy_text):
                     yield event
 
+        elif action.type == "track_flight":
+            flight_iata = action.payload.get("flight_iata") or None
+            dep_iata = action.payload.get("dep_iata") or None
+
+            if sender is None or not flight_iata:
+                logger.warning("track_flight action without a flight widget to update")
+                return
+
+            logger.info(f"Tracking flight {flight_iata} from {dep_iata} in widget {sender.id}")
+
+            # Keep the action stream open and update the existing widget in place
+            latest: FlightStatusData | None = None
+            async for data in flight_tracker.watch(flight_iata, dep_iata):
+                latest = data
+                yield ThreadItemUpdatedEvent(
+                    type="thread.item.updated",
+                    item_id=sender.id,
+                    update=WidgetRootUpdated(
+                        type="widget.root.updated", widget=render_flight_widget(data, tracking=True)
+                    ),
+                )
+
+            # Persist the final state once tracking ends
+            if latest is not None:
+                final_item = sender.model_copy(
+                    update={"widget": render_flight_widget(latest), "copy_text": flight_widget_copy_text(latest)}
+                )
+                yield ThreadItemReplacedEvent(type="thread.item.replaced", item=final_item)
+
         else:
             logger.warning(f"Unknown action type: {action.type}")
 
@@ -1351,13 +2129,55 @@ attachment_store = FileBasedAttachmentStore(
     uploads_dir=UPLOADS_DIR,
     base_url=f"http://{SERVER_HOST}:{SERVER_PORT}",
     data_store=data_store,
+    blob_backend=(
+        S3BlobBackend(UPLOADS_S3_BUCKET, endpoint_url=UPLOADS_S3_ENDPOINT_URL, direct_uploads=UPLOADS_S3_DIRECT)
+        if UPLOADS_S3_BUCKET
+        else None
+    ),
+)
+attachment_payload_cache = EncodedAttachmentCache(max_bytes=ATTACHMENT_CACHE_MAX_BYTES)
+upload_pipeline = UploadPipeline(attachment_store, data_store)
+attachment_gc = AttachmentGarbageCollector(
+    attachment_store,
+    data_store,
+    max_bytes=UPLOADS_MAX_BYTES,
+    orphan_grace=ORPHAN_ATTACHMENT_GRACE,
+    upload_pipeline=upload_pipeline,
+)
+admission_controller = AdmissionController(
+    {intent: PoolLimits(*limits) for intent, limits in ADMISSION_POOLS.items()}
+)
+stream_guard = StreamGuard(
+    max_buffered=STREAM_BUFFER_EVENTS,
+    stall_timeout=STREAM_STALL_TIMEOUT,
+    disconnect_poll=STREAM_DISCONNECT_POLL,
+)
+thread_locks = ThreadLocks()
+tool_executor = ToolExecutor(
+    {name: ToolLimits(*limits) for name, limits in TOOL_LIMITS.items()},
+    default=ToolLimits(*TOOL_DEFAULT_LIMITS),
+)
+resumable_streams = ResumableStreams(
+    capacity=STREAM_REPLAY_EVENTS,
+    max_unsent=STREAM_MAX_UNSENT_EVENTS,
+    resume_grace=STREAM_RESUME_GRACE,
+    retention=STREAM_RETENTION,
 )
 
 # Create ChatKit server
 chatkit_server = SwiftRoverChatKitServer(data_store, attachment_store)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Run background maintenance for the lifetime of the server."""
+    attachment_gc.start()
+    yield
+    await attachment_gc.stop()
+
+
 # Create FastAPI app
-app = FastAPI(title="SwiftRover - AI Travel Assistant")
+app = FastAPI(title="SwiftRover - AI Travel Assistant", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -1373,13 +2193,43 @@ app.add_middleware(
 async def chatkit_endpoint(request: Request):
     """Main ChatKit endpoint that handles all ChatKit requests."""
     logger.debug(f"Received ChatKit request from {request.client}")
+
+    context: dict[str, Any] = {"request": request}
+    # This sample has no sign-in, so the owner stays None and the 128-bit turn id is the only
+    # thing guarding a turn against other clients. An auth layer that sets context["user_id"]
+    # restricts resuming and joining to the user who started the turn
+    owner = context.get("user_id")
+
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id:
+        # Reconnect to a turn that is still running or recently finished, without re-running it
+        resumed = resumable_streams.resume(last_event_id, owner=owner)
+        if resumed is None:
+            return JSONResponse({"status": "error", "message": "Stream is no longer available"}, status_code=410)
+        return StreamingResponse(stream_guard.guard(resumed, request.is_disconnected), media_type="text/event-stream")
+
     request_body = await request.body()
-    context = {"request": request}
+
+    # A double-click or client retry joins the turn already running for the same message.
+    # Requests carry no user identity here (every client shares the proxy's address), so
+    # only turns on an existing thread are deduplicated
+    fingerprint = turn_fingerprint(request_body, owner)
+    if fingerprint is not None:
+        joined = resumable_streams.join(fingerprint, owner=owner)
+        if joined is not None:
+            return StreamingResponse(
+                stream_guard.guard(joined, request.is_disconnected), media_type="text/event-stream"
+            )
 
     try:
         result = await chatkit_server.process(request_body, context)
         if hasattr(result, "__aiter__"):  # StreamingResult
-            return StreamingResponse(result, media_type="text/event-stream")
+            # The turn runs in the background so a dropped client can resume it; it is cancelled,
+            # with every model and tool call in it, if nobody reconnects within the grace period
+            events = resumable_streams.start(result, key=fingerprint, owner=owner)
+            return StreamingResponse(
+                stream_guard.guard(events, request.is_disconnected), media_type="text/event-stream"
+            )
         return Response(content=result.json, media_type="application/json")
     except Exception as e:
         logger.error(f"Error processing ChatKit request: {e}", exc_info=True)
@@ -1390,6 +2240,7 @@ async def chatkit_endpoint(request: Request):
 async def upload_attachment(attachment_id: str, request: Request) -> JSONResponse:
     """Handle file upload (phase 2 of two-phase upload)."""
     content_type = request.headers.get("content-type", "")
+    file_content_type: str | None = None
     
     # Check if it's multipart form data
     if "multipart/form-data" in content_type:
@@ -1397,9 +2248,10 @@ async def upload_attachment(attachment_id: str, request: Request) -> JSONRespons
         form = await request.form()
         # Get the first file from the form
         for key, value in form.items():
-            if hasattr(value, "read"):
-                # It's an UploadFile
+            if not isinstance(value, str):
+                # Form values are strings or UploadFiles
                 body = await value.read()
+                file_content_type = value.content_type
                 break
         else:
             # No file found in form, try raw body
@@ -1407,21 +2259,110 @@ async def upload_attachment(attachment_id: str, request: Request) -> JSONRespons
     else:
         # Raw binary upload
         body = await request.body()
+        file_content_type = content_type or None
     
     logger.info(f"Upload {attachment_id}: received {len(body)} bytes, content-type: {content_type}")
     
-    success = await attachment_store.store_attachment(attachment_id, body)
+    success = await attachment_store.store_attachment(attachment_id, body, file_content_type)
     if success:
+        # Sniffing, hashing, thumbnails and vision encoding happen off the request path
+        upload_pipeline.submit(attachment_id)
         return JSONResponse({"status": "ok", "id": attachment_id})
     return JSONResponse({"status": "error", "message": "Failed to store attachment"}, status_code=500)
 
 
+@app.get("/metrics/quota")
+async def quota_metrics() -> JSONResponse:
+    """Expose live upstream quota usage."""
+    return JSONResponse({"aviationstack": aviationstack_quota.metrics()})
+
+
+@app.get("/metrics/upstreams")
+async def upstream_metrics() -> JSONResponse:
+    """Expose circuit breaker state and latency for each upstream."""
+    upstreams = [aviationstack_upstream, vision_upstream, classifier_upstream, summary_upstream, reasoning_upstream]
+    return JSONResponse({upstream.name: upstream.metrics() for upstream in upstreams})
+
+
+@app.get("/metrics/attachments")
+async def attachment_metrics() -> JSONResponse:
+    """Expose encoded attachment cache and upload storage metrics."""
+    return JSONResponse({"cache": attachment_payload_cache.metrics(), "storage": attachment_gc.metrics()})
+
+
+@app.get("/metrics/uploads")
+async def upload_metrics() -> JSONResponse:
+    """Expose post-upload processing counters."""
+    return JSONResponse(upload_pipeline.metrics())
+
+
+@app.get("/metrics/admission")
+async def admission_metrics() -> JSONResponse:
+    """Expose admission pool usage, queue depth, wait times and rejections."""
+    return JSONResponse(admission_controller.metrics())
+
+
+@app.get("/metrics/prompt-cache")
+async def prompt_cache_metrics() -> JSONResponse:
+    """Expose cached vs uncached prompt tokens and time to first token per model call source."""
+    return JSONResponse(prompt_cache_stats.metrics())
+
+
+@app.get("/metrics/history")
+async def history_metrics() -> JSONResponse:
+    """Expose prompt history size and rolling summary updates."""
+    return JSONResponse(chatkit_server.history.metrics())
+
+
+@app.get("/metrics/tokens")
+async def token_metrics() -> JSONResponse:
+    """Expose locally counted prompt tokens and context budget trimming per intent."""
+    return JSONResponse(context_budget.metrics())
+
+
+@app.get("/metrics/tools")
+async def tool_metrics() -> JSONResponse:
+    """Expose agent tool calls, timeouts and concurrency per tool."""
+    return JSONResponse(tool_executor.metrics())
+
+
+@app.get("/metrics/streams")
+async def stream_metrics() -> JSONResponse:
+    """Expose SSE stream outcomes, buffer usage, resumes and per-thread serialisation."""
+    return JSONResponse(
+        {**stream_guard.metrics(), "resumable": resumable_streams.metrics(), "threads": thread_locks.metrics()}
+    )
+
+
+@app.get("/metrics/tracking")
+async def tracking_metrics() -> JSONResponse:
+    """Expose shared flight pollers and their watchers."""
+    return JSONResponse(flight_tracker.metrics())
+
+
 @app.get("/preview/{attachment_id}")
 async def preview_attachment(attachment_id: str) -> Response:
-    """Serve attachment for preview."""
-    data = await attachment_store.read_attachment_bytes(attachment_id)
+    """Serve attachment for preview, using the generated thumbnail once it is ready."""
+    processing = await upload_pipeline.get(attachment_id)
+    if processing and processing.thumbnail_path:
+        try:
+            data = await attachment_store.read_derived_bytes(attachment_id, THUMBNAIL_SUFFIX)
+            return Response(content=data, media_type="image/jpeg")
+        except OSError:
+            pass  # Fall back to the original
+
+    # Send the client straight to storage when the blob backend can presign
+    download_url = attachment_store.download_url(attachment_id)
+    if download_url:
+        return RedirectResponse(download_url, status_code=307)
+
+    try:
+        data = await attachment_store.read_attachment_bytes(attachment_id)
+    except FileNotFoundError:
+        return Response(status_code=404)  # Never uploaded, or removed by garbage collection
     if data:
-        content_type = attachment_store.get_content_type(attachment_id)
+        sniffed_type = processing.mime_type if processing else None
+        content_type = sniffed_type or attachment_store.get_content_type(attachment_id)
         return Response(content=data, media_type=content_type)
     return Response(status_code=404)
 
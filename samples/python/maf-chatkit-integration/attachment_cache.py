@@ -0,0 +1,153 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Cache of base64-encoded attachment payloads for agent input conversion.
+
+``respond`` converts the whole thread history on every turn, so without a cache
+every image ever posted in a thread is read from disk and base64-encoded again
+for each new message. EncodedAttachmentCache keeps the encoded DataContent
+objects - constructing one also re-validates its whole data URI - keyed by
+attachment id and content hash so a re-uploaded file is never served stale,
+and evicts least recently used entries once a byte budget is exceeded.
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any
+
+from agent_framework import DataContent, UriContent
+from agent_framework_chatkit import ThreadItemConverter
+from chatkit.types import Attachment
+
+from upload_pipeline import VISION_SUFFIX
+
+if TYPE_CHECKING:
+    from attachment_store import FileBasedAttachmentStore
+    from upload_pipeline import UploadPipeline
+
+logger = logging.getLogger(__name__)
+
+
+def encode_attachment(data: bytes, media_type: str) -> DataContent:
+    """Base64-encode attachment bytes into DataContent."""
+    return DataContent(data=data, media_type=media_type)
+
+
+class EncodedAttachmentCache:
+    """LRU cache of encoded attachment contents with a total size budget."""
+
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024):
+        """Initialize the cache.
+
+        Args:
+            max_bytes: Total length of cached data URIs before old entries are evicted
+        """
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple[str, str], DataContent] = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, attachment_id: str, content_hash: str) -> DataContent | None:
+        """Return the cached content, or None on a miss."""
+        key = (attachment_id, content_hash)
+        content = self._entries.get(key)
+        if content is None:
+            self._misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return content
+
+    def put(self, attachment_id: str, content_hash: str, content: DataContent) -> None:
+        """Cache encoded content, evicting the least recently used entries if needed."""
+        if len(content.uri) > self.max_bytes:
+            return
+        self.discard(attachment_id)
+        self._entries[(attachment_id, content_hash)] = content
+        self._bytes += len(content.uri)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted.uri)
+            self._evictions += 1
+
+    def discard(self, attachment_id: str) -> None:
+        """Drop every cached version of an attachment."""
+        for key in [key for key in self._entries if key[0] == attachment_id]:
+            self._bytes -= len(self._entries.pop(key).uri)
+
+    def metrics(self) -> dict[str, Any]:
+        """Cache size and hit counters."""
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            "evictions": self._evictions,
+        }
+
+
+class CachedAttachmentConverter(ThreadItemConverter):
+    """ThreadItemConverter that reuses encoded attachment payloads across turns."""
+
+    def __init__(
+        self,
+        attachment_store: "FileBasedAttachmentStore",
+        cache: EncodedAttachmentCache,
+        upload_pipeline: "UploadPipeline | None" = None,
+    ):
+        """Initialize the converter.
+
+        Args:
+            attachment_store: Store the attachment bytes and content hashes are read from
+            cache: Cache of encoded payloads shared by all threads
+            upload_pipeline: Pipeline whose vision-ready copies are sent instead of originals
+        """
+        super().__init__(attachment_data_fetcher=attachment_store.read_attachment_bytes)
+        self.attachment_store = attachment_store
+        self.cache = cache
+        self.upload_pipeline = upload_pipeline
+
+    async def attachment_to_message_content(self, attachment: Attachment) -> DataContent | UriContent | None:
+        """Convert an attachment to DataContent, encoding it at most once per content hash.
+
+        Once upload processing has produced a vision-ready copy, that copy is sent instead
+        of the original - it holds the same pixels the model would have looked at.
+        """
+        try:
+            content_hash = await self.attachment_store.content_hash(attachment.id)
+            processing = await self.upload_pipeline.get(attachment.id) if self.upload_pipeline else None
+            vision_type: str | None = None
+            if processing is not None and processing.vision_path:
+                vision_type = processing.vision_mime_type
+            if vision_type is not None:
+                content_hash += ":vision"
+
+            cached = self.cache.get(attachment.id, content_hash)
+            if cached is not None:
+                return cached
+
+            data: bytes | None = None
+            media_type = attachment.mime_type
+            if vision_type is not None:
+                try:
+                    data = await self.attachment_store.read_derived_bytes(attachment.id, VISION_SUFFIX)
+                    media_type = vision_type
+                except FileNotFoundError:
+                    pass  # Local copy evicted - the original may still be in blob storage
+            if data is None:
+                data = await self.attachment_store.read_attachment_bytes(attachment.id)
+            content = await asyncio.to_thread(encode_attachment, data, media_type)
+            self.cache.put(attachment.id, content_hash, content)
+            return content
+        except FileNotFoundError:
+            # Evicted by the upload garbage collector - the model can't fetch preview URLs either
+            logger.info(f"Attachment {attachment.id} is no longer stored, leaving it out of the agent input")
+            return None
+        except Exception as e:
+            logger.debug(f"Encoded attachment cache unavailable for {attachment.id}: {e}")
+            return await super().attachment_to_message_content(attachment)
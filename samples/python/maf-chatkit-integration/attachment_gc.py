@@ -0,0 +1,316 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Background garbage collection and disk budget for uploaded attachments.
+
+Deleted threads, abandoned uploads and files whose metadata is gone would
+otherwise accumulate in the uploads directory and attachments table forever.
+AttachmentGarbageCollector walks the sharded uploads tree one top-level shard
+per step, so each step touches about 1/256 of the files and the event loop never
+waits on a full scan. Each step:
+
+- deletes files that have no attachment metadata, plus stale temporary files
+- records the size and last access of every attachment it sees
+
+After each full pass it deletes attachment metadata that no thread item
+references, and evicts least recently used files while the total is over budget.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from attachment_store import FileBasedAttachmentStore
+    from store import SQLiteStore
+    from upload_pipeline import UploadPipeline
+
+logger = logging.getLogger(__name__)
+
+SHARD_COUNT = 256
+
+# Files this new may belong to an upload still being written or registered
+RECENT_FILE_SECONDS = 600
+
+
+@dataclass(frozen=True, slots=True)
+class _ShardFile:
+    """A file found while scanning a shard."""
+
+    path: str
+    size: int
+    atime: float
+    mtime: float
+
+    @property
+    def is_temporary(self) -> bool:
+        return os.path.basename(self.path).startswith(".")
+
+
+def _scan_shard(roots: tuple[Path, ...], prefix: str, access_times: dict[str, float]) -> dict[str, list[_ShardFile]]:
+    """List the files of one top-level shard, grouped by attachment id.
+
+    Runs synchronously on the attachment store's I/O executor. Recorded access
+    times are written back as file atimes so LRU order survives restarts.
+    """
+    files: dict[str, list[_ShardFile]] = {}
+    for root in roots:
+        shard = root / prefix
+        if not shard.is_dir():
+            continue
+        with os.scandir(shard) as leaves:
+            for leaf in leaves:
+                if not leaf.is_dir(follow_symlinks=False):
+                    continue
+                with os.scandir(leaf.path) as entries:
+                    for entry in entries:
+                        if not entry.is_file(follow_symlinks=False):
+                            continue
+                        stat = entry.stat(follow_symlinks=False)
+                        # "<id>", "<id>.<suffix>" or ".<id>[.<suffix>].<random>.tmp" while being written
+                        attachment_id = entry.name.lstrip(".").split(".", 1)[0]
+                        atime = stat.st_atime
+                        accessed = access_times.get(attachment_id)
+                        if accessed is not None and accessed > atime:
+                            os.utime(entry.path, (accessed, stat.st_mtime))
+                            atime = accessed
+                        files.setdefault(attachment_id, []).append(
+                            _ShardFile(entry.path, stat.st_size, atime, stat.st_mtime)
+                        )
+    return files
+
+
+def _unlink_files(paths: list[str]) -> int:
+    """Delete files, returning the number of bytes freed."""
+    freed = 0
+    for path in paths:
+        try:
+            size = os.stat(path).st_size
+            os.unlink(path)
+            freed += size
+        except FileNotFoundError:
+            pass
+    return freed
+
+
+class AttachmentGarbageCollector:
+    """Incremental collector for orphaned uploads with an LRU disk budget.
+
+    Features:
+    - One shard per step, so scan cost is spread evenly over a pass
+    - Orphaned file, orphaned metadata and stale temp file cleanup
+    - LRU eviction by last access once the uploads exceed ``max_bytes``
+    - Reclaimed bytes and scan cost metrics for the /metrics/attachments endpoint
+    """
+
+    def __init__(
+        self,
+        attachment_store: "FileBasedAttachmentStore",
+        data_store: "SQLiteStore",
+        max_bytes: int,
+        orphan_grace: float = 24 * 3600,
+        step_interval: float = 2.0,
+        upload_pipeline: "UploadPipeline | None" = None,
+    ):
+        """Initialize the collector.
+
+        Args:
+            attachment_store: Store holding the uploaded files
+            data_store: Store holding attachment metadata and thread items
+            max_bytes: Disk budget for uploads and their derived files
+            orphan_grace: Seconds an unreferenced attachment is kept before deletion
+            step_interval: Seconds between shard scans; a full pass takes 256 steps
+            upload_pipeline: Pipeline whose cached results are dropped for deleted attachments
+        """
+        self.attachment_store = attachment_store
+        self.data_store = data_store
+        self.max_bytes = max_bytes
+        self.orphan_grace = orphan_grace
+        self.step_interval = step_interval
+        self.upload_pipeline = upload_pipeline
+
+        self._task: asyncio.Task[None] | None = None
+        self._cursor = 0
+        self._access_times: dict[str, float] = {}
+        # Per shard prefix: attachment id -> (last access, total bytes, file paths)
+        self._usage: dict[str, dict[str, tuple[float, int, list[str]]]] = {}
+
+        self._passes = 0
+        self._files_scanned = 0
+        self._scan_seconds = 0.0
+        self._pass_started = time.monotonic()
+        self._last_pass_seconds: float | None = None
+        self._bytes_reclaimed = 0
+        self._orphaned_files = 0
+        self._orphaned_metadata = 0
+        self._evicted = 0
+
+    @property
+    def tracked_bytes(self) -> int:
+        """Bytes used by the attachments seen in the latest pass."""
+        return sum(size for usage in self._usage.values() for _, size, _ in usage.values())
+
+    def start(self) -> None:
+        """Start collecting in the background."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="attachment-gc")
+
+    async def stop(self) -> None:
+        """Stop the background task."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.step()
+            except Exception as e:
+                logger.warning(f"Attachment GC step failed: {e}")
+            await asyncio.sleep(self.step_interval)
+
+    async def _delete(self, attachment_ids: list[str], paths: list[str], keep_blobs: bool = False) -> int:
+        """Delete files and forget any cached state for the given attachments.
+
+        With ``keep_blobs`` only local files are removed and originals in the
+        store's blob backend are kept.
+        """
+        freed = await self.attachment_store.run_io(_unlink_files, paths)
+        for attachment_id in attachment_ids:
+            if not keep_blobs or self.attachment_store.blob_backend is None:
+                await self.attachment_store.delete_attachment(attachment_id, {})
+            else:
+                self.attachment_store.forget_content_hash(attachment_id)
+            if self.upload_pipeline is not None:
+                self.upload_pipeline.forget(attachment_id)
+        self._bytes_reclaimed += freed
+        return freed
+
+    async def step(self) -> None:
+        """Scan the next shard, then sweep metadata and enforce the budget after a full pass."""
+        prefix = f"{self._cursor:02x}"
+        self._access_times.update(self.attachment_store.take_access_times())
+
+        started = time.perf_counter()
+        roots = (self.attachment_store.uploads_dir, self.attachment_store.derived_dir)
+        files = await self.attachment_store.run_io(_scan_shard, roots, prefix, self._access_times)
+        existing = await self.data_store.existing_attachment_ids(files)
+        self._scan_seconds += time.perf_counter() - started
+        self._files_scanned += sum(len(group) for group in files.values())
+
+        now = time.time()
+        orphans: list[str] = []
+        orphan_paths: list[str] = []
+        usage: dict[str, tuple[float, int, list[str]]] = {}
+        for attachment_id, group in files.items():
+            if now - max(f.mtime for f in group) < RECENT_FILE_SECONDS:
+                continue
+            if attachment_id not in existing:
+                orphans.append(attachment_id)
+                orphan_paths.extend(f.path for f in group)
+                continue
+            # Temporary files this old are left over from interrupted writes
+            orphan_paths.extend(f.path for f in group if f.is_temporary)
+            group = [f for f in group if not f.is_temporary]
+            if group:
+                usage[attachment_id] = (
+                    max(f.atime for f in group),
+                    sum(f.size for f in group),
+                    [f.path for f in group],
+                )
+
+        if orphan_paths:
+            freed = await self._delete(orphans, orphan_paths)
+            self._orphaned_files += len(orphan_paths)
+            logger.info(
+                f"Attachment GC: removed {len(orphan_paths)} orphaned file(s) in shard {prefix}, {freed:,} bytes"
+            )
+
+        for attachment_id in files:
+            self._access_times.pop(attachment_id, None)
+        self._usage[prefix] = usage
+
+        self._cursor = (self._cursor + 1) % SHARD_COUNT
+        if self._cursor == 0:
+            self._passes += 1
+            self._last_pass_seconds = round(time.monotonic() - self._pass_started, 1)
+            self._pass_started = time.monotonic()
+            await self.sweep_metadata()
+            await self.enforce_budget()
+
+    async def sweep_metadata(self) -> None:
+        """Delete unreferenced attachments older than the grace period."""
+        started = time.perf_counter()
+        orphans = await self.data_store.find_orphaned_attachments(time.time() - self.orphan_grace)
+        self._scan_seconds += time.perf_counter() - started
+        if not orphans:
+            return
+
+        paths = []
+        for attachment_id in orphans:
+            for usage in self._usage.values():
+                entry = usage.pop(attachment_id, None)
+                if entry is not None:
+                    paths.extend(entry[2])
+        freed = await self._delete(orphans, paths)
+        await self.data_store.delete_attachments(orphans)
+        self._orphaned_metadata += len(orphans)
+        logger.info(f"Attachment GC: removed {len(orphans)} unreferenced attachment(s), {freed:,} bytes")
+
+    async def enforce_budget(self) -> None:
+        """Evict least recently used attachment files until usage is back under budget.
+
+        Metadata is kept so thread history still lists the attachment; the agent
+        input converter leaves evicted files out.
+        """
+        total = self.tracked_bytes
+        if total <= self.max_bytes:
+            return
+
+        # Evict to 90% of the budget so the next pass doesn't immediately evict again
+        target = int(self.max_bytes * 0.9)
+        recent = {**self._access_times, **self.attachment_store.take_access_times()}
+        self._access_times = recent
+        candidates = sorted(
+            (max(last_access, recent.get(attachment_id, 0.0)), attachment_id, prefix)
+            for prefix, usage in self._usage.items()
+            for attachment_id, (last_access, _, _) in usage.items()
+        )
+
+        evicted: list[str] = []
+        paths: list[str] = []
+        for _, attachment_id, prefix in candidates:
+            if total <= target:
+                break
+            _, size, files = self._usage[prefix].pop(attachment_id)
+            total -= size
+            evicted.append(attachment_id)
+            paths.extend(files)
+
+        # Originals in a blob backend don't count against the local budget
+        freed = await self._delete(evicted, paths, keep_blobs=True)
+        self._evicted += len(evicted)
+        logger.info(f"Attachment GC: evicted {len(evicted)} least recently used attachment(s), {freed:,} bytes")
+
+    def metrics(self) -> dict[str, Any]:
+        """Reclaimed space, scan cost and budget usage."""
+        return {
+            "max_bytes": self.max_bytes,
+            "tracked_bytes": self.tracked_bytes,
+            "passes": self._passes,
+            "shard_cursor": self._cursor,
+            "files_scanned": self._files_scanned,
+            "scan_seconds": round(self._scan_seconds, 3),
+            "last_pass_seconds": self._last_pass_seconds,
+            "bytes_reclaimed": self._bytes_reclaimed,
+            "orphaned_files": self._orphaned_files,
+            "orphaned_metadata": self._orphaned_metadata,
+            "evicted": self._evicted,
+        }
@@ -5,18 +5,67 @@
 This module provides a simple AttachmentStore implementation that stores
 uploaded files on the local filesystem. In production, you should use
 cloud storage like Azure Blob Storage, S3, or Google Cloud Storage.
+
+Files are spread over a two-level directory tree keyed by a hash of the
+attachment id (``ab/cd/<id>``) so no directory grows past a few hundred entries,
+and all disk access runs on a dedicated I/O thread pool instead of the event loop.
+
+Original uploads can instead be kept in a BlobBackend such as S3; thumbnails and
+other derived files stay on local disk as a cache.
 """
 
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, TypeVar
 
 from chatkit.store import AttachmentStore
 from chatkit.types import Attachment, AttachmentCreateParams, FileAttachment, ImageAttachment
 from pydantic import AnyUrl
 
 if TYPE_CHECKING:
+    from blob_backend import BlobBackend
     from store import SQLiteStore
 
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def shard_path(root: Path, name: str, key: str) -> Path:
+    """Place ``name`` in a two-level hashed directory under ``root``.
+
+    Args:
+        root: Base directory
+        name: File name
+        key: Value hashed to pick the shard, usually the attachment id
+    """
+    digest = hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+    return root / digest[:2] / digest[2:4] / name
+
+
+def write_file_atomically(path: Path, data: bytes) -> None:
+    """Write a file under a temporary name and move it into place.
+
+    Creates the shard directories as needed. Readers never see a half-written
+    file, concurrent writes of the same file each use their own temporary file,
+    and a failed write leaves nothing behind.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
 
 class FileBasedAttachmentStore(AttachmentStore[dict[str, Any]]):
     """File-based AttachmentStore that stores files on local disk.
@@ -26,9 +75,11 @@ class FileBasedAttachmentStore(AttachmentStore[dict[str, Any]]):
     image and file attachments.
 
     Features:
-    - Stores files in a local uploads directory
+    - Stores files in a hash-sharded local uploads directory
+    - Runs all file I/O on a dedicated executor
     - Generates upload URLs for two-phase upload
     - Generates preview URLs for images
+    - Optional blob backend with direct-to-storage presigned uploads
     - Proper cleanup on deletion
     """
 
@@ -37,6 +88,9 @@ class FileBasedAttachmentStore(AttachmentStore[dict[str, Any]]):
         uploads_dir: str = "./uploads",
         base_url: str = "http://localhost:8000",
         data_store: "SQLiteStore | None" = None,
+        io_workers: int = 4,
+        blob_backend: "BlobBackend | None" = None,
+        max_content_hashes: int = 10000,
     ):
         """Initialize the file-based attachment store.
 
@@ -44,23 +98,68 @@ class FileBasedAttachmentStore(AttachmentStore[dict[str, Any]]):
             uploads_dir: Directory where uploaded files will be stored
             base_url: Base URL for generating upload and preview URLs
             data_store: Optional data store to persist attachment metadata
+            io_workers: Threads in the executor used for file I/O
+            blob_backend: Optional external storage for original uploads; local disk if omitted
+            max_content_hashes: Content hashes kept in memory, least recently used are dropped first
         """
         self.uploads_dir = Path(uploads_dir)
         self.base_url = base_url.rstrip("/")
         self.data_store = data_store
+        self.blob_backend = blob_backend
+        self._io_executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="attachment-io")
+
+        # SHA-256 of recently used files, filled by upload processing or on first request
+        self._content_hashes: OrderedDict[str, str] = OrderedDict()
+        self.max_content_hashes = max_content_hashes
+
+        # Reads since the garbage collector last collected them, for LRU eviction
+        self._access_times: dict[str, float] = {}
 
         # Create uploads directory if it doesn't exist
         self.uploads_dir.mkdir(parents=True, exist_ok=True)
+        self.derived_dir.mkdir(exist_ok=True)
+
+    @property
+    def derived_dir(self) -> Path:
+        """Directory for files generated from uploads, such as thumbnails."""
+        return self.uploads_dir / "derived"
 
     def get_file_path(self, attachment_id: str) -> Path:
         """Get the filesystem path for an attachment."""
-        return self.uploads_dir / attachment_id
+        return shard_path(self.uploads_dir, attachment_id, attachment_id)
+
+    def get_derived_path(self, attachment_id: str, suffix: str) -> Path:
+        """Get the filesystem path for a file generated from an attachment."""
+        return shard_path(self.derived_dir, f"{attachment_id}.{suffix}", attachment_id)
+
+    def record_access(self, attachment_id: str) -> None:
+        """Note that an attachment was just used."""
+        self._access_times[attachment_id] = time.time()
+
+    def take_access_times(self) -> dict[str, float]:
+        """Return and reset the access times recorded since the last call."""
+        access_times, self._access_times = self._access_times, {}
+        return access_times
+
+    async def run_io(self, func: Callable[..., T], *args: Any) -> T:
+        """Run a blocking file operation on the store's I/O executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io_executor, func, *args)
+
+    def _delete_files(self, attachment_id: str) -> None:
+        self.get_file_path(attachment_id).unlink(missing_ok=True)
+        (self.uploads_dir / attachment_id).unlink(missing_ok=True)  # Pre-sharding layout
+        derived_shard = self.get_derived_path(attachment_id, "").parent
+        if derived_shard.is_dir():
+            for derived_path in derived_shard.glob(f"{attachment_id}.*"):
+                derived_path.unlink(missing_ok=True)
 
     async def delete_attachment(self, attachment_id: str, context: dict[str, Any]) -> None:
         """Delete an attachment and its file from disk."""
-        file_path = self.get_file_path(attachment_id)
-        if file_path.exists():
-            file_path.unlink()
+        await self.run_io(self._delete_files, attachment_id)
+        if self.blob_backend is not None:
+            await self.blob_backend.delete(attachment_id)
+        self.forget_content_hash(attachment_id)
 
     async def create_attachment(self, input: AttachmentCreateParams, context: dict[str, Any]) -> Attachment:
         """Create an attachment with upload URL for two-phase upload.
@@ -71,12 +170,17 @@ class FileBasedAttachmentStore(AttachmentStore[dict[str, Any]]):
         # Generate unique ID for this attachment
         attachment_id = self.generate_attachment_id(input.mime_type, context)
 
-        # Generate upload URL that points to our FastAPI upload endpoint
-        upload_url = f"{self.base_url}/upload/{attachment_id}"
+        # Upload straight to the blob backend when it can presign, otherwise through our endpoint
+        upload_url = None
+        if self.blob_backend is not None:
+            upload_url = self.blob_backend.presigned_upload_url(attachment_id, input.mime_type)
+        upload_url = upload_url or f"{self.base_url}/upload/{attachment_id}"
 
         # Create appropriate attachment type based on MIME type
+        attachment: Attachment
         if input.mime_type.startswith("image/"):
-            # For images, also provide a preview URL
+            # For images, also provide a preview URL. It stays on our endpoint, which
+            # redirects to a fresh presigned URL, because it is saved with the thread
             preview_url = f"{self.base_url}/preview/{attachment_id}"
 
             attachment = ImageAttachment(
@@ -109,25 +213,100 @@ class FileBasedAttachmentStore(AttachmentStore[dict[str, Any]]):
         This is used by the ThreadItemConverter to create base64-encoded
         content for sending to the Agent Framework.
         """
-        file_path = self.get_file_path(attachment_id)
-        if not file_path.exists():
-            raise FileNotFoundError(f"Attachment {attachment_id} not found on disk")
+        if self.blob_backend is not None:
+            data = await self.blob_backend.get(attachment_id)
+        else:
+            data = await self.run_io(self._read_file, attachment_id)
+        self.record_access(attachment_id)
+        return data
+
+    def download_url(self, attachment_id: str) -> str | None:
+        """Presigned URL to fetch the original upload directly from storage, if supported."""
+        if self.blob_backend is None:
+            return None
+        return self.blob_backend.presigned_download_url(attachment_id)
+
+    async def read_derived_bytes(self, attachment_id: str, suffix: str) -> bytes:
+        """Read a file generated from an attachment, such as its thumbnail."""
+        data = await self.run_io(self.get_derived_path(attachment_id, suffix).read_bytes)
+        self.record_access(attachment_id)
+        return data
+
+    def _read_file(self, attachment_id: str) -> bytes:
+        try:
+            return self.get_file_path(attachment_id).read_bytes()
+        except FileNotFoundError:
+            pass
+        # Files uploaded before sharding stay readable until migrate_flat_layout runs
+        legacy_path = self.uploads_dir / attachment_id
+        if legacy_path.is_file():
+            return legacy_path.read_bytes()
+        raise FileNotFoundError(f"Attachment {attachment_id} not found on disk")
+
+    async def content_hash(self, attachment_id: str) -> str:
+        """Get the SHA-256 hex digest of an attachment's bytes.
+
+        Hashes are recorded by upload processing; files uploaded before a restart
+        or still being processed are hashed once on first request.
+        """
+        content_hash = self._content_hashes.get(attachment_id)
+        if content_hash is None:
+            data = await self.read_attachment_bytes(attachment_id)
+            content_hash = await self.run_io(lambda: hashlib.sha256(data).hexdigest())
+        self.record_content_hash(attachment_id, content_hash)
+        return content_hash
+
+    def record_content_hash(self, attachment_id: str, content_hash: str) -> None:
+        """Remember a hash computed elsewhere, e.g. by upload processing."""
+        self._content_hashes[attachment_id] = content_hash
+        self._content_hashes.move_to_end(attachment_id)
+        while len(self._content_hashes) > self.max_content_hashes:
+            self._content_hashes.popitem(last=False)
 
-        return file_path.read_bytes()
+    def forget_content_hash(self, attachment_id: str) -> None:
+        """Drop the cached hash of an attachment whose local copy was removed."""
+        self._content_hashes.pop(attachment_id, None)
 
-    async def store_attachment(self, attachment_id: str, data: bytes) -> bool:
+    async def store_attachment(self, attachment_id: str, data: bytes, content_type: str | None = None) -> bool:
         """Store the actual file data for an attachment.
 
         This is phase 2 of the two-phase upload - storing the bytes after
         the attachment metadata was created.
         """
         try:
-            file_path = self.get_file_path(attachment_id)
-            file_path.write_bytes(data)
+            if self.blob_backend is not None:
+                await self.blob_backend.put(attachment_id, data, content_type or self.get_content_type(attachment_id))
+            else:
+                await self.run_io(write_file_atomically, self.get_file_path(attachment_id), data)
+            self.forget_content_hash(attachment_id)
             return True
         except Exception:
             return False
 
+    def migrate_flat_layout(self) -> int:
+        """Move files from the pre-sharding flat layout into their shard directories.
+
+        Runs synchronously and is safe to re-run; see migrate_uploads.py.
+
+        Returns:
+            Number of files moved
+        """
+        moved = 0
+        for root, derived in ((self.uploads_dir, False), (self.derived_dir, True)):
+            with os.scandir(root) as entries:
+                for entry in entries:
+                    if not entry.is_file(follow_symlinks=False) or entry.name.startswith("."):
+                        continue
+                    # Derived files are named "<attachment id>.<suffix>"
+                    attachment_id = entry.name.split(".", 1)[0] if derived else entry.name
+                    target = shard_path(root, entry.name, attachment_id)
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(entry.path, target)
+                    moved += 1
+                    if moved % 10000 == 0:
+                        logger.info(f"Migrated {moved:,} files")
+        return moved
+
     def get_content_type(self, attachment_id: str) -> str:
         """Get the content type for an attachment based on its extension."""
         import mimetypes
@@ -0,0 +1,115 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""AviationStack response decoding for the flight tracking tools.
+
+The ``/v1/flights`` endpoint returns a ``data`` array that can hold hundreds of
+records for route and departure searches, while the flight tools usually only
+need the first one. The decoders in this module are written against that fixed
+schema and only materialise the records the caller asks for, building the frozen
+flight dataclasses directly instead of going through intermediate models.
+"""
+
+from itertools import islice
+from typing import Any
+
+from flight_widget import AirportInfo, FlightStatusData, LiveFlightData
+
+_EMPTY: dict[str, Any] = {}
+
+
+def _decode_airport(raw: dict[str, Any] | None) -> AirportInfo:
+    """Decode a ``departure`` or ``arrival`` block into an AirportInfo."""
+    if not raw:
+        return AirportInfo()
+    get = raw.get
+    return AirportInfo(
+        airport=get("airport") or "",
+        iata=get("iata") or "",
+        icao=get("icao") or "",
+        terminal=get("terminal"),
+        gate=get("gate"),
+        baggage=get("baggage"),
+        delay=get("delay"),
+        scheduled=get("scheduled"),
+        estimated=get("estimated"),
+        actual=get("actual"),
+        timezone=get("timezone"),
+    )
+
+
+def _decode_live(raw: dict[str, Any] | None) -> LiveFlightData | None:
+    """Decode the optional ``live`` block into a LiveFlightData."""
+    if not raw:
+        return None
+    get = raw.get
+    return LiveFlightData(
+        updated=get("updated"),
+        latitude=get("latitude"),
+        longitude=get("longitude"),
+        altitude=get("altitude"),
+        direction=get("direction"),
+        speed_horizontal=get("speed_horizontal"),
+        speed_vertical=get("speed_vertical"),
+        is_ground=bool(get("is_ground", False)),
+    )
+
+
+def _derive_status(
+    raw_status: str,
+    departure: AirportInfo,
+    arrival: AirportInfo,
+    live: LiveFlightData | None,
+) -> str:
+    """Derive the effective flight status, preferring live position data."""
+    if live is None:
+        return raw_status
+    if live.altitude and live.altitude > 0 and not live.is_ground:
+        return "active"  # In flight
+    if live.is_ground and departure.actual:
+        return "landed" if arrival.actual else "active"  # Taxiing or landed
+    return raw_status
+
+
+def decode_flight(record: dict[str, Any]) -> FlightStatusData:
+    """Decode a single AviationStack flight record.
+
+    Args:
+        record: One element of the response ``data`` array
+
+    Returns:
+        FlightStatusData with the effective status already derived
+    """
+    get = record.get
+    departure = _decode_airport(get("departure"))
+    arrival = _decode_airport(get("arrival"))
+    live = _decode_live(get("live"))
+    flight_info = get("flight") or _EMPTY
+    airline = get("airline") or _EMPTY
+
+    return FlightStatusData(
+        flight_date=get("flight_date") or "",
+        flight_status=_derive_status(get("flight_status") or "scheduled", departure, arrival, live),
+        flight_iata=flight_info.get("iata") or "",
+        flight_number=flight_info.get("number") or "",
+        airline_name=airline.get("name") or "",
+        airline_iata=airline.get("iata") or "",
+        departure=departure,
+        arrival=arrival,
+        live=live,
+    )
+
+
+def decode_flights(payload: dict[str, Any], limit: int | None = 1) -> list[FlightStatusData]:
+    """Decode the ``data`` array of an AviationStack ``/v1/flights`` response.
+
+    Args:
+        payload: The decoded JSON response body
+        limit: Maximum number of records to decode, or None for every leg
+
+    Returns:
+        Decoded flights in response order (empty if there are none)
+    """
+    records = payload.get("data") or []
+    if limit is not None:
+        records = islice(records, limit)
+    return [decode_flight(record) for record in records]
@@ -0,0 +1,136 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Pluggable blob storage for uploaded attachment bytes.
+
+By default FileBasedAttachmentStore keeps uploads on local disk and every byte
+is uploaded and served through the app. A BlobBackend moves the original bytes
+to external storage instead; backends that support presigned URLs let clients
+upload and download directly, so the app process only signs URLs.
+
+S3BlobBackend works with AWS S3 and S3-compatible stores such as MinIO. It needs
+the optional ``boto3`` dependency (``pip install maf-chatkit-integration[s3]``).
+"""
+
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class BlobBackend(ABC):
+    """Storage for attachment bytes, keyed by attachment id."""
+
+    @abstractmethod
+    async def put(self, key: str, data: bytes, content_type: str) -> None:
+        """Store bytes under ``key``, replacing any existing blob."""
+
+    @abstractmethod
+    async def get(self, key: str) -> bytes:
+        """Read the bytes stored under ``key``.
+
+        Raises:
+            FileNotFoundError: If there is no such blob
+        """
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """Delete the blob under ``key`` if it exists."""
+
+    def presigned_upload_url(self, key: str, content_type: str) -> str | None:
+        """URL a client can PUT the bytes to directly, or None to upload through the app."""
+        return None
+
+    def presigned_download_url(self, key: str) -> str | None:
+        """Short-lived URL a client can GET the bytes from directly, or None to serve through the app."""
+        return None
+
+
+class S3BlobBackend(BlobBackend):
+    """BlobBackend for S3 and S3-compatible object storage.
+
+    boto3 is synchronous, so calls run on a small dedicated thread pool.
+    Presigning is a local HMAC computation and needs no network round-trip.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "uploads/",
+        endpoint_url: str | None = None,
+        region_name: str | None = None,
+        url_expiry: int = 900,
+        direct_uploads: bool = True,
+        client: Any | None = None,
+        max_workers: int = 8,
+    ):
+        """Initialize the backend.
+
+        Args:
+            bucket: Bucket holding the uploads
+            prefix: Key prefix for uploads within the bucket
+            endpoint_url: Endpoint of an S3-compatible store such as MinIO, or None for AWS
+            region_name: Region of the bucket
+            url_expiry: Seconds presigned URLs stay valid
+            direct_uploads: Whether clients are given presigned PUT URLs. Disable for
+                clients that can only POST multipart forms to the app
+            client: Preconfigured boto3 S3 client, created from the other arguments if omitted
+            max_workers: Threads used for blocking boto3 calls
+        """
+        if client is None:
+            try:
+                import boto3  # type: ignore[import-untyped]
+            except ImportError as e:
+                raise ImportError("S3BlobBackend requires boto3: pip install 'maf-chatkit-integration[s3]'") from e
+            client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region_name)
+
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.url_expiry = url_expiry
+        self.direct_uploads = direct_uploads
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s3-blob")
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    async def _call(self, method: str, **kwargs: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: getattr(self.client, method)(**kwargs))
+
+    async def put(self, key: str, data: bytes, content_type: str) -> None:
+        await self._call("put_object", Bucket=self.bucket, Key=self._key(key), Body=data, ContentType=content_type)
+
+    async def get(self, key: str) -> bytes:
+        try:
+            response = await self._call("get_object", Bucket=self.bucket, Key=self._key(key))
+        except self.client.exceptions.NoSuchKey as e:
+            raise FileNotFoundError(f"Blob {key} not found in s3://{self.bucket}") from e
+        body = response["Body"]
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, body.read)
+        finally:
+            body.close()
+
+    async def delete(self, key: str) -> None:
+        await self._call("delete_object", Bucket=self.bucket, Key=self._key(key))
+
+    def presigned_upload_url(self, key: str, content_type: str) -> str | None:
+        if not self.direct_uploads:
+            return None
+        url: str = self.client.generate_presigned_url(
+            "put_object",
+            Params={"Bucket": self.bucket, "Key": self._key(key), "ContentType": content_type},
+            ExpiresIn=self.url_expiry,
+        )
+        return url
+
+    def presigned_download_url(self, key: str) -> str | None:
+        url: str = self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._key(key)},
+            ExpiresIn=self.url_expiry,
+        )
+        return url
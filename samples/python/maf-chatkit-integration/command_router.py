@@ -0,0 +1,71 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Deterministic routing of parameter-free widget requests.
+
+"Show me popular airports" used to cost an intent-classification call plus a
+full agent run, in which the model called ``show_airport_selector`` just to
+get a marker string back, and the widget only appeared once the model had
+finished its reply. These requests have no parameters, so
+``match_widget_command`` recognises them locally and ``respond`` renders the
+widget straight away.
+
+Matching is deliberately strict: polite filler and display verbs are removed,
+and what remains must be exactly one of a command's phrases. Anything more
+specific ("airports near Sydney") goes to the agent as before.
+"""
+
+import re
+
+
+class WidgetCommand:
+    """Widgets that can be rendered without the agent."""
+    AIRPORT_SELECTOR = "airport_selector"
+    ROUTE_SELECTOR = "route_selector"
+    PARKING_PROMPT = "parking_prompt"
+
+
+# Word sequences left after removing filler, for each command
+_COMMAND_PHRASES: dict[str, set[tuple[str, ...]]] = {
+    WidgetCommand.AIRPORT_SELECTOR: {
+        ("airports",),
+        ("airport",),
+        ("airport", "selector"),
+    },
+    WidgetCommand.ROUTE_SELECTOR: {
+        ("routes",),
+        ("route",),
+        ("flight", "routes"),
+        ("route", "selector"),
+    },
+    WidgetCommand.PARKING_PROMPT: {
+        ("parking", "sign"),
+        ("parking", "signs"),
+    },
+}
+
+_FILLER_WORDS = {
+    "a", "all", "an", "analyse", "analyze", "available", "browse", "can", "check", "choose", "could",
+    "display", "give", "i", "id", "like", "list", "me", "my", "of", "pick", "please", "popular", "read",
+    "see", "select", "show", "some", "the", "to", "want", "would", "you",
+}
+
+_WORD = re.compile(r"[a-z]+")
+
+
+def match_widget_command(text: str) -> str | None:
+    """Recognise a request for one of the parameter-free widgets.
+
+    Args:
+        text: The user's message
+
+    Returns:
+        A WidgetCommand value, or None if the message needs the agent
+    """
+    words = _WORD.findall(text.lower().replace("'", ""))
+    if not words or len(words) > 12:
+        return None
+    remaining = tuple(word for word in words if word not in _FILLER_WORDS)
+    for command, phrases in _COMMAND_PHRASES.items():
+        if remaining in phrases:
+            return command
+    return None
@@ -0,0 +1,219 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Live flight tracking with shared background pollers.
+
+Each tracked flight gets exactly one background poller, no matter how many
+users or threads are watching it. Subscribers receive every new status the
+poller fetches, and the poller stops once the last subscriber leaves or the
+flight reaches a final state. Poll intervals adapt to the flight's phase so
+cruising or far-off flights don't burn AviationStack quota.
+"""
+
+import asyncio
+import logging
+from collections.abc import AsyncIterator, Awaitable, Callable
+from datetime import datetime, timezone
+from typing import Any
+
+from flight_widget import FlightStatusData
+
+logger = logging.getLogger(__name__)
+
+# (flight_iata, dep_iata, arr_iata) as passed to fetch_flight_status
+FlightKey = tuple[str | None, str | None, str | None]
+
+# Statuses after which nothing will change
+FINAL_STATUSES = frozenset({"landed", "cancelled", "incident", "diverted"})
+
+# Poll intervals in seconds for each flight phase
+INTERVAL_TAXIING = 60
+INTERVAL_APPROACH = 120  # Arriving within APPROACH_WINDOW
+INTERVAL_CRUISE = 300
+INTERVAL_DEPARTING_SOON = 180  # Departing within 1 hour
+INTERVAL_SCHEDULED = 600  # Departing within 3 hours
+INTERVAL_FAR_OFF = 1800
+INTERVAL_MAX_BACKOFF = 1800
+
+APPROACH_WINDOW = 30 * 60
+
+
+def _seconds_until(time_str: str | None) -> float | None:
+    """Seconds from now until an ISO timestamp, or None if it can't be parsed."""
+    if not time_str:
+        return None
+    try:
+        moment = datetime.fromisoformat(time_str.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return (moment - datetime.now(timezone.utc)).total_seconds()
+
+
+def poll_interval(data: FlightStatusData) -> float | None:
+    """Pick the next poll interval for a flight, or None to stop polling.
+
+    Args:
+        data: The most recent status of the flight
+
+    Returns:
+        Seconds until the next poll, or None once the flight is in a final state
+    """
+    status = data.flight_status.lower()
+    if status in FINAL_STATUSES:
+        return None
+
+    if status == "active":
+        if data.live and data.live.is_ground:
+            return INTERVAL_TAXIING
+        until_arrival = _seconds_until(data.arrival.estimated or data.arrival.scheduled)
+        if until_arrival is not None and until_arrival <= APPROACH_WINDOW:
+            return INTERVAL_APPROACH
+        return INTERVAL_CRUISE
+
+    until_departure = _seconds_until(data.departure.estimated or data.departure.scheduled)
+    if until_departure is None or until_departure <= 3600:
+        return INTERVAL_DEPARTING_SOON
+    if until_departure <= 3 * 3600:
+        return INTERVAL_SCHEDULED
+    return INTERVAL_FAR_OFF
+
+
+class _Poller:
+    """Background task polling one flight and fanning updates out to subscribers."""
+
+    def __init__(self, key: FlightKey, fetch: Callable[[FlightKey], Awaitable[FlightStatusData | str]]):
+        self.key = key
+        self.fetch = fetch
+        self.latest: FlightStatusData | None = None
+        self.polls = 0
+        self.subscribers: set[asyncio.Queue[FlightStatusData | None]] = set()
+        self.task = asyncio.create_task(self._run(), name=f"flight-poller-{key}")
+
+    def subscribe(self) -> asyncio.Queue[FlightStatusData | None]:
+        queue: asyncio.Queue[FlightStatusData | None] = asyncio.Queue()
+        if self.latest is not None:
+            queue.put_nowait(self.latest)
+        self.subscribers.add(queue)
+        return queue
+
+    def _publish(self, data: FlightStatusData | None) -> None:
+        for queue in self.subscribers:
+            # A slow subscriber only ever needs the newest status, but must
+            # still see it before the end-of-stream marker (None)
+            if data is not None:
+                while not queue.empty():
+                    queue.get_nowait()
+            queue.put_nowait(data)
+
+    async def _run(self) -> None:
+        backoff = INTERVAL_TAXIING
+        try:
+            while True:
+                result = await self.fetch(self.key)
+                self.polls += 1
+
+                if isinstance(result, str):
+                    # Keep the last known status and back off
+                    logger.warning(f"Flight poller {self.key}: {result}")
+                    backoff = min(backoff * 2, INTERVAL_MAX_BACKOFF)
+                    await asyncio.sleep(backoff)
+                    continue
+
+                backoff = INTERVAL_TAXIING
+                if result != self.latest:
+                    self.latest = result
+                    self._publish(result)
+
+                interval = poll_interval(result)
+                if interval is None:
+                    logger.info(f"Flight poller {self.key}: final status '{result.flight_status}', stopping")
+                    return
+                logger.debug(f"Flight poller {self.key}: next poll in {interval}s")
+                await asyncio.sleep(interval)
+        finally:
+            # Tell every subscriber the stream has ended
+            self._publish(None)
+
+
+class FlightTracker:
+    """Registry of shared flight pollers, deduplicated by flight."""
+
+    def __init__(
+        self,
+        fetch: Callable[[FlightKey], Awaitable[FlightStatusData | str]],
+        max_watch_seconds: float = 6 * 3600,
+    ):
+        """Initialize the tracker.
+
+        Args:
+            fetch: Fetches the current status for a flight key
+            max_watch_seconds: Longest time a single subscriber is kept watching
+        """
+        self.fetch = fetch
+        self.max_watch_seconds = max_watch_seconds
+        self._pollers: dict[FlightKey, _Poller] = {}
+
+    @staticmethod
+    def make_key(flight_iata: str | None, dep_iata: str | None = None, arr_iata: str | None = None) -> FlightKey:
+        """Normalise lookup parameters so equivalent requests share a poller."""
+        return (
+            flight_iata.upper() if flight_iata else None,
+            dep_iata.upper() if dep_iata else None,
+            arr_iata.upper() if arr_iata else None,
+        )
+
+    def _get_poller(self, key: FlightKey) -> _Poller:
+        poller = self._pollers.get(key)
+        if poller is None or poller.task.done():
+            logger.info(f"Starting flight poller for {key}")
+            poller = _Poller(key, self.fetch)
+            self._pollers[key] = poller
+        return poller
+
+    def _release(self, poller: _Poller, queue: asyncio.Queue[FlightStatusData | None]) -> None:
+        poller.subscribers.discard(queue)
+        if not poller.subscribers:
+            logger.info(f"No more watchers for {poller.key}, stopping poller")
+            poller.task.cancel()
+            if self._pollers.get(poller.key) is poller:
+                del self._pollers[poller.key]
+
+    async def watch(
+        self,
+        flight_iata: str | None,
+        dep_iata: str | None = None,
+        arr_iata: str | None = None,
+    ) -> AsyncIterator[FlightStatusData]:
+        """Yield each new status of a flight until it reaches a final state.
+
+        The first value is the poller's latest status if one is already known.
+        Iteration also ends after ``max_watch_seconds``.
+        """
+        key = self.make_key(flight_iata, dep_iata, arr_iata)
+        poller = self._get_poller(key)
+        queue = poller.subscribe()
+        loop = asyncio.get_running_loop()
+        ends_at = loop.time() + self.max_watch_seconds
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(queue.get(), timeout=ends_at - loop.time())
+                except asyncio.TimeoutError:
+                    return
+                if data is None:
+                    return
+                yield data
+        finally:
+            self._release(poller, queue)
+
+    def metrics(self) -> dict[str, Any]:
+        """Active pollers and how many watchers share each one."""
+        return {
+            "pollers": len(self._pollers),
+            "watchers": sum(len(p.subscribers) for p in self._pollers.values()),
+            "flights": {
+                " ".join(part for part in key if part): {"watchers": len(p.subscribers), "polls": p.polls}
+                for key, p in self._pollers.items()
+            },
+        }
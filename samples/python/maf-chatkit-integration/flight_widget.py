@@ -7,7 +7,7 @@ from dataclasses import dataclass, field
 from datetime import datetime
 
 from chatkit.actions import ActionConfig
-from chatkit.widgets import Box, Button, Card, Col, Image, Row, Text, Title, WidgetRoot
+from chatkit.widgets import Box, Button, Card, Col, Image, Row, Text, Title, WidgetComponent, WidgetRoot
 
 # Flight widget colors
 FLIGHT_ICON_COLOR = "#0369A1"  # Sky blue
@@ -43,7 +43,7 @@ POPULAR_ROUTES = [
 ]
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class LiveFlightData:
     """Live tracking data for in-flight aircraft."""
 
@@ -57,7 +57,7 @@ class LiveFlightData:
     is_ground: bool = False
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class AirportInfo:
     """Airport information."""
 
@@ -74,7 +74,7 @@ class AirportInfo:
     timezone: str | None = None
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class FlightStatusData:
     """Flight status data container matching AviationStack API response."""
 
@@ -218,11 +218,24 @@ def _detail_chip(label: str, value: str, icon: str | None = None) -> Box:
     )
 
 
-def render_flight_widget(data: FlightStatusData) -> WidgetRoot:
+def _status_display(status: str, is_ground: bool | None) -> str:
+    """Get the user-facing label for a flight status."""
+    return {
+        "scheduled": "Scheduled",
+        "active": "In Flight" if not is_ground else "Departing",
+        "landed": "Landed",
+        "cancelled": "Cancelled",
+        "incident": "Incident",
+        "diverted": "Diverted",
+    }.get(status, status.title())
+
+
+def render_flight_widget(data: FlightStatusData, tracking: bool = False) -> WidgetRoot:
     """Render a flight status widget with expandable details.
 
     Args:
         data: FlightStatusData containing flight information
+        tracking: Whether the widget is being updated live by a flight poller
 
     Returns:
         A ChatKit WidgetRoot (Card) displaying the flight status
@@ -235,14 +248,7 @@ def render_flight_widget(data: FlightStatusData) -> WidgetRoot:
     status_icon = _get_status_icon(status, is_ground)
 
     # Format status display
-    status_display = {
-        "scheduled": "Scheduled",
-        "active": "In Flight" if not is_ground else "Departing",
-        "landed": "Landed",
-        "cancelled": "Cancelled",
-        "incident": "Incident",
-        "diverted": "Diverted",
-    }.get(status, status.title())
+    status_display = _status_display(status, is_ground)
 
     # Build header section
     header = Box(
@@ -427,7 +433,11 @@ def render_flight_widget(data: FlightStatusData) -> WidgetRoot:
                         radius="full",
                         background="blue-500" if is_active else "gray-200",
                         children=[
-                            Text(value="✓" if is_active else str(i + 1), size="xs", color="white" if is_active else "tertiary")
+                            Text(
+                                value="✓" if is_active else str(i + 1),
+                                size="xs",
+                                color="white" if is_active else "tertiary",
+                            )
                         ],
                     ),
                     Text(value=stage, size="xs", color="secondary" if is_active else "tertiary"),
@@ -446,10 +456,46 @@ def render_flight_widget(data: FlightStatusData) -> WidgetRoot:
         ],
     )
 
+    children = [header, route_section, progress_section, details_section]
+
+    # Live tracking footer - either the live indicator or a button to start tracking
+    if tracking:
+        updated_at = datetime.now().strftime("%H:%M")
+        children.append(
+            Box(
+                padding=4,
+                background="blue-50",
+                children=[
+                    Text(value=f"🔴 Tracking live · updated {updated_at}", size="xs", color="secondary"),
+                ],
+            )
+        )
+    elif status not in ("landed", "cancelled", "incident", "diverted"):
+        children.append(
+            Box(
+                padding=4,
+                children=[
+                    Button(
+                        label="Track live",
+                        variant="outline",
+                        size="sm",
+                        onClickAction=ActionConfig(
+                            type="track_flight",
+                            payload={
+                                "flight_iata": data.flight_iata,
+                                "dep_iata": data.departure.iata,
+                            },
+                            handler="server",
+                        ),
+                    ),
+                ],
+            )
+        )
+
     return Card(
         key="flight_status",
         padding=0,
-        children=[header, route_section, progress_section, details_section],
+        children=children,
     )
 
 
@@ -492,6 +538,173 @@ def flight_widget_copy_text(data: FlightStatusData) -> str:
     return "\n".join(lines)
 
 
+def _flight_list_row(data: FlightStatusData) -> Box:
+    """Create a compact summary row for one flight in a multi-flight widget."""
+    status = data.flight_status.lower()
+    status_style = STATUS_COLORS.get(status, STATUS_COLORS["scheduled"])
+    is_ground = data.live.is_ground if data.live else None
+
+    return Box(
+        padding=4,
+        radius="lg",
+        background="surface-tertiary",
+        children=[
+            Row(
+                justify="between",
+                align="center",
+                gap=3,
+                children=[
+                    Row(
+                        gap=3,
+                        align="center",
+                        children=[
+                            Image(
+                                src=_get_status_icon(status, is_ground),
+                                alt="Flight",
+                                size=24,
+                                fit="contain",
+                            ),
+                            Col(
+                                align="start",
+                                gap=1,
+                                children=[
+                                    Text(
+                                        value=data.flight_iata or f"{data.airline_iata}{data.flight_number}",
+                                        weight="bold",
+                                        size="sm",
+                                    ),
+                                    Text(value=data.airline_name, size="xs", color="tertiary"),
+                                ],
+                            ),
+                        ],
+                    ),
+                    Col(
+                        align="center",
+                        gap=1,
+                        children=[
+                            Text(
+                                value=f"{data.departure.iata} → {data.arrival.iata}",
+                                weight="semibold",
+                                size="sm",
+                            ),
+                            Text(
+                                value=(
+                                    f"{_format_time(data.departure.scheduled)} - "
+                                    f"{_format_time(data.arrival.scheduled)}"
+                                ),
+                                size="xs",
+                                color="secondary",
+                            ),
+                        ],
+                    ),
+                    Box(
+                        padding={"x": 3, "y": 1},
+                        radius="full",
+                        background=status_style["bg"],
+                        children=[
+                            Text(
+                                value=_status_display(status, is_ground),
+                                size="xs",
+                                weight="semibold",
+                                color=status_style["text"],
+                            )
+                        ],
+                    ),
+                ],
+            ),
+        ],
+    )
+
+
+def render_flight_list_widget(flights: list[FlightStatusData], errors: list[str] | None = None) -> WidgetRoot:
+    """Render a combined widget for several flights looked up together.
+
+    Args:
+        flights: FlightStatusData for each flight that was found
+        errors: Messages for lookups that failed, shown below the flights
+
+    Returns:
+        A ChatKit WidgetRoot (Card) with one summary row per flight
+    """
+    header = Box(
+        padding=5,
+        background="surface-tertiary",
+        children=[
+            Row(
+                gap=3,
+                align="center",
+                children=[
+                    Box(
+                        padding=3,
+                        radius="full",
+                        background="blue-100",
+                        children=[
+                            Image(
+                                src=AIRPLANE_ICON,
+                                alt="Flights",
+                                size=28,
+                                fit="contain",
+                            )
+                        ],
+                    ),
+                    Col(
+                        align="start",
+                        gap=1,
+                        children=[
+                            Title(
+                                value=f"{len(flights)} Flight{'s' if len(flights) != 1 else ''}",
+                                size="md",
+                                weight="semibold",
+                            ),
+                            Text(
+                                value="Live status for your flights",
+                                color="tertiary",
+                                size="xs",
+                            ),
+                        ],
+                    ),
+                ],
+            ),
+        ],
+    )
+
+    rows: list[WidgetComponent] = [_flight_list_row(flight) for flight in flights]
+    for error in errors or []:
+        rows.append(
+            Box(
+                padding=3,
+                radius="md",
+                background="red-50",
+                children=[Text(value=f"⚠️ {error}", size="xs", color="secondary")],
+            )
+        )
+
+    flights_section = Box(
+        padding=5,
+        gap=3,
+        children=rows if rows else [Text(value="No flights found", size="xs", color="tertiary")],
+    )
+
+    return Card(
+        key="flight_list",
+        padding=0,
+        children=[header, flights_section],
+    )
+
+
+def flight_list_copy_text(flights: list[FlightStatusData], errors: list[str] | None = None) -> str:
+    """Generate plain text representation of a multi-flight widget."""
+    lines = [
+        f"{data.flight_iata or data.flight_number} ({data.airline_name}): "
+        f"{data.departure.iata} {_format_time(data.departure.scheduled)} → "
+        f"{data.arrival.iata} {_format_time(data.arrival.scheduled)}, "
+        f"Status: {data.flight_status.title()}"
+        for data in flights
+    ]
+    lines.extend(f"Error: {error}" for error in errors or [])
+    return "\n".join(lines)
+
+
 def render_airport_selector_widget() -> WidgetRoot:
     """Render an interactive airport selector widget.
 
@@ -2,6 +2,9 @@
 
 import { ChatKit, useChatKit } from "@openai/chatkit-react";
 
+import { withClientId } from "./clientId";
+import { resumableFetch } from "./resumableFetch";
+
 /**
  * SwiftRover - AI Travel Assistant
  * 
@@ -22,6 +25,9 @@ export default function App() {
     api: {
       url: CHATKIT_API_URL,
       domainKey: CHATKIT_API_DOMAIN_KEY,
+      // Resumes a response stream that drops mid-turn instead of losing the rest of it, and
+      // tags each request with this browser's id for the backend's per-user admission caps
+      fetch: withClientId(resumableFetch),
       uploadStrategy: { type: "two_phase" },
     },
     startScreen: {
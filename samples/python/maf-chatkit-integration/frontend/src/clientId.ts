@@ -0,0 +1,33 @@
+// Copyright (c) Microsoft. All rights reserved.
+
+/**
+ * Random per-browser id sent with every ChatKit request.
+ *
+ * The sample has no sign-in, so the backend keys its per-user admission caps
+ * on this `X-Client-Id` header instead. It is a fairness key, not an identity:
+ * it keeps one browser from filling a pool, but proves nothing about who sent
+ * the request.
+ */
+
+const STORAGE_KEY = "swiftrover-client-id";
+const CLIENT_ID_HEADER = "X-Client-Id";
+
+function clientId(): string {
+  let id = localStorage.getItem(STORAGE_KEY);
+  if (!id) {
+    id = crypto.randomUUID();
+    localStorage.setItem(STORAGE_KEY, id);
+  }
+  return id;
+}
+
+type Fetch = (input: RequestInfo | URL, init?: RequestInit) => Promise<Response>;
+
+/** Wraps a fetch implementation so every request, resumes included, carries the client id. */
+export function withClientId(fetchImpl: Fetch): Fetch {
+  return (input, init) => {
+    const headers = new Headers(init?.headers);
+    headers.set(CLIENT_ID_HEADER, clientId());
+    return fetchImpl(input, { ...init, headers });
+  };
+}
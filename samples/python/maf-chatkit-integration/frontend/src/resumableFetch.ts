@@ -0,0 +1,128 @@
+// Copyright (c) Microsoft. All rights reserved.
+
+/**
+ * fetch wrapper that resumes dropped ChatKit response streams.
+ *
+ * The backend tags every streamed event with an SSE `id:` and keeps each turn
+ * running for a short grace period after its connection drops. When a stream
+ * breaks mid-turn, this wrapper re-sends the request with a `Last-Event-ID`
+ * header and splices the replayed events onto the same response body, so
+ * ChatKit sees one uninterrupted stream and the turn is not run twice.
+ *
+ * Only complete events (terminated by a blank line) are passed on, so a
+ * half-received event is never duplicated by the replay. The backend ends
+ * every finished turn with an END_OF_TURN comment; a body that ends without it
+ * was cut off, even if the browser reports a normal end.
+ */
+
+const MAX_RESUME_ATTEMPTS = 5;
+const RESUME_BACKOFF_MS = 500;
+const END_OF_TURN = ": end of turn";
+
+function sleep(ms: number): Promise<void> {
+  return new Promise((resolve) => setTimeout(resolve, ms));
+}
+
+/** The SSE id of a complete event, if it has one. */
+function eventId(event: string): string | null {
+  for (const line of event.split("\n")) {
+    if (line.startsWith("id:")) {
+      return line.slice(3).trim();
+    }
+  }
+  return null;
+}
+
+export async function resumableFetch(input: RequestInfo | URL, init?: RequestInit): Promise<Response> {
+  const response = await fetch(input, init);
+  const contentType = response.headers.get("content-type") ?? "";
+  if (!response.ok || !response.body || !contentType.includes("text/event-stream")) {
+    return response;
+  }
+
+  const encoder = new TextEncoder();
+  let reader = response.body.getReader();
+  let decoder = new TextDecoder();
+  let pending = "";
+  let lastEventId: string | null = null;
+  let ended = false;
+  let attempts = 0;
+
+  const reconnect = async (): Promise<boolean> => {
+    while (lastEventId && attempts < MAX_RESUME_ATTEMPTS) {
+      attempts += 1;
+      await sleep(RESUME_BACKOFF_MS * attempts);
+      try {
+        const headers = new Headers(init?.headers);
+        headers.set("Last-Event-ID", lastEventId);
+        const resumed = await fetch(input, { ...init, headers });
+        if (resumed.status === 410) {
+          return false; // The turn expired or fell out of the server's buffer
+        }
+        if (resumed.ok && resumed.body) {
+          reader = resumed.body.getReader();
+          decoder = new TextDecoder();
+          pending = "";
+          return true;
+        }
+      } catch {
+        // Still offline; try again after a longer pause
+      }
+    }
+    return false;
+  };
+
+  const body = new ReadableStream<Uint8Array>({
+    async pull(controller) {
+      for (;;) {
+        let chunk: ReadableStreamReadResult<Uint8Array>;
+        try {
+          chunk = await reader.read();
+        } catch (error) {
+          if (init?.signal?.aborted || !(await reconnect())) {
+            controller.error(error);
+            return;
+          }
+          continue;
+        }
+        if (chunk.done) {
+          if (!ended && !init?.signal?.aborted && (await reconnect())) {
+            continue; // Cut off before the turn finished
+          }
+          if (pending) {
+            controller.enqueue(encoder.encode(pending));
+          }
+          controller.close();
+          return;
+        }
+
+        pending += decoder.decode(chunk.value, { stream: true });
+        const boundary = pending.lastIndexOf("\n\n");
+        if (boundary < 0) {
+          continue;
+        }
+        const events = pending.slice(0, boundary).split("\n\n");
+        pending = pending.slice(boundary + 2);
+        let complete = "";
+        for (const event of events) {
+          if (event === END_OF_TURN) {
+            ended = true;
+            continue;
+          }
+          lastEventId = eventId(event) ?? lastEventId;
+          complete += event + "\n\n";
+        }
+        attempts = 0;
+        if (complete) {
+          controller.enqueue(encoder.encode(complete));
+          return;
+        }
+      }
+    },
+    cancel(reason) {
+      return reader.cancel(reason);
+    },
+  });
+
+  return new Response(body, { status: response.status, statusText: response.statusText, headers: response.headers });
+}
@@ -0,0 +1,278 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Rolling-summary compaction of long thread histories.
+
+``respond`` used to convert up to 1000 thread items into agent messages on
+every turn, each widget as its full JSON tree, so prompt size, latency and
+cost grew without bound on long-lived travel threads. Past 1000 items it
+also sent the oldest items and dropped the newest.
+
+HistoryCompactor keeps the last few turns verbatim and stands in a rolling
+summary for everything older. The summary lives in the thread's metadata. Once
+the turns between the summary and the verbatim window grow past a token
+threshold, a background task folds them into the summary, a chunk at a time,
+so no turn waits for summarisation. Until it finishes, those turns are simply
+sent verbatim as before.
+"""
+
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable, Sequence
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import TYPE_CHECKING, Any
+
+from agent_framework import ChatMessage, Role
+from chatkit.types import (
+    AssistantMessageItem,
+    CustomSummary,
+    ThreadItem,
+    ThreadMetadata,
+    UserMessageItem,
+    WidgetItem,
+    WorkflowItem,
+)
+
+from attachment_cache import CachedAttachmentConverter
+
+if TYPE_CHECKING:
+    from store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+# Thread metadata key holding the rolling summary
+SUMMARY_KEY = "history_summary"
+
+# Items per store read when paging through a thread
+_PAGE_ITEMS = 50
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: about four characters per token."""
+    return (len(text) + 3) // 4
+
+
+def item_transcript(item: ThreadItem) -> str | None:
+    """Render a thread item as one condensed transcript line, or None to skip it."""
+    if isinstance(item, UserMessageItem):
+        text = " ".join(part.text for part in item.content if hasattr(part, "text")).strip()
+        if item.attachments:
+            text += f" [{len(item.attachments)} attachment(s)]"
+        return f"User: {text}"
+    if isinstance(item, AssistantMessageItem):
+        return "Assistant: " + " ".join(part.text for part in item.content).strip()
+    if isinstance(item, WidgetItem):
+        return f"Widget shown: {item.copy_text}" if item.copy_text else "Widget shown."
+    if isinstance(item, WorkflowItem) and isinstance(item.workflow.summary, CustomSummary):
+        return f"Assistant worked on: {item.workflow.summary.title}"
+    return None
+
+
+@dataclass
+class HistorySummary:
+    """Rolling summary of a thread up to and including one item."""
+
+    text: str
+    through_item_id: str
+    through_created_at: str  # ISO timestamp of that item
+    items_summarised: int
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any] | None) -> "HistorySummary | None":
+        return cls(**data) if data else None
+
+
+class HistoryConverter(CachedAttachmentConverter):
+    """Converter that sends widgets as their copy text instead of their full JSON tree."""
+
+    def widget_to_input(self, item: WidgetItem) -> ChatMessage | list[ChatMessage] | None:
+        """Condense a widget to its copy text; widgets without one keep the default JSON."""
+        if item.copy_text:
+            return ChatMessage(role=Role.USER, text=f"A widget was displayed to the user showing:\n{item.copy_text}")
+        return super().widget_to_input(item)
+
+
+class HistoryCompactor:
+    """Builds agent input from the last turns plus a rolling summary of older ones.
+
+    Features:
+    - Last ``keep_turns`` turns sent verbatim, older turns replaced by a persisted summary
+    - Only the newest ``window_items`` items are ever loaded for a turn
+    - Summary regenerated incrementally in the background past ``summarise_after_tokens``
+    - At most one summarisation per thread at a time
+    - Prompt and summary counters for the /metrics/history endpoint
+    """
+
+    def __init__(
+        self,
+        store: "SQLiteStore",
+        converter: CachedAttachmentConverter,
+        summarise: Callable[[str, str], Awaitable[str]],
+        keep_turns: int = 6,
+        summarise_after_tokens: int = 4000,
+        chunk_tokens: int = 12000,
+        window_items: int = 400,
+        count_tokens: Callable[[str], int] = estimate_tokens,
+    ):
+        """Initialize the compactor.
+
+        Args:
+            store: Store the thread items and metadata are read from and written to
+            converter: Converts thread items to agent messages
+            summarise: Folds a transcript into a summary: (previous summary, transcript) -> summary
+            keep_turns: Most recent turns always sent verbatim
+            summarise_after_tokens: Unsummarised tokens outside the verbatim turns that
+                trigger a summary update
+            chunk_tokens: Transcript tokens folded into the summary per model call
+            window_items: Newest items loaded per turn
+            count_tokens: Counts the tokens in a string
+        """
+        self.store = store
+        self.converter = converter
+        self._summarise = summarise
+        self.keep_turns = keep_turns
+        self.summarise_after_tokens = summarise_after_tokens
+        self.chunk_tokens = chunk_tokens
+        self.window_items = window_items
+        self._count_tokens = count_tokens
+
+        self._tasks: dict[str, asyncio.Task[None]] = {}
+        self._latest: dict[str, HistorySummary] = {}  # Summaries not yet seen by a turn
+
+        self._turns = 0
+        self._prompt_tokens = 0
+        self._summaries = 0
+        self._summary_failures = 0
+
+    async def agent_input(self, thread: ThreadMetadata, context: dict[str, Any]) -> list[ChatMessage]:
+        """Build the agent messages for a turn.
+
+        A summary finished in the background since the last turn is adopted into
+        ``thread.metadata``, which ChatKit saves with the thread.
+
+        Args:
+            thread: The thread being answered
+            context: Request context for the store
+
+        Returns:
+            The summary (if any) as a system message, then the unsummarised items
+        """
+        summary = HistorySummary.from_dict(thread.metadata.get(SUMMARY_KEY))
+        latest = self._latest.pop(thread.id, None)
+        if latest is not None and (summary is None or latest.through_created_at > summary.through_created_at):
+            summary = latest
+            thread.metadata[SUMMARY_KEY] = asdict(summary)
+
+        # Page back from the newest item until the summary takes over or the window is full
+        items: list[ThreadItem] = []
+        after = None
+        gap = True  # Items older than the window that the summary doesn't cover yet
+        while len(items) < self.window_items:
+            page = await self.store.load_thread_items(
+                thread.id, after, min(_PAGE_ITEMS, self.window_items - len(items)), "desc", context
+            )
+            for item in page.data:
+                if summary is not None and item.created_at.isoformat() <= summary.through_created_at:
+                    gap = False
+                    break
+                items.append(item)
+            if not gap or not page.has_more:
+                gap = False
+                break
+            after = page.data[-1].id
+        items.reverse()
+
+        verbatim_start = self._verbatim_start(items)
+        older_tokens = sum(self._count_tokens(item_transcript(item) or "") for item in items[:verbatim_start])
+        if (gap or older_tokens > self.summarise_after_tokens) and thread.id not in self._tasks and verbatim_start:
+            boundary = items[verbatim_start].created_at.isoformat() if verbatim_start < len(items) else None
+            self._tasks[thread.id] = asyncio.create_task(
+                self._update_summary(thread.id, summary, boundary, context), name=f"history-summary-{thread.id}"
+            )
+
+        messages: list[ChatMessage] = []
+        if summary is not None:
+            messages.append(
+                ChatMessage(role=Role.SYSTEM, text=f"Summary of the earlier conversation:\n{summary.text}")
+            )
+        messages.extend(await self.converter.to_agent_input(items))
+
+        self._turns += 1
+        self._prompt_tokens += sum(self._count_tokens(message.text or "") for message in messages)
+        return messages
+
+    def _verbatim_start(self, items: Sequence[ThreadItem]) -> int:
+        """Index of the first item of the last ``keep_turns`` turns."""
+        user_messages = [index for index, item in enumerate(items) if isinstance(item, UserMessageItem)]
+        if len(user_messages) <= self.keep_turns:
+            return 0
+        return user_messages[-self.keep_turns]
+
+    async def _update_summary(
+        self,
+        thread_id: str,
+        summary: HistorySummary | None,
+        boundary: str | None,
+        context: dict[str, Any],
+    ) -> None:
+        """Fold every item between the summary and ``boundary`` into the summary, a chunk at a time."""
+        try:
+            after = summary.through_item_id if summary is not None else None
+            while True:
+                page = await self.store.load_thread_items(thread_id, after, 4 * _PAGE_ITEMS, "asc", context)
+                chunk: list[str] = []
+                chunk_tokens = 0
+                last: ThreadItem | None = None
+                for item in page.data:
+                    if boundary is not None and item.created_at.isoformat() >= boundary:
+                        break
+                    line = item_transcript(item)
+                    if line:
+                        tokens = self._count_tokens(line)
+                        if chunk and chunk_tokens + tokens > self.chunk_tokens:
+                            break
+                        chunk.append(line)
+                        chunk_tokens += tokens
+                    last = item
+                if last is None:
+                    break
+                if not chunk:  # Nothing worth summarising, e.g. only hidden tasks
+                    after = last.id
+                    continue
+
+                started = datetime.now()
+                text = await self._summarise(summary.text if summary else "", "\n".join(chunk))
+                summary = HistorySummary(
+                    text=text,
+                    through_item_id=last.id,
+                    through_created_at=last.created_at.isoformat(),
+                    items_summarised=(summary.items_summarised if summary else 0) + len(chunk),
+                )
+                self._latest[thread_id] = summary
+                self._summaries += 1
+                logger.info(
+                    f"Summarised {len(chunk)} item(s) of thread {thread_id} "
+                    f"({chunk_tokens} tokens) in {(datetime.now() - started).total_seconds():.1f}s"
+                )
+                after = last.id
+
+            if summary is not None and thread_id in self._latest:
+                # Persist now as well, in case no further turn comes to adopt it
+                thread = await self.store.load_thread(thread_id, context)
+                thread.metadata[SUMMARY_KEY] = asdict(summary)
+                await self.store.save_thread(thread, context)
+        except Exception as e:
+            self._summary_failures += 1
+            logger.warning(f"History summary for thread {thread_id} failed: {e}")
+        finally:
+            del self._tasks[thread_id]
+
+    def metrics(self) -> dict[str, Any]:
+        """Prompt size and summarisation counters."""
+        return {
+            "turns": self._turns,
+            "avg_prompt_tokens": round(self._prompt_tokens / self._turns) if self._turns else 0,
+            "summaries_running": len(self._tasks),
+            "summary_updates": self._summaries,
+            "summary_failures": self._summary_failures,
+        }
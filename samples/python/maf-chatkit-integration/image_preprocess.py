@@ -0,0 +1,125 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Image preprocessing for vision model calls.
+
+Phone photos of parking signs are often 4-12 MB, but the vision model never
+looks at more than its effective tile resolution: with ``detail: "high"`` the
+image is scaled to fit 2048x2048 and then so its shortest side is 768px.
+Downscaling to that size locally and re-encoding as JPEG sends the same pixels
+the model would see, at a fraction of the upload size.
+
+Decoding and resizing are CPU-heavy, so they run in a worker pool. Results are
+cached by content hash so re-analysing the same photo is free.
+"""
+
+import asyncio
+import hashlib
+import io
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Effective resolution for detail="high" vision requests
+VISION_MAX_LONG_SIDE = 2048
+VISION_MAX_SHORT_SIDE = 768
+
+JPEG_QUALITY = 85
+
+
+def vision_target_size(width: int, height: int) -> tuple[int, int]:
+    """Scale (width, height) down to the vision model's effective resolution.
+
+    Images are never upscaled.
+    """
+    scale = min(
+        1.0,
+        VISION_MAX_LONG_SIDE / max(width, height),
+        VISION_MAX_SHORT_SIDE / min(width, height),
+    )
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def prepare_vision_image(data: bytes, content_type: str) -> tuple[bytes, str]:
+    """Orient, downscale and re-encode an image for a vision request.
+
+    Runs synchronously - call it from a worker thread.
+
+    Args:
+        data: Raw uploaded image bytes
+        content_type: MIME type reported for the upload
+
+    Returns:
+        (image bytes, MIME type). The original is returned unchanged if it is
+        already small enough or can't be decoded.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            # exif_transpose drops the orientation tag, so read it first. Any value
+            # but 1 (including flips and 180-degree turns) changes the pixels
+            oriented = source.getexif().get(0x0112, 1) != 1
+            image: Image.Image = ImageOps.exif_transpose(source)
+            target = vision_target_size(*image.size)
+
+            if target == image.size and not oriented and content_type in ("image/jpeg", "image/png"):
+                return data, content_type
+
+            if target != image.size:
+                image = image.resize(target, Image.Resampling.LANCZOS)
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+
+            output = io.BytesIO()
+            image.save(output, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    except Exception as e:
+        logger.warning(f"Could not preprocess image ({content_type}), sending original: {e}")
+        return data, content_type
+
+    encoded = output.getvalue()
+    if len(encoded) >= len(data) and not oriented:
+        return data, content_type
+    return encoded, "image/jpeg"
+
+
+class VisionImagePreprocessor:
+    """Runs prepare_vision_image in a worker pool with a content-hash cache.
+
+    A thread pool is used because Pillow releases the GIL while decoding,
+    resizing and encoding, and it avoids re-importing the app in child processes.
+    """
+
+    def __init__(self, max_workers: int = 2, cache_max_bytes: int = 64 * 1024 * 1024):
+        """Initialize the preprocessor.
+
+        Args:
+            max_workers: Worker threads used for image processing
+            cache_max_bytes: Total size of prepared images kept in the cache
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="vision-image")
+        self._cache: OrderedDict[str, tuple[bytes, str]] = OrderedDict()
+        self._cache_bytes = 0
+        self.cache_max_bytes = cache_max_bytes
+
+    def _cache_put(self, key: str, value: tuple[bytes, str]) -> None:
+        self._cache[key] = value
+        self._cache_bytes += len(value[0])
+        while self._cache_bytes > self.cache_max_bytes and self._cache:
+            _, (evicted, _) = self._cache.popitem(last=False)
+            self._cache_bytes -= len(evicted)
+
+    async def prepare(self, data: bytes, content_type: str) -> tuple[bytes, str]:
+        """Prepare an image for a vision request, reusing cached results."""
+        key = hashlib.sha256(data).hexdigest()
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            return cached
+
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self._executor, prepare_vision_image, data, content_type)
+        logger.info(f"Vision image prepared: {len(data):,} -> {len(result[0]):,} bytes ({result[1]})")
+        self._cache_put(key, result)
+        return result
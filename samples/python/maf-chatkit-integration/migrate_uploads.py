@@ -0,0 +1,34 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Move uploads from the old flat directory into the hash-sharded layout.
+
+Files stored before sharding are still readable, but every lookup of one costs
+an extra stat. Run this once, with the server stopped or running, to move them:
+
+    python migrate_uploads.py --uploads-dir data/uploads
+
+The migration is idempotent and can be interrupted and re-run safely.
+"""
+
+import argparse
+import logging
+import time
+
+from attachment_store import FileBasedAttachmentStore
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uploads-dir", default="data/uploads", help="Uploads directory to migrate")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    store = FileBasedAttachmentStore(uploads_dir=args.uploads_dir)
+    started = time.monotonic()
+    moved = store.migrate_flat_layout()
+    logging.info(f"Moved {moved:,} files into the sharded layout in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
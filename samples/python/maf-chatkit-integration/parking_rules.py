@@ -0,0 +1,507 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Local rule engine for parking sign restrictions.
+
+The vision model reports each restriction as free text - ``hours="8am-6pm"``,
+``days="Mon-Fri"``, ``duration="2P"``. normalise_restrictions turns those into
+a ParkingSchedule of weekly time windows, which is stored with the analysis so
+follow-up questions like "what about 6pm Saturday?" can be answered locally in
+microseconds instead of with another vision call.
+
+Restrictions whose text can't be parsed are kept on the schedule as
+``unparsed``; answers from an incomplete schedule are reported with low
+confidence.
+"""
+
+import re
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from typing import Any
+
+from parking_widget import ParkingAnalysisData, ParkingRestriction
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+DAY_NAMES = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+ALL_DAYS = tuple(range(7))
+
+# Restriction kinds, most restrictive first - the first active one decides the verdict
+RULE_PRECEDENCE = ("no_stopping", "no_parking", "loading_zone", "permit", "time_limited", "paid")
+
+# (substring of the restriction type, kind) - checked in order
+_KIND_KEYWORDS: list[tuple[str, str]] = [
+    ("no stopping", "no_stopping"),
+    ("no standing", "no_stopping"),
+    ("clearway", "no_stopping"),
+    ("tow", "no_stopping"),
+    ("no parking", "no_parking"),
+    ("bus zone", "no_parking"),
+    ("taxi", "no_parking"),
+    ("loading", "loading_zone"),
+    ("permit", "permit"),
+    ("resident", "permit"),
+    ("meter", "paid"),
+    ("ticket", "paid"),
+    ("paid", "paid"),
+    ("pay", "paid"),
+    ("limit", "time_limited"),
+]
+
+# Exemptions such as "Permit holders excepted" qualify the other rules rather than restrict parking
+_EXEMPTION = re.compile(r"\b(except(ed)?|exempt(ed|ion)?)\b")
+
+_VERDICTS = {
+    "no_stopping": "No, stopping is not allowed",
+    "no_parking": "No, parking is not allowed",
+    "loading_zone": "No, it's a loading zone",
+    "permit": "Only with a permit",
+}
+
+_ALL_TIMES = re.compile(r"\b(all times|any ?time|24 ?(hours|hrs|/7)|at all times|all day)\b")
+_TIME = r"(\d{1,2})(?:[:.]?(\d{2}))?\s*([ap])?\.?m?\.?|noon|midday|midnight"
+_TIME_RANGE = re.compile(rf"({_TIME})\s*(?:-|–|—|to|until|till)\s*({_TIME})")
+_DAY = r"mon(?:day)?|tue(?:s|sday)?|wed(?:nesday)?|thu(?:r|rs|rsday)?|fri(?:day)?|sat(?:urday)?|sun(?:day)?"
+_DAY_RANGE = re.compile(rf"\b({_DAY})\b\s*(?:-|–|—|to|through|thru)\s*\b({_DAY})\b")
+_DAY_TOKEN = re.compile(rf"\b({_DAY})\b")
+_DURATION = re.compile(r"(\d+/\d+|\d+(?:\.\d+)?)\s*(p\b|h\b|hrs?\b|hours?\b|m\b|mins?\b|minutes?\b)")
+
+
+@dataclass
+class ScheduleRule:
+    """One restriction as a set of weekly time windows."""
+
+    kind: str  # One of RULE_PRECEDENCE, or "other"
+    label: str  # The restriction type as written on the sign
+    days: list[int] = field(default_factory=lambda: list(ALL_DAYS))  # 0 = Monday
+    start_minute: int = 0  # Minutes after midnight
+    end_minute: int = MINUTES_PER_DAY  # Before start_minute for windows past midnight
+    max_minutes: int | None = None  # Time limit while the rule applies
+
+    def week_windows(self) -> list[tuple[int, int]]:
+        """The rule's windows as [start, end) minutes from Monday midnight."""
+        windows = []
+        for day in self.days:
+            start = day * MINUTES_PER_DAY + self.start_minute
+            end = day * MINUTES_PER_DAY + self.end_minute
+            if self.end_minute <= self.start_minute:
+                end += MINUTES_PER_DAY  # Overnight window
+            if end > MINUTES_PER_WEEK:
+                windows.append((0, end - MINUTES_PER_WEEK))  # Sunday night into Monday
+                end = MINUTES_PER_WEEK
+            windows.append((start, end))
+        return windows
+
+    def is_active(self, when: datetime) -> bool:
+        """Whether the rule applies at ``when``."""
+        minute = _minute_of_week(when)
+        return any(start <= minute < end for start, end in self.week_windows())
+
+    def describe(self) -> str:
+        """Short human-readable form, e.g. "2P Mon-Fri 8:00 AM-6:00 PM"."""
+        if self.start_minute == 0 and self.end_minute == MINUTES_PER_DAY:
+            hours = "all day"
+        else:
+            hours = f"{_format_minute(self.start_minute)}-{_format_minute(self.end_minute)}"
+        return f"{self.label} {_format_days(self.days)} {hours}"
+
+
+@dataclass
+class ParkingEvaluation:
+    """Local answer to "can I park here at this time?"."""
+
+    when: datetime
+    can_park: bool
+    verdict: str
+    time_limit: str | None = None
+    active: list[ScheduleRule] = field(default_factory=list)
+    changes_at: datetime | None = None  # Next time the answer changes, within a week
+    certain: bool = True  # False if some restrictions couldn't be parsed
+
+
+@dataclass
+class ParkingSchedule:
+    """Machine-readable weekly schedule of a sign's restrictions."""
+
+    rules: list[ScheduleRule] = field(default_factory=list)
+    unparsed: list[str] = field(default_factory=list)  # Restrictions that couldn't be normalised
+
+    @property
+    def complete(self) -> bool:
+        """Whether every restriction on the sign was normalised."""
+        return not self.unparsed
+
+    def to_dict(self) -> dict[str, Any]:
+        """JSON-serialisable form, for storage in thread metadata."""
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "ParkingSchedule":
+        """Rebuild a schedule stored with to_dict()."""
+        return cls(
+            rules=[ScheduleRule(**rule) for rule in data.get("rules", [])],
+            unparsed=list(data.get("unparsed", [])),
+        )
+
+    @staticmethod
+    def _decide(
+        windows: list[tuple[ScheduleRule, int, int]], minute: int
+    ) -> tuple[str | None, int | None, list[ScheduleRule]]:
+        """The deciding kind of restriction, time limit and active rules at a minute of the week.
+
+        The time limit only counts while a time-limited or paid rule decides the
+        verdict - a limit overridden by e.g. No Stopping doesn't change the answer.
+        """
+        active = [rule for rule, start, end in windows if start <= minute < end]
+        kinds = {rule.kind for rule in active}
+        decisive = next((kind for kind in RULE_PRECEDENCE if kind in kinds), None)
+        if decisive not in ("time_limited", "paid"):
+            return decisive, None, active
+        limits = [rule.max_minutes for rule in active if rule.max_minutes and rule.kind in ("time_limited", "paid")]
+        return decisive, min(limits) if limits else None, active
+
+    def evaluate(self, when: datetime) -> ParkingEvaluation:
+        """Work out whether parking is allowed at ``when``.
+
+        Args:
+            when: Local time to check
+
+        Returns:
+            The verdict, any time limit, and when the answer next changes
+        """
+        windows = [(rule, start, end) for rule in self.rules for start, end in rule.week_windows()]
+        minute = _minute_of_week(when)
+        decisive, max_minutes, active = self._decide(windows, minute)
+
+        # The answer can only change where a window starts or ends - walk them for one week
+        changes_at = None
+        boundaries = sorted({edge % MINUTES_PER_WEEK for _, start, end in windows for edge in (start, end)})
+        ahead = [b for b in boundaries if b > minute] + [b + MINUTES_PER_WEEK for b in boundaries if b <= minute]
+        for boundary in ahead:
+            if self._decide(windows, boundary % MINUTES_PER_WEEK)[:2] != (decisive, max_minutes):
+                changes_at = when.replace(second=0, microsecond=0) + timedelta(minutes=boundary - minute)
+                break
+
+        time_limit = _format_duration(max_minutes) if max_minutes else None
+        if decisive in _VERDICTS:
+            can_park = False
+            verdict = _VERDICTS[decisive]
+        elif decisive == "paid":
+            can_park = True
+            verdict = f"Yes, paid parking, {time_limit} max" if time_limit else "Yes, paid parking"
+        elif time_limit:
+            can_park = True
+            verdict = f"Yes, {time_limit} max"
+        else:
+            can_park = True
+            verdict = "Yes, no restrictions apply"
+
+        if changes_at is not None:
+            verdict += f" until {_format_moment(changes_at, when)}"
+
+        return ParkingEvaluation(
+            when=when,
+            can_park=can_park,
+            verdict=verdict,
+            time_limit=time_limit,
+            active=active,
+            changes_at=changes_at,
+            certain=self.complete,
+        )
+
+
+def _minute_of_week(when: datetime) -> int:
+    return when.weekday() * MINUTES_PER_DAY + when.hour * 60 + when.minute
+
+
+def _format_minute(minute: int) -> str:
+    hour, minute = divmod(minute % MINUTES_PER_DAY, 60)
+    return f"{hour % 12 or 12}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
+
+
+def _format_days(days: list[int]) -> str:
+    if len(days) == 7:
+        return "daily"
+    if days == list(range(days[0], days[-1] + 1)) and len(days) > 2:
+        return f"{DAY_NAMES[days[0]]}-{DAY_NAMES[days[-1]]}"
+    return ", ".join(DAY_NAMES[day] for day in days)
+
+
+def _format_duration(minutes: int) -> str:
+    if minutes % 60 == 0:
+        hours = minutes // 60
+        return f"{hours} hour" if hours == 1 else f"{hours} hours"
+    return f"{minutes} minutes"
+
+
+def _format_moment(moment: datetime, now: datetime) -> str:
+    if moment.date() == now.date():
+        return _format_minute(moment.hour * 60 + moment.minute)
+    return f"{DAY_NAMES[moment.weekday()]} {_format_minute(moment.hour * 60 + moment.minute)}"
+
+
+def _parse_time(token: str) -> tuple[int, str | None] | None:
+    """Parse one time of day into (minutes after midnight, "a"/"p" or None)."""
+    token = token.strip()
+    if token in ("noon", "midday"):
+        return 12 * 60, "p"
+    if token == "midnight":
+        return MINUTES_PER_DAY, None
+    match = re.fullmatch(r"(\d{1,2})(?:[:.]?(\d{2}))?\s*([ap])?\.?m?\.?", token)
+    if not match:
+        return None
+    hour, minute, meridiem = int(match[1]), int(match[2] or 0), match[3]
+    if hour > 24 or minute > 59 or (meridiem and not 1 <= hour <= 12):
+        return None
+    if meridiem == "a":
+        hour %= 12
+    elif meridiem == "p":
+        hour = hour % 12 + 12
+    return hour * 60 + minute, meridiem
+
+
+def parse_time_ranges(text: str) -> list[tuple[int, int]] | None:
+    """Parse operating hours into (start, end) minute windows.
+
+    Handles "8am-6pm", "8:30am - 6.30pm", "0800-1800", "8-6pm", "10pm to 6am"
+    and "All times". Returns None if no hours can be read.
+    """
+    text = text.lower()
+    if _ALL_TIMES.search(text):
+        return [(0, MINUTES_PER_DAY)]
+
+    windows = []
+    for match in _TIME_RANGE.finditer(text):
+        start, end = _parse_time(match[1]), _parse_time(match[5])
+        if start is None or end is None:
+            continue
+        (start_minute, start_meridiem), (end_minute, end_meridiem) = start, end
+        if start_meridiem is None and end_meridiem and start_minute < 12 * 60:
+            # "8-6pm" - the start shares the end's meridiem unless that puts it after the end
+            if end_meridiem == "p" and start_minute + 12 * 60 < end_minute:
+                start_minute += 12 * 60
+        elif start_meridiem is None and end_meridiem is None and end_minute <= start_minute <= 12 * 60:
+            # "8-6" on a sign means 8am to 6pm
+            end_minute += 12 * 60
+        if end_minute == 0:
+            end_minute = MINUTES_PER_DAY
+        if start_minute == MINUTES_PER_DAY:
+            start_minute = 0
+        windows.append((start_minute, end_minute))
+    return windows or None
+
+
+def _day_index(token: str) -> int:
+    return DAY_NAMES.index(token[:3].title())
+
+
+def parse_days(text: str) -> list[int] | None:
+    """Parse the days a restriction applies, e.g. "Mon-Fri", "Weekends", "Sat & Sun".
+
+    Returns None if no days can be read.
+    """
+    text = text.lower()
+    if re.search(r"\b(daily|every ?day|all days|7 days|any ?day)\b", text):
+        return list(ALL_DAYS)
+
+    days: set[int] = set()
+    if re.search(r"\bweekdays?\b", text):
+        days.update(range(5))
+    if re.search(r"\bweekends?\b", text):
+        days.update((5, 6))
+    for match in _DAY_RANGE.finditer(text):
+        start, end = _day_index(match[1]), _day_index(match[2])
+        day = start
+        while True:
+            days.add(day)
+            if day == end:
+                break
+            day = (day + 1) % 7
+    text = _DAY_RANGE.sub(" ", text)
+    days.update(_day_index(match[1]) for match in _DAY_TOKEN.finditer(text))
+    return sorted(days) or None
+
+
+def parse_duration(text: str) -> int | None:
+    """Parse a time limit into minutes, e.g. "2 hours", "2P", "1/2P", "30 min"."""
+    match = _DURATION.search(text.lower())
+    if not match:
+        return None
+    amount, unit = match[1], match[2]
+    if "/" in amount:
+        numerator, denominator = amount.split("/")
+        value = int(numerator) / int(denominator) if int(denominator) else 0
+    else:
+        value = float(amount)
+    minutes = value if unit.startswith("m") else value * 60
+    return round(minutes) or None
+
+
+def _rule_kind(restriction: ParkingRestriction, max_minutes: int | None) -> str:
+    label = restriction.type.lower()
+    for keyword, kind in _KIND_KEYWORDS:
+        if keyword in label:
+            return kind
+    return "time_limited" if max_minutes else "other"
+
+
+def normalise_restrictions(restrictions: list[ParkingRestriction]) -> ParkingSchedule:
+    """Turn a sign's free-text restrictions into a ParkingSchedule.
+
+    Hours and days are read from either field, since the model sometimes puts
+    "8am-6pm Mon-Fri" in one of them. A restriction with neither applies at all
+    times.
+
+    Args:
+        restrictions: Restrictions reported by the vision model
+
+    Returns:
+        The schedule, with unreadable restrictions listed in ``unparsed``
+    """
+    schedule = ParkingSchedule()
+    for restriction in restrictions:
+        if _EXEMPTION.search(restriction.type.lower()):
+            continue
+        hours_text = restriction.hours or ""
+        days_text = restriction.days or ""
+        combined = f"{hours_text} {days_text}"
+
+        windows = parse_time_ranges(hours_text) or parse_time_ranges(combined)
+        days = parse_days(days_text) or parse_days(combined)
+        max_minutes = parse_duration(restriction.duration or "") or parse_duration(restriction.type)
+        kind = _rule_kind(restriction, max_minutes)
+
+        hours_given = bool(hours_text.strip()) and not re.search(r"\b(n/?a|none)\b", hours_text.lower())
+        days_given = bool(days_text.strip()) and not re.search(r"\b(n/?a|none)\b", days_text.lower())
+        if kind == "other" or (hours_given and windows is None) or (days_given and days is None):
+            schedule.unparsed.append(restriction.type or combined.strip())
+            continue
+
+        for start_minute, end_minute in windows or [(0, MINUTES_PER_DAY)]:
+            schedule.rules.append(
+                ScheduleRule(
+                    kind=kind,
+                    label=restriction.type,
+                    days=days or list(ALL_DAYS),
+                    start_minute=start_minute,
+                    end_minute=end_minute,
+                    max_minutes=max_minutes,
+                )
+            )
+    return schedule
+
+
+_RELATIVE_DAYS = {"today": 0, "tonight": 0, "tomorrow": 1}
+_QUERY_DAY = re.compile(rf"\b(today|tonight|tomorrow|{_DAY})\b")
+_QUERY_TIME = re.compile(
+    r"\b(\d{1,2})(?:[:.](\d{2}))?\s*([ap])\.?m\b\.?"  # 5pm, 5:30 p.m.
+    r"|\b(\d{1,2})[:.](\d{2})\b"  # 17:30
+    r"|\b(noon|midday|midnight)\b"
+)
+_QUERY_PARTS_OF_DAY = {"morning": 9 * 60, "afternoon": 15 * 60, "evening": 19 * 60, "night": 22 * 60}
+
+# Words a time-shifted follow-up may contain besides the day and time
+_FOLLOW_UP_WORDS = frozenset(
+    "what about how and if at on in the this that it is i can could we still then instead "
+    "park parking here there sign spot ok okay so next on a be allowed".split()
+)
+
+
+def parse_time_query(text: str, now: datetime) -> datetime | None:
+    """Read the time a follow-up question asks about, e.g. "what about 6pm Saturday?".
+
+    Only messages that are nothing but a time-shifted question qualify - any
+    other content, like "what about QF2 tomorrow?", returns None so the message
+    goes to the agent. Days without a time keep the current time of day, and
+    times without a day mean the next occurrence of that time.
+
+    Args:
+        text: The user's message
+        now: Current local time
+
+    Returns:
+        The time asked about, or None if the message isn't a time-shifted question
+    """
+    text = text.lower()
+    remainder = _QUERY_TIME.sub(" ", _QUERY_DAY.sub(" ", text))
+    words = re.findall(r"[a-z0-9']+", remainder)
+    if any(word not in _FOLLOW_UP_WORDS and word not in _QUERY_PARTS_OF_DAY for word in words):
+        return None
+
+    day_match = _QUERY_DAY.search(text)
+    time_match = _QUERY_TIME.search(text)
+    part_of_day = next((minute for word, minute in _QUERY_PARTS_OF_DAY.items() if word in text), None)
+    if day_match is None and time_match is None and part_of_day is None:
+        return None
+
+    minute = now.hour * 60 + now.minute
+    if time_match is not None:
+        if time_match[1]:
+            parsed = _parse_time(f"{time_match[1]}:{time_match[2] or '00'}{time_match[3]}")
+        elif time_match[4]:
+            parsed = _parse_time(f"{time_match[4]}:{time_match[5]}")
+        else:
+            parsed = _parse_time(time_match[6])
+        if parsed is None:
+            return None
+        minute = parsed[0] % MINUTES_PER_DAY
+    elif part_of_day is not None:
+        minute = part_of_day
+
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if day_match is not None:
+        word = day_match[1]
+        if word in _RELATIVE_DAYS:
+            offset = _RELATIVE_DAYS[word]
+        else:
+            offset = (_day_index(word) - now.weekday()) % 7
+        when = midnight + timedelta(days=offset, minutes=minute)
+        if when < now - timedelta(minutes=1) and word not in _RELATIVE_DAYS:
+            when += timedelta(days=7)  # "Monday" on a Monday evening means next Monday
+        return when
+
+    when = midnight + timedelta(minutes=minute)
+    return when if when >= now - timedelta(minutes=1) else when + timedelta(days=1)
+
+
+def reevaluate_analysis(
+    analysis: ParkingAnalysisData,
+    schedule: ParkingSchedule,
+    when: datetime,
+) -> ParkingAnalysisData:
+    """Re-answer a stored analysis for another time, with no model call.
+
+    Args:
+        analysis: The sign's original vision analysis
+        schedule: The schedule normalised from it
+        when: Local time to check
+
+    Returns:
+        A copy of the analysis with the verdict, time limit and advice for ``when``
+    """
+    evaluation = schedule.evaluate(when)
+    if evaluation.active:
+        applying = "; ".join(rule.describe() for rule in evaluation.active)
+        explanation = f"At that time these restrictions apply: {applying}."
+    else:
+        explanation = "None of the sign's restrictions apply at that time."
+    if not evaluation.certain:
+        explanation += f" Some of the sign couldn't be checked automatically: {', '.join(schedule.unparsed)}."
+
+    if evaluation.changes_at is not None:
+        changes_at = _format_moment(evaluation.changes_at, when)
+        advice = f"The rules change at {changes_at} - check the sign again if you stay longer."
+    else:
+        advice = "The rules stay the same for the rest of the week."
+
+    return ParkingAnalysisData(
+        can_park=evaluation.can_park,
+        verdict=evaluation.verdict,
+        confidence=analysis.confidence if evaluation.certain else "low",
+        restrictions=analysis.restrictions,
+        time_limit=evaluation.time_limit,
+        detailed_analysis=explanation,
+        advice=advice,
+        current_time_context=when.strftime("%A, %I:%M %p"),
+        sign_description=analysis.sign_description,
+    )
@@ -5,7 +5,7 @@
 import base64
 from dataclasses import dataclass, field
 
-from chatkit.widgets import Box, Card, Col, Image, Row, Text, Title, WidgetRoot
+from chatkit.widgets import Box, Card, Col, Image, Row, Text, Title, WidgetComponent, WidgetRoot
 
 # Parking widget colors
 CAN_PARK_COLOR = "#059669"  # Green-600
@@ -454,36 +454,84 @@ def render_parking_upload_prompt() -> WidgetRoot:
     )
 
 
-def render_analysing_widget() -> WidgetRoot:
+def render_analysing_widget(
+    can_park: bool | None = None,
+    verdict: str | None = None,
+    title: str = "Analysing parking sign...",
+) -> WidgetRoot:
     """Render a widget showing analysis in progress.
 
+    While the model's answer is still streaming, the verdict is shown as soon
+    as it has been read, ahead of the full analysis.
+
+    Args:
+        can_park: Early yes/no answer, if already known
+        verdict: Early one-sentence verdict, if already known
+        title: Heading, e.g. to tell several signs in one message apart
+
     Returns:
         A ChatKit WidgetRoot (Card) with analysing animation
     """
-    return Card(
-        key="analysing",
-        padding=0,
-        children=[
+    children: list[WidgetComponent] = [
+        Box(
+            padding=5,
+            background="surface-tertiary",
+            children=[
+                Row(
+                    gap=3,
+                    align="center",
+                    justify="center",
+                    children=[
+                        Text(value="🔍", size="lg"),
+                        Col(
+                            gap=1,
+                            children=[
+                                Text(value=title, weight="semibold"),
+                                Text(value="Using AI vision to read the sign", size="xs", color="tertiary"),
+                            ],
+                        ),
+                    ],
+                ),
+            ],
+        ),
+    ]
+
+    if can_park is not None:
+        children.append(
             Box(
                 padding=5,
-                background="surface-tertiary",
+                background="green-50" if can_park else "red-50",
                 children=[
                     Row(
-                        gap=3,
+                        gap=4,
                         align="center",
-                        justify="center",
                         children=[
-                            Text(value="🔍", size="lg"),
+                            Image(
+                                src=CHECKMARK_ICON if can_park else CROSS_ICON,
+                                alt="Verdict",
+                                size=40,
+                                fit="contain",
+                            ),
                             Col(
                                 gap=1,
                                 children=[
-                                    Text(value="Analysing parking sign...", weight="semibold"),
-                                    Text(value="Using AI vision to read the sign", size="xs", color="tertiary"),
+                                    Title(value="✅ Yes!" if can_park else "❌ No!", size="lg", weight="bold"),
+                                    Text(
+                                        value=verdict or "Reading the details...",
+                                        size="sm",
+                                        color="secondary",
+                                        weight="medium",
+                                    ),
                                 ],
                             ),
                         ],
                     ),
                 ],
-            ),
-        ],
+            )
+        )
+
+    return Card(
+        key="analysing",
+        padding=0,
+        children=children,
     )
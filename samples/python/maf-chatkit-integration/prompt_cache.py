@@ -0,0 +1,146 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Prompt-cache accounting for model calls.
+
+Azure OpenAI caches the longest previously seen prefix of a prompt (in 128
+token steps once it is at least 1024 tokens) and bills and serves cached
+tokens faster and cheaper. Whether that happens depends on every call putting
+its static content - instructions, tool schemas, policy text - first and
+byte-for-byte identical. PromptCacheStats records, for every model call, how
+many prompt tokens were served from the cache and how long the first token
+took, so cache regressions show up as a falling hit ratio or a rising
+time-to-first-token.
+"""
+
+import threading
+from collections import defaultdict, deque
+from typing import Any
+
+
+def _count(value: Any, *names: str) -> int:
+    """Read the first present token count from a usage object or dict."""
+    for name in names:
+        count = value.get(name) if isinstance(value, dict) else getattr(value, name, None)
+        if count is not None:
+            return int(count)
+    return 0
+
+
+def _details(usage: Any, name: str) -> Any:
+    details = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+    return details or {}
+
+
+class _SourceStats:
+    """Token counts and first-token latencies for one kind of model call."""
+
+    def __init__(self, samples: int):
+        self.calls = 0
+        self.cache_hits = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self.first_token: dict[bool, deque[float]] = {True: deque(maxlen=samples), False: deque(maxlen=samples)}
+
+    def metrics(self) -> dict[str, Any]:
+        def p50(values: deque[float]) -> float | None:
+            return round(sorted(values)[len(values) // 2], 3) if values else None
+
+        return {
+            "calls": self.calls,
+            "cache_hit_calls": self.cache_hits,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "uncached_tokens": self.prompt_tokens - self.cached_tokens,
+            "cached_ratio": round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0,
+            "output_tokens": self.output_tokens,
+            "first_token_p50_seconds_cached": p50(self.first_token[True]),
+            "first_token_p50_seconds_uncached": p50(self.first_token[False]),
+        }
+
+
+class PromptCacheStats:
+    """Records cached and uncached prompt tokens and time to first token per call source.
+
+    Features:
+    - Accepts Chat Completions, Responses API and Agent Framework usage objects
+    - Cache hit ratio and token totals per source (agent, classifier, vision, ...)
+    - Time-to-first-token medians split by cache hit and miss
+    - Safe to call from the worker threads that run blocking SDK calls
+    - Exposed through the /metrics/prompt-cache endpoint
+    """
+
+    def __init__(self, samples: int = 500):
+        """Initialize the stats.
+
+        Args:
+            samples: First-token latencies kept per source and cache state
+        """
+        self._samples = samples
+        self._sources: dict[str, _SourceStats] = defaultdict(lambda: _SourceStats(self._samples))
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        source: str,
+        prompt_tokens: int,
+        cached_tokens: int,
+        output_tokens: int,
+        first_token_seconds: float | None = None,
+    ) -> None:
+        """Record one model call.
+
+        Args:
+            source: Kind of call, e.g. "agent" or "classifier"
+            prompt_tokens: All prompt tokens, cached or not
+            cached_tokens: Prompt tokens served from the provider's cache
+            output_tokens: Generated tokens, including reasoning
+            first_token_seconds: Time to the first streamed token, or the whole call
+                for calls that aren't streamed
+        """
+        with self._lock:
+            stats = self._sources[source]
+            stats.calls += 1
+            stats.cache_hits += cached_tokens > 0
+            stats.prompt_tokens += prompt_tokens
+            stats.cached_tokens += cached_tokens
+            stats.output_tokens += output_tokens
+            if first_token_seconds is not None:
+                stats.first_token[cached_tokens > 0].append(first_token_seconds)
+
+    def record_usage(self, source: str, usage: Any, first_token_seconds: float | None = None) -> None:
+        """Record a call from its provider usage block.
+
+        Args:
+            source: Kind of call
+            usage: Chat Completions ``usage`` (``prompt_tokens``), Responses API ``usage``
+                (``input_tokens``), either as an SDK object or a parsed JSON dict, or an
+                Agent Framework UsageDetails
+            first_token_seconds: See record()
+        """
+        if usage is None:
+            return
+        if hasattr(usage, "additional_counts"):  # Agent Framework UsageDetails
+            self.record(
+                source,
+                usage.input_token_count or 0,
+                int((usage.additional_counts or {}).get("prompt/cached_tokens", 0)),
+                usage.output_token_count or 0,
+                first_token_seconds,
+            )
+            return
+        cached = _count(_details(usage, "prompt_tokens_details"), "cached_tokens") or _count(
+            _details(usage, "input_tokens_details"), "cached_tokens"
+        )
+        self.record(
+            source,
+            _count(usage, "prompt_tokens", "input_tokens"),
+            cached,
+            _count(usage, "completion_tokens", "output_tokens"),
+            first_token_seconds,
+        )
+
+    def metrics(self) -> dict[str, Any]:
+        """Token totals, hit ratios and first-token latencies per source."""
+        with self._lock:
+            return {source: stats.metrics() for source, stats in self._sources.items()}
@@ -0,0 +1,262 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Quota management for rate-limited upstream APIs.
+
+AviationStack plans come with small per-minute and per-month request budgets.
+QuotaManager enforces both locally so we queue or shed requests before the
+upstream starts returning 429s. Waiting requests are served in priority order,
+so interactive lookups always go ahead of background refresh work.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from enum import IntEnum
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Priority classes for quota-managed requests (lower is served first)."""
+
+    INTERACTIVE = 0  # A user is waiting on the answer
+    BACKGROUND = 1  # Refreshes and prefetching that can be dropped
+
+
+class QuotaExceededError(Exception):
+    """Raised when a request is shed instead of being sent upstream."""
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at a fixed rate."""
+
+    def __init__(self, capacity: int, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = float(capacity)
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def try_take(self) -> bool:
+        """Take one token if available."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def seconds_until_available(self) -> float:
+        """Seconds until at least one token will be available."""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.refill_per_second
+
+    def drain(self, seconds: float) -> None:
+        """Empty the bucket so no token is available for ``seconds``."""
+        self._refill()
+        self.tokens = -seconds * self.refill_per_second
+
+
+@dataclass(order=True)
+class _Waiter:
+    """A queued acquire() call, ordered by priority then arrival."""
+
+    priority: int
+    sequence: int
+    future: asyncio.Future[None] = field(compare=False)
+    enqueued_at: float = field(compare=False)
+
+
+class QuotaManager:
+    """Async rate limiter with per-minute and per-month budgets.
+
+    Features:
+    - Token bucket for the per-minute rate, allowing short bursts
+    - Calendar-month request budget with a reserve kept for interactive calls
+    - Bounded priority queue; background waiters are evicted first when full
+    - Live metrics for dashboards and the /metrics/quota endpoint
+    """
+
+    def __init__(
+        self,
+        name: str,
+        per_minute: int,
+        per_month: int,
+        max_queue: int = 50,
+        max_wait: float = 15.0,
+        background_reserve: float = 0.1,
+    ):
+        """Initialize the quota manager.
+
+        Args:
+            name: Name of the upstream, used in logs and metrics
+            per_minute: Requests allowed per minute (also the burst size)
+            per_month: Requests allowed per calendar month (UTC)
+            max_queue: Maximum number of requests waiting for a token
+            max_wait: Default seconds a request may wait before being shed
+            background_reserve: Fraction of the monthly budget background calls may not use
+        """
+        self.name = name
+        self.per_minute = per_minute
+        self.per_month = per_month
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.background_reserve = background_reserve
+
+        self._bucket = TokenBucket(per_minute, per_minute / 60.0)
+        self._waiters: list[_Waiter] = []
+        self._sequence = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+
+        self._month = self._current_month()
+        self._month_used = 0
+
+        self._granted = {p.name.lower(): 0 for p in Priority}
+        self._shed = {p.name.lower(): 0 for p in Priority}
+        self._throttled = 0
+        self._total_wait = 0.0
+
+    @staticmethod
+    def _current_month() -> str:
+        return datetime.now(timezone.utc).strftime("%Y-%m")
+
+    def _month_remaining(self) -> int:
+        month = self._current_month()
+        if month != self._month:
+            self._month = month
+            self._month_used = 0
+        return self.per_month - self._month_used
+
+    def _shed_request(self, priority: Priority, message: str, retry_after: float | None = None) -> QuotaExceededError:
+        self._shed[priority.name.lower()] += 1
+        logger.warning(f"{self.name} quota: shedding {priority.name.lower()} request - {message}")
+        return QuotaExceededError(message, retry_after)
+
+    def _check_month(self, priority: Priority) -> None:
+        remaining = self._month_remaining()
+        if remaining <= 0:
+            raise self._shed_request(priority, f"Monthly {self.name} quota of {self.per_month} requests is used up.")
+        if priority is Priority.BACKGROUND and remaining <= self.per_month * self.background_reserve:
+            raise self._shed_request(priority, f"Monthly {self.name} quota is reserved for interactive requests.")
+
+    def _grant(self, priority: Priority, waited: float) -> None:
+        self._month_used += 1
+        self._granted[priority.name.lower()] += 1
+        self._total_wait += waited
+
+    def _dispatch(self) -> None:
+        """Hand out available tokens to waiters in priority order."""
+        self._timer = None
+        while self._waiters:
+            waiter = self._waiters[0]
+            if waiter.future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._bucket.try_take():
+                break
+            heapq.heappop(self._waiters)
+            waiter.future.set_result(None)
+
+        if self._waiters:
+            delay = self._bucket.seconds_until_available()
+            self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def _make_room(self, priority: Priority) -> None:
+        """Evict the lowest-priority waiter if the queue is full, or shed this request."""
+        pending = [w for w in self._waiters if not w.future.done()]
+        if len(pending) < self.max_queue:
+            return
+        victim = max(pending)
+        if victim.priority <= priority:
+            raise self._shed_request(
+                priority, f"{self.name} request queue is full.", self._bucket.seconds_until_available()
+            )
+        victim.future.set_exception(
+            self._shed_request(
+                Priority(victim.priority), f"{self.name} request was displaced by a higher priority call."
+            )
+        )
+
+    async def acquire(self, priority: Priority = Priority.INTERACTIVE, max_wait: float | None = None) -> None:
+        """Wait for permission to send one request upstream.
+
+        Args:
+            priority: Priority class of the request
+            max_wait: Seconds to wait before shedding, defaults to the manager setting
+
+        Raises:
+            QuotaExceededError: If the request is shed instead of sent
+        """
+        self._check_month(priority)
+        max_wait = self.max_wait if max_wait is None else max_wait
+
+        # Fast path - nobody queued and a token is ready
+        if not self._waiters and self._bucket.try_take():
+            self._grant(priority, 0.0)
+            return
+
+        wait_estimate = self._bucket.seconds_until_available()
+        if wait_estimate > max_wait:
+            raise self._shed_request(priority, f"{self.name} rate limit reached.", wait_estimate)
+        self._make_room(priority)
+
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(priority, next(self._sequence), loop.create_future(), time.monotonic())
+        heapq.heappush(self._waiters, waiter)
+        if self._timer is None:
+            self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=max_wait)
+        except asyncio.TimeoutError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                error = waiter.future.exception()
+                if error is not None:
+                    raise error from None
+                # Token granted just as we timed out - keep it
+                self._grant(priority, time.monotonic() - waiter.enqueued_at)
+                return
+            waiter.future.cancel()
+            raise self._shed_request(priority, f"Timed out waiting for {self.name} rate limit.") from None
+        except asyncio.CancelledError:
+            waiter.future.cancel()
+            raise
+
+        self._grant(priority, time.monotonic() - waiter.enqueued_at)
+
+    def report_throttled(self, retry_after: float | None = None) -> None:
+        """Record an upstream 429 and pause dispatching for ``retry_after`` seconds."""
+        self._throttled += 1
+        self._bucket.drain(retry_after if retry_after is not None else 60.0 / self.per_minute)
+
+    def metrics(self) -> dict[str, Any]:
+        """Live quota metrics."""
+        granted = sum(self._granted.values())
+        return {
+            "name": self.name,
+            "per_minute": self.per_minute,
+            "per_month": self.per_month,
+            "tokens_available": max(0, int(self._bucket.tokens)),
+            "month": self._month,
+            "month_used": self._month_used,
+            "month_remaining": max(0, self._month_remaining()),
+            "queue_depth": sum(1 for w in self._waiters if not w.future.done()),
+            "granted": dict(self._granted),
+            "shed": dict(self._shed),
+            "throttled": self._throttled,
+            "avg_wait_seconds": round(self._total_wait / granted, 3) if granted else 0.0,
+        }
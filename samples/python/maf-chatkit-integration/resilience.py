@@ -0,0 +1,295 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Resilience helpers for outbound calls to upstream APIs.
+
+When Azure OpenAI or AviationStack degrade, every user request would otherwise
+wait out the full client timeout against the same sick upstream. This module
+provides:
+
+- CircuitBreaker: fails fast while an upstream is unhealthy, with half-open probing
+- Upstream: retries with full jitter inside an overall deadline, optional hedged
+  requests for idempotent calls, all guarded by the upstream's circuit breaker
+"""
+
+import asyncio
+import logging
+import random
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any, TypeVar
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Status codes worth retrying - anything else is returned to the caller as-is
+RETRYABLE_STATUS_CODES = frozenset({500, 502, 503, 504})
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the upstream's circuit is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is temporarily unavailable. Please try again in {int(retry_after) + 1}s.")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class UpstreamStatusError(Exception):
+    """Raised for a retryable HTTP status so it counts as a failed attempt."""
+
+    def __init__(self, response: httpx.Response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+
+
+class CircuitBreaker:
+    """Three-state circuit breaker.
+
+    - closed: calls flow normally; consecutive failures are counted
+    - open: calls fail fast until ``recovery_timeout`` has elapsed
+    - half_open: a limited number of probe calls decide whether to close again
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_probes: int = 1,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_probes = half_open_probes
+
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._rejected = 0
+        self._trips = 0
+
+    def before_call(self) -> None:
+        """Reserve permission for one call.
+
+        Raises:
+            CircuitOpenError: If the circuit is open or all probe slots are taken
+        """
+        if self.state == "open":
+            elapsed = time.monotonic() - self._opened_at
+            if elapsed < self.recovery_timeout:
+                self._rejected += 1
+                raise CircuitOpenError(self.name, self.recovery_timeout - elapsed)
+            logger.info(f"{self.name} circuit half-open - probing upstream")
+            self.state = "half_open"
+            self._probes_in_flight = 0
+
+        if self.state == "half_open":
+            if self._probes_in_flight >= self.half_open_probes:
+                self._rejected += 1
+                raise CircuitOpenError(self.name, 1.0)
+            self._probes_in_flight += 1
+
+    def record_success(self) -> None:
+        """Record a successful call, closing the circuit if it was probing."""
+        if self.state == "half_open":
+            logger.info(f"{self.name} circuit closed - upstream recovered")
+        self.state = "closed"
+        self._failures = 0
+        self._probes_in_flight = 0
+
+    def release(self) -> None:
+        """Give back a reserved call without a verdict, e.g. when it was cancelled."""
+        if self.state == "half_open" and self._probes_in_flight > 0:
+            self._probes_in_flight -= 1
+
+    def record_failure(self) -> None:
+        """Record a failed call, opening the circuit once the threshold is hit."""
+        self._failures += 1
+        if self.state == "half_open" or self._failures >= self.failure_threshold:
+            if self.state != "open":
+                self._trips += 1
+                logger.warning(f"{self.name} circuit opened after {self._failures} failure(s)")
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            self._probes_in_flight = 0
+
+    def metrics(self) -> dict[str, Any]:
+        """Current breaker state and counters."""
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "trips": self._trips,
+            "rejected": self._rejected,
+        }
+
+
+class Upstream:
+    """Retry, deadline and hedging policy for one upstream, behind a circuit breaker.
+
+    Features:
+    - Per-attempt timeout bounded by an overall deadline
+    - Exponential backoff with full jitter between attempts
+    - Optional hedged second request for idempotent calls that are slow to answer
+    - Latency and outcome counters for the /metrics/upstreams endpoint
+    """
+
+    def __init__(
+        self,
+        name: str,
+        attempt_timeout: float,
+        deadline: float,
+        max_attempts: int = 3,
+        base_delay: float = 0.25,
+        max_delay: float = 4.0,
+        hedge_after: float | None = None,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        retry_on: tuple[type[BaseException], ...] = (httpx.TransportError,),
+        breaker: CircuitBreaker | None = None,
+    ):
+        """Initialize the upstream policy.
+
+        Args:
+            name: Upstream name used in logs, errors and metrics
+            attempt_timeout: Seconds a single attempt may take
+            deadline: Seconds the whole call, including retries, may take
+            max_attempts: Maximum attempts per call (1 disables retries)
+            base_delay: Initial backoff in seconds, doubled per attempt
+            max_delay: Upper bound for the backoff
+            hedge_after: Seconds before an idempotent call sends a hedged duplicate, or None to disable
+            failure_threshold: Consecutive failures that open the circuit
+            recovery_timeout: Seconds the circuit stays open before probing
+            retry_on: Exception types counted as upstream failures, in addition to
+                timeouts and UpstreamStatusError
+            breaker: Circuit breaker shared with other policies for the same upstream,
+                a new one is created if omitted
+        """
+        self.name = name
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker(name, failure_threshold, recovery_timeout)
+        self.retry_on: tuple[type[BaseException], ...] = (asyncio.TimeoutError, UpstreamStatusError, *retry_on)
+
+        self._calls = 0
+        self._failures = 0
+        self._retries = 0
+        self._hedges = 0
+        self._latencies: list[float] = []
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2**attempt)))
+
+    async def _hedged(self, operation: Callable[[], Awaitable[T]], timeout: float) -> T:
+        """Run ``operation``, racing a duplicate if the first is slower than ``hedge_after``."""
+        assert self.hedge_after is not None
+        ends_at = time.monotonic() + timeout
+        pending: set[asyncio.Future[T]] = {asyncio.ensure_future(operation())}
+        hedged = False
+        error: BaseException | None = None
+        try:
+            while pending:
+                remaining = ends_at - time.monotonic()
+                wait_for = remaining if hedged else min(self.hedge_after, remaining)
+                done, pending = await asyncio.wait(pending, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                if done and not pending:
+                    break
+                if not done:
+                    if hedged or time.monotonic() >= ends_at:
+                        raise asyncio.TimeoutError
+                    hedged = True
+                    self._hedges += 1
+                    logger.info(f"{self.name}: sending hedged request after {self.hedge_after}s")
+                    pending.add(asyncio.ensure_future(operation()))
+            assert error is not None
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(self, operation: Callable[[], Awaitable[T]], idempotent: bool = False) -> T:
+        """Call the upstream with retries, deadline and circuit breaking.
+
+        Args:
+            operation: Zero-argument coroutine factory performing one attempt
+            idempotent: Whether the call may be hedged
+
+        Raises:
+            CircuitOpenError: If the circuit is open
+            Exception: The last attempt's error once retries or the deadline are exhausted
+        """
+        self._calls += 1
+        started = time.monotonic()
+        deadline = started + self.deadline
+        attempt = 0
+
+        while True:
+            self.breaker.before_call()
+            timeout = min(self.attempt_timeout, deadline - time.monotonic())
+            try:
+                if idempotent and self.hedge_after is not None and self.hedge_after < timeout:
+                    result = await self._hedged(operation, timeout)
+                else:
+                    result = await asyncio.wait_for(operation(), timeout=timeout)
+            except self.retry_on as e:
+                self.breaker.record_failure()
+                attempt += 1
+                delay = self._backoff(attempt)
+                if attempt >= self.max_attempts or time.monotonic() + delay >= deadline:
+                    self._failures += 1
+                    self._record_latency(started)
+                    logger.warning(f"{self.name}: giving up after {attempt} attempt(s): {e!r}")
+                    raise
+                self._retries += 1
+                logger.info(f"{self.name}: attempt {attempt} failed ({e!r}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+            except BaseException:
+                # Cancelled or a non-retryable error - neither says the upstream is unhealthy
+                self.breaker.release()
+                raise
+            else:
+                self.breaker.record_success()
+                self._record_latency(started)
+                return result
+
+    def _record_latency(self, started: float) -> None:
+        self._latencies.append(time.monotonic() - started)
+        if len(self._latencies) > 1000:
+            del self._latencies[:500]
+
+    def metrics(self) -> dict[str, Any]:
+        """Breaker state, outcome counters and latency percentiles."""
+        latencies = sorted(self._latencies)
+
+        def percentile(p: float) -> float | None:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 3)
+
+        return {
+            **self.breaker.metrics(),
+            "calls": self._calls,
+            "failures": self._failures,
+            "retries": self._retries,
+            "hedges": self._hedges,
+            "latency_p50": percentile(0.50),
+            "latency_p99": percentile(0.99),
+        }
+
+
+def raise_for_retryable_status(response: httpx.Response) -> httpx.Response:
+    """Raise UpstreamStatusError for retryable statuses, otherwise return the response."""
+    if response.status_code in RETRYABLE_STATUS_CODES:
+        raise UpstreamStatusError(response)
+    return response
@@ -0,0 +1,262 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Resumable server-sent event streams for ChatKit turns.
+
+A dropped connection used to lose the rest of a turn from the client's point
+of view, and retrying re-ran the whole pipeline - for an o3 expense analysis
+that is another 40 seconds of model time. ResumableStreams runs each streamed
+turn in its own task and keeps its most recent encoded events in a bounded
+ring buffer. Every event is sent with an SSE ``id:`` of ``<turn id>.<sequence>``,
+so a client that reconnects with a ``Last-Event-ID`` header gets the events it
+missed replayed and then follows the live turn.
+
+A turn that loses its client keeps running for ``resume_grace`` seconds. If
+nobody reconnects in that time it is cancelled, like any abandoned turn.
+Turns can also be started under a key, so a duplicate submission of the same
+message can join the running turn instead of starting another one.
+
+The last event of every complete turn is an SSE comment, END_OF_TURN. Some
+HTTP clients report a connection that drops mid-body as a normal end, so
+without the marker a client couldn't tell a finished turn from one it needs
+to resume.
+
+Turn ids are 128 random bits. The sample has no sign-in, so until an auth
+layer supplies an owner, knowing the turn id is the only protection against
+another client resuming a turn. With an owner, a turn can only be resumed or
+joined by the user who started it. A subscriber that falls behind the ring
+buffer gets a ChatKit error event instead of a silently truncated stream.
+"""
+
+import asyncio
+import logging
+import secrets
+from collections import deque
+from collections.abc import AsyncGenerator, AsyncIterable
+from typing import Any
+
+from chatkit.types import ErrorEvent
+
+logger = logging.getLogger(__name__)
+
+
+# Ends the stream of a turn that has finished; SSE parsers ignore comments
+END_OF_TURN = b": end of turn\n\n"
+
+# Sent to a subscriber whose next event has already left the ring buffer
+_FELL_BEHIND_EVENT = (
+    b"data: "
+    + ErrorEvent(message="This response fell too far behind and can't be resumed.", allow_retry=True)
+    .model_dump_json(exclude_none=True)
+    .encode()
+    + b"\n\n"
+)
+
+
+class _Turn:
+    """One streamed turn: its producer task, ring buffer and subscribers."""
+
+    def __init__(self, capacity: int, key: str | None, owner: str | None):
+        self.id = secrets.token_hex(16)
+        self.key = key
+        self.owner = owner
+        self.events: deque[tuple[int, bytes]] = deque(maxlen=capacity)
+        self.next_seq = 1
+        self.sent_seq = 0  # Highest sequence handed to a client
+        self.done = False
+        self.task: asyncio.Task[None] | None = None
+        self.subscribers = 0
+        self.grace: asyncio.TimerHandle | None = None
+
+        # Replaced after every new event, so each subscriber waits on the one it last saw
+        self.new_events = asyncio.Event()
+        self.space = asyncio.Event()
+
+    def notify(self) -> None:
+        """Wake every subscriber."""
+        self.new_events.set()
+        self.new_events = asyncio.Event()
+
+    @property
+    def first_seq(self) -> int:
+        """Oldest sequence number still buffered."""
+        return self.events[0][0] if self.events else self.next_seq
+
+
+class ResumableStreams:
+    """Runs ChatKit turns independently of their connections so clients can resume them.
+
+    Features:
+    - Bounded ring buffer of encoded events per turn
+    - SSE event ids and Last-Event-ID replay
+    - Several subscribers per turn, and joining a running turn by key
+    - Resume and join only by the turn's owner, once an auth layer supplies one
+    - Backpressure: a turn pauses once its client falls ``max_unsent`` events behind
+    - Grace period before a turn without a client is cancelled
+    - Resume and cancellation counters for the /metrics/streams endpoint
+    """
+
+    def __init__(
+        self,
+        capacity: int = 1024,
+        max_unsent: int = 512,
+        resume_grace: float = 15.0,
+        retention: float = 60.0,
+    ):
+        """Initialize the registry.
+
+        Args:
+            capacity: Events kept per turn for replay
+            max_unsent: Events a turn may run ahead of its client before pausing; the
+                rest of the buffer keeps already sent events for replay
+            resume_grace: Seconds a turn without a client keeps running before it is cancelled
+            retention: Seconds a finished turn stays available for late reconnects
+        """
+        self.capacity = capacity
+        self.max_unsent = min(max_unsent, capacity)
+        self.resume_grace = resume_grace
+        self.retention = retention
+        self._turns: dict[str, _Turn] = {}
+        self._running: dict[str, _Turn] = {}  # Running turns by key
+
+        self._started = 0
+        self._resumed = 0
+        self._resume_failed = 0
+        self._abandoned = 0
+        self._joined = 0
+
+    def start(
+        self, source: AsyncIterable[bytes], key: str | None = None, owner: str | None = None
+    ) -> AsyncGenerator[bytes, None]:
+        """Start running a turn in the background and subscribe to it from the beginning.
+
+        Args:
+            source: The turn's encoded SSE events, e.g. a ChatKit StreamingResult
+            key: Identifies the turn for join() while it is running
+            owner: The user who started the turn; only they can resume or join it
+
+        Returns:
+            The turn's events, framed with SSE ids
+        """
+        turn = _Turn(self.capacity, key, owner)
+        turn.task = asyncio.create_task(self._produce(turn, source), name=f"turn-stream-{turn.id}")
+        self._turns[turn.id] = turn
+        if key is not None:
+            self._running[key] = turn
+        self._started += 1
+        return self._subscribe(turn, 0)
+
+    def join(self, key: str, owner: str | None = None) -> AsyncGenerator[bytes, None] | None:
+        """Subscribe from the beginning to the running turn started with ``key``.
+
+        Args:
+            key: The key passed to start()
+            owner: The user asking to join
+
+        Returns:
+            The turn's events, or None if no turn with that key is running, it
+            belongs to someone else, or its first events are no longer buffered
+        """
+        turn = self._running.get(key)
+        if turn is None or turn.owner != owner or turn.first_seq > 1:
+            return None
+        self._joined += 1
+        logger.info(f"Joining running turn {turn.id} instead of starting a duplicate")
+        return self._subscribe(turn, 0)
+
+    def resume(self, last_event_id: str, owner: str | None = None) -> AsyncGenerator[bytes, None] | None:
+        """Subscribe to a turn again after the event a client last received.
+
+        Args:
+            last_event_id: The client's ``Last-Event-ID`` header
+            owner: The user asking to resume
+
+        Returns:
+            The events after ``last_event_id``, or None if the turn has expired,
+            belongs to someone else, or those events are no longer buffered
+        """
+        turn_id, _, seq = last_event_id.strip().rpartition(".")
+        turn = self._turns.get(turn_id)
+        if turn is None or turn.owner != owner or not seq.isdigit() or int(seq) + 1 < turn.first_seq:
+            self._resume_failed += 1
+            logger.info(f"Cannot resume stream from event {last_event_id!r}")
+            return None
+        self._resumed += 1
+        logger.info(f"Resuming turn {turn.id} after event {seq}")
+        return self._subscribe(turn, int(seq))
+
+    async def _produce(self, turn: _Turn, source: AsyncIterable[bytes]) -> None:
+        iterator = aiter(source)
+        try:
+            async for chunk in iterator:
+                while turn.next_seq - 1 - turn.sent_seq >= self.max_unsent:
+                    turn.space.clear()
+                    await turn.space.wait()
+                turn.events.append((turn.next_seq, chunk))
+                turn.next_seq += 1
+                turn.notify()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Turn {turn.id} stream failed: {e}", exc_info=True)
+        finally:
+            # Runs respond's cleanup when the turn was cancelled while paused
+            aclose = getattr(iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            turn.done = True
+            turn.notify()
+            if turn.key is not None and self._running.get(turn.key) is turn:
+                del self._running[turn.key]
+            asyncio.get_running_loop().call_later(self.retention, self._turns.pop, turn.id, None)
+
+    async def _subscribe(self, turn: _Turn, after_seq: int) -> AsyncGenerator[bytes, None]:
+        turn.subscribers += 1
+        if turn.grace is not None:
+            turn.grace.cancel()
+            turn.grace = None
+
+        seq = after_seq
+        try:
+            while True:
+                new_events = turn.new_events
+                if seq + 1 < turn.first_seq:
+                    logger.warning(f"Client fell behind turn {turn.id}'s buffer, ending its stream")
+                    yield _FELL_BEHIND_EVENT
+                    return
+                for event_seq, chunk in list(turn.events)[seq + 1 - turn.first_seq:]:
+                    yield f"id: {turn.id}.{event_seq}\n".encode() + chunk
+                    seq = event_seq
+                    if seq > turn.sent_seq:
+                        # The turn keeps pace with its fastest subscriber
+                        turn.sent_seq = seq
+                        turn.space.set()
+                if turn.done and seq >= turn.next_seq - 1:
+                    yield END_OF_TURN
+                    return
+                if seq >= turn.next_seq - 1:
+                    await new_events.wait()
+        finally:
+            turn.subscribers -= 1
+            if turn.subscribers == 0 and not turn.done:
+                turn.grace = asyncio.get_running_loop().call_later(self.resume_grace, self._abandon, turn)
+
+    def _abandon(self, turn: _Turn) -> None:
+        """Cancel a turn nobody resumed within the grace period."""
+        turn.grace = None
+        if turn.subscribers == 0 and turn.task is not None and not turn.task.done():
+            self._abandoned += 1
+            logger.info(f"No client resumed turn {turn.id} within {self.resume_grace:.0f}s, cancelling it")
+            turn.task.cancel()
+
+    def metrics(self) -> dict[str, Any]:
+        """Turn and resume counters."""
+        return {
+            "turns_buffered": len(self._turns),
+            "turns_running": sum(1 for turn in self._turns.values() if not turn.done),
+            "events_buffered": sum(len(turn.events) for turn in self._turns.values()),
+            "started": self._started,
+            "resumed": self._resumed,
+            "joined": self._joined,
+            "resume_failed": self._resume_failed,
+            "abandoned": self._abandoned,
+        }
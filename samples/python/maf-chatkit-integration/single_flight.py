@@ -0,0 +1,119 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Duplicate-submission detection and per-thread turn serialisation.
+
+Double-clicks and client retries send the same user message twice, and each
+copy used to run a full agent or o3 pipeline on the same thread. Two helpers
+prevent that:
+
+- ``turn_fingerprint`` keys a ChatKit request by thread and normalised
+  message, so a duplicate can join the turn already running for it (see
+  ResumableStreams.join)
+- ThreadLocks serialises the turns of one thread, so genuinely different
+  messages sent in quick succession don't race on ``load_thread_items`` and
+  each turn sees the previous one's reply
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# Requests that start a turn from a user message
+_MESSAGE_REQUEST_TYPES = ("threads.create", "threads.add_user_message")
+
+
+def turn_fingerprint(request_body: bytes, user: str | None) -> str | None:
+    """Key a ChatKit request that submits a user message.
+
+    Messages are compared after lower-casing and collapsing whitespace, together
+    with their attachments and quoted text. New threads have no id yet, so they
+    are keyed by user instead, and aren't deduplicated at all without one: two
+    people sending the same first message must not share a thread.
+
+    Args:
+        request_body: The raw ChatKit request
+        user: The authenticated user, or None if the request has no user identity
+
+    Returns:
+        The fingerprint, or None for requests that don't submit a message or
+        can't be keyed safely
+    """
+    try:
+        request = json.loads(request_body)
+    except ValueError:
+        return None
+    if not isinstance(request, dict) or request.get("type") not in _MESSAGE_REQUEST_TYPES:
+        return None
+
+    params = request.get("params") or {}
+    message = params.get("input") or {}
+    text = " ".join(
+        part.get("text", "") for part in message.get("content") or [] if isinstance(part, dict)
+    )
+    normalised = {
+        "text": " ".join(text.lower().split()),
+        "attachments": sorted(message.get("attachments") or []),
+        "quoted_text": " ".join((message.get("quoted_text") or "").lower().split()),
+    }
+    thread = params.get("thread_id")
+    if not thread:
+        if user is None:
+            return None
+        thread = f"new:{user}"
+    digest = hashlib.sha256(json.dumps(normalised, sort_keys=True).encode()).hexdigest()[:24]
+    return f"{thread}:{digest}"
+
+
+class ThreadLocks:
+    """One asyncio lock per thread, dropped once nobody holds or waits for it.
+
+    Features:
+    - Turns on the same thread run one at a time, in arrival order
+    - Turns on different threads never wait for each other
+    - Contention counters for the /metrics/streams endpoint
+    """
+
+    def __init__(self) -> None:
+        """Initialize the lock table."""
+        self._locks: dict[str, tuple[asyncio.Lock, int]] = {}  # Lock and holders plus waiters
+        self._acquired = 0
+        self._waited = 0
+
+    @asynccontextmanager
+    async def hold(self, thread_id: str) -> AsyncIterator[None]:
+        """Hold the lock of ``thread_id`` for the duration of the block.
+
+        Args:
+            thread_id: The thread whose turns are serialised
+        """
+        lock, users = self._locks.get(thread_id, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[thread_id] = (lock, users + 1)
+        try:
+            if lock.locked():
+                self._waited += 1
+                logger.info(f"Waiting for the running turn on thread {thread_id}")
+            async with lock:
+                self._acquired += 1
+                yield
+        finally:
+            lock, users = self._locks[thread_id]
+            if users <= 1:
+                del self._locks[thread_id]
+            else:
+                self._locks[thread_id] = (lock, users - 1)
+
+    def metrics(self) -> dict[str, Any]:
+        """Lock table size and contention counters."""
+        return {
+            "threads_locked": len(self._locks),
+            "turns_serialised": self._acquired,
+            "turns_waited": self._waited,
+        }
@@ -7,9 +7,11 @@ It includes proper thread safety, user isolation, and follows the ChatKit Store
 """
 
 import sqlite3
+import time
 import uuid
+from collections.abc import Iterable
 from pathlib import Path
-from typing import Any
+from typing import Any, Literal
 
 from chatkit.store import NotFoundError, Store
 from chatkit.types import (
@@ -20,6 +22,14 @@ from chatkit.types import (
 )
 from pydantic import BaseModel
 
+# Keeps IN (...) lists under SQLite's bound-parameter limit
+_SQL_BATCH_SIZE = 500
+
+# Ids of every attachment referenced by a stored user message
+_REFERENCED_ATTACHMENT_IDS = """SELECT json_extract(attachment.value, '$.id')
+    FROM items, json_each(items.data, '$.item.attachments') AS attachment
+    WHERE json_extract(attachment.value, '$.id') IS NOT NULL"""
+
 
 class ThreadData(BaseModel):
     """Model for serializing thread data to SQLite."""
@@ -33,10 +43,25 @@ class ItemData(BaseModel):
     item: ThreadItem
 
 
+class AttachmentProcessing(BaseModel):
+    """Results of post-upload processing for an attachment."""
+
+    status: Literal["pending", "ready", "failed"] = "pending"
+    mime_type: str | None = None  # Sniffed from the file's magic bytes
+    content_hash: str | None = None
+    size: int | None = None
+    thumbnail_path: str | None = None
+    vision_path: str | None = None
+    vision_mime_type: str | None = None
+    processing_seconds: float | None = None
+    error: str | None = None
+
+
 class AttachmentData(BaseModel):
     """Model for serializing attachment data to SQLite."""
 
     attachment: Attachment
+    processing: AttachmentProcessing | None = None
 
 
 class SQLiteStore(Store[dict[str, Any]]):
@@ -59,7 +84,7 @@ class SQLiteStore(Store[dict[str, Any]]):
         db_path_obj.parent.mkdir(parents=True, exist_ok=True)
         self._create_tables()
 
-    def _create_connection(self):
+    def _create_connection(self) -> sqlite3.Connection:
         """Create a database connection with WAL mode for better concurrency."""
         conn = sqlite3.connect(self.db_path, check_same_thread=False)
         conn.execute("PRAGMA journal_mode=WAL")
@@ -94,9 +119,16 @@ class SQLiteStore(Store[dict[str, Any]]):
                 """CREATE TABLE IF NOT EXISTS attachments (
                 id TEXT PRIMARY KEY,
                 user_id TEXT NOT NULL,
-                data TEXT NOT NULL
+                data TEXT NOT NULL,
+                created_at REAL
                 )"""
             )
+
+            # Databases created before attachment retention lack created_at
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(attachments)")}
+            if "created_at" not in columns:
+                conn.execute("ALTER TABLE attachments ADD COLUMN created_at REAL")
+                conn.execute("UPDATE attachments SET created_at = ?", (time.time(),))
             conn.commit()
 
     def generate_thread_id(self, context: dict[str, Any]) -> str:
@@ -210,11 +242,12 @@ class SQLiteStore(Store[dict[str, Any]]):
         with self._create_connection() as conn:
             attachment_data = AttachmentData(attachment=attachment)
             conn.execute(
-                "INSERT OR REPLACE INTO attachments (id, user_id, data) VALUES (?, ?, ?)",
+                "INSERT OR REPLACE INTO attachments (id, user_id, data, created_at) VALUES (?, ?, ?, ?)",
                 (
                     attachment.id,
                     user_id,
                     attachment_data.model_dump_json(),
+                    time.time(),
                 ),
             )
             conn.commit()
@@ -235,6 +268,66 @@ class SQLiteStore(Store[dict[str, Any]]):
             attachment_data = AttachmentData.model_validate_json(cursor[0])
             return attachment_data.attachment
 
+    async def save_attachment_processing(self, attachment_id: str, processing: AttachmentProcessing) -> None:
+        """Record post-upload processing results on existing attachment metadata."""
+        with self._create_connection() as conn:
+            row = conn.execute("SELECT data FROM attachments WHERE id = ?", (attachment_id,)).fetchone()
+            if row is None:
+                return
+
+            attachment_data = AttachmentData.model_validate_json(row[0])
+            attachment_data.processing = processing
+            conn.execute(
+                "UPDATE attachments SET data = ? WHERE id = ?",
+                (attachment_data.model_dump_json(), attachment_id),
+            )
+            conn.commit()
+
+    async def load_attachment_processing(self, attachment_id: str) -> AttachmentProcessing | None:
+        """Load post-upload processing results, or None if there are none."""
+        with self._create_connection() as conn:
+            row = conn.execute("SELECT data FROM attachments WHERE id = ?", (attachment_id,)).fetchone()
+
+            if row is None:
+                return None
+
+            return AttachmentData.model_validate_json(row[0]).processing
+
+    async def existing_attachment_ids(self, attachment_ids: Iterable[str]) -> set[str]:
+        """Return which of the given attachment ids still have metadata."""
+        ids = list(attachment_ids)
+        found: set[str] = set()
+        with self._create_connection() as conn:
+            for start in range(0, len(ids), _SQL_BATCH_SIZE):
+                batch = ids[start:start + _SQL_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(f"SELECT id FROM attachments WHERE id IN ({placeholders})", batch)
+                found.update(row[0] for row in rows)
+        return found
+
+    async def find_orphaned_attachments(self, created_before: float) -> list[str]:
+        """Find attachments created before a timestamp that no thread item references.
+
+        These are uploads that were never sent, or never finished uploading.
+        """
+        with self._create_connection() as conn:
+            rows = conn.execute(
+                f"""SELECT id FROM attachments
+                WHERE created_at < ? AND id NOT IN ({_REFERENCED_ATTACHMENT_IDS})""",
+                (created_before,),
+            ).fetchall()
+            return [row[0] for row in rows]
+
+    async def delete_attachments(self, attachment_ids: Iterable[str]) -> None:
+        """Delete attachment metadata for any user, used by garbage collection."""
+        ids = list(attachment_ids)
+        with self._create_connection() as conn:
+            for start in range(0, len(ids), _SQL_BATCH_SIZE):
+                batch = ids[start:start + _SQL_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                conn.execute(f"DELETE FROM attachments WHERE id IN ({placeholders})", batch)
+            conn.commit()
+
     async def delete_attachment(self, attachment_id: str, context: dict[str, Any]) -> None:
         """Delete attachment metadata."""
         user_id = context.get("user_id", "demo_user")
@@ -338,10 +431,22 @@ class SQLiteStore(Store[dict[str, Any]]):
             return item_data.item
 
     async def delete_thread(self, thread_id: str, context: dict[str, Any]) -> None:
-        """Delete a thread and all its items."""
+        """Delete a thread, all its items and the metadata of their attachments.
+
+        Attachment files are left for the garbage collector, which removes files
+        that no longer have metadata.
+        """
         user_id = context.get("user_id", "demo_user")
 
         with self._create_connection() as conn:
+            conn.execute(
+                """DELETE FROM attachments WHERE id IN (
+                SELECT json_extract(attachment.value, '$.id')
+                FROM items, json_each(items.data, '$.item.attachments') AS attachment
+                WHERE items.thread_id = ? AND items.user_id = ?
+                )""",
+                (thread_id, user_id),
+            )
             conn.execute(
                 "DELETE FROM threads WHERE id = ? AND user_id = ?",
                 (thread_id, user_id),
@@ -0,0 +1,151 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Disconnect handling and bounded buffering for server-sent event streams.
+
+A ChatKit turn keeps calling models and tools for as long as its event stream
+is being consumed. StreamGuard sits between ``chatkit_server.process`` and the
+StreamingResponse and makes sure that stops as soon as nobody is listening:
+
+- the client is polled for disconnects while the turn is still working, not
+  only when the next event is sent
+- at most ``max_buffered`` events wait for a slow client; once the buffer is
+  full the turn pauses, so upstream streams are throttled instead of piling up
+  in memory
+- a client that stays connected but stops reading for ``stall_timeout``
+  seconds is treated as gone
+
+In each case the source stream is closed. For a plain ChatKit stream that
+cancels ``respond`` and closes the model, vision and tool calls it is waiting
+on; for a ResumableStreams subscription it detaches the client, and the turn is
+cancelled if nobody resumes it within the grace period.
+"""
+
+import asyncio
+import logging
+from collections.abc import AsyncIterable, AsyncIterator, Awaitable, Callable
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class StreamGuard:
+    """Relays event streams to clients, cancelling them when the client goes away.
+
+    Features:
+    - Disconnect polling independent of event flow
+    - Bounded per-stream buffer for backpressure
+    - Stall detection for clients that stop reading
+    - Stream outcome counters for the /metrics/streams endpoint
+    """
+
+    def __init__(
+        self,
+        max_buffered: int = 64,
+        stall_timeout: float = 30.0,
+        disconnect_poll: float = 1.0,
+    ):
+        """Initialize the guard.
+
+        Args:
+            max_buffered: Events buffered per stream before the turn is paused
+            stall_timeout: Seconds a full buffer may wait for the client before the turn is cancelled
+            disconnect_poll: Seconds between client disconnect checks
+        """
+        self.max_buffered = max_buffered
+        self.stall_timeout = stall_timeout
+        self.disconnect_poll = disconnect_poll
+
+        self._active = 0
+        self._outcomes = {"completed": 0, "failed": 0, "disconnected": 0, "stalled": 0}
+        self._buffer_high_water = 0
+
+    async def guard(
+        self,
+        source: AsyncIterable[bytes],
+        is_disconnected: Callable[[], Awaitable[bool]],
+    ) -> AsyncIterator[bytes]:
+        """Relay ``source`` through a bounded buffer until it ends or the client leaves.
+
+        Args:
+            source: Encoded events, e.g. a ChatKit StreamingResult
+            is_disconnected: Checks whether the client has gone, e.g. ``request.is_disconnected``
+
+        Yields:
+            The events of ``source``, in order
+        """
+        queue: asyncio.Queue[bytes | None] = asyncio.Queue(maxsize=self.max_buffered)
+        outcome = "completed"
+        error: BaseException | None = None
+
+        def stop(reason: str) -> None:
+            """Drop undelivered events and wake the consumer."""
+            nonlocal outcome
+            if outcome == "completed":
+                # Counted straight away - a stalled client may keep the response open for a long time
+                outcome = reason
+                self._outcomes[reason] += 1
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+        async def produce() -> None:
+            nonlocal error, outcome
+            iterator = aiter(source)
+            try:
+                async for chunk in iterator:
+                    try:
+                        await asyncio.wait_for(queue.put(chunk), self.stall_timeout)
+                    except asyncio.TimeoutError:
+                        logger.warning(f"Client stopped reading for {self.stall_timeout:.0f}s, cancelling stream")
+                        stop("stalled")
+                        return
+                    self._buffer_high_water = max(self._buffer_high_water, queue.qsize())
+                await queue.put(None)
+            except Exception as e:
+                error, outcome = e, "failed"
+                await queue.put(None)  # Deliver what was buffered, then the error
+            finally:
+                # Runs respond's cleanup when the loop was left early
+                aclose = getattr(iterator, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+
+        async def watch() -> None:
+            while not await is_disconnected():
+                await asyncio.sleep(self.disconnect_poll)
+            logger.info("Client disconnected, cancelling stream")
+            producer.cancel()
+            stop("disconnected")
+
+        self._active += 1
+        producer = asyncio.create_task(produce(), name="stream-guard-producer")
+        watcher = asyncio.create_task(watch(), name="stream-guard-watcher")
+        try:
+            while (chunk := await queue.get()) is not None:
+                yield chunk
+            if error is not None:
+                raise error
+        finally:
+            watcher.cancel()
+            if not producer.done():
+                # The response was closed before the stream ended - the client is gone
+                if outcome == "completed":
+                    outcome = "disconnected"
+                    self._outcomes[outcome] += 1
+                producer.cancel()
+                try:
+                    await producer
+                except asyncio.CancelledError:
+                    pass
+            elif outcome in ("completed", "failed"):
+                self._outcomes[outcome] += 1
+            self._active -= 1
+
+    def metrics(self) -> dict[str, Any]:
+        """Stream outcomes and buffer usage."""
+        return {
+            "active": self._active,
+            **self._outcomes,
+            "max_buffered": self.max_buffered,
+            "buffer_high_water": self._buffer_high_water,
+        }
@@ -0,0 +1,207 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Incremental JSON parsing for streamed structured model output.
+
+Models asked for a JSON answer stream it a few characters at a time and often
+wrap it in a markdown code fence. IncrementalJSONParser scans the stream once,
+skips anything before the opening brace and after the closing one, and hands
+back each top-level field of the object as soon as its value is complete - so
+callers can act on ``can_park`` long before ``detailed_analysis`` has arrived.
+"""
+
+import json
+import re
+from typing import Any
+
+# Characters that change the parser state outside and inside strings
+_STRUCTURAL = re.compile(r'[{}\[\]",:]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_WHITESPACE = " \t\n\r"
+
+# What the top-level object expects next, as shown in JSONDecodeError messages
+_FIRST_KEY = "property name or '}'"
+_KEY = "property name enclosed in double quotes"
+_COLON = "':' delimiter"
+_VALUE = "value"
+_COMMA = "',' delimiter or '}'"
+
+
+class IncrementalJSONParser:
+    """Streaming parser for a single top-level JSON object.
+
+    Features:
+    - Accepts arbitrary chunk boundaries, including mid-string and mid-escape
+    - Ignores markdown fences and any other text around the object
+    - Reports top-level fields as they complete; strings, objects and arrays
+      complete on their closing character, numbers and literals on the next
+      comma or closing brace
+    - Rejects missing, repeated or misplaced separators as soon as they arrive
+    """
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._pos = 0
+        self._started = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+
+        # Top-level object state
+        self._expect = _FIRST_KEY
+        self._key_start = -1
+        self._key: str | None = None
+        self._value_start = -1
+
+        self.fields: dict[str, Any] = {}
+
+    @property
+    def complete(self) -> bool:
+        """Whether the closing brace of the top-level object has been seen."""
+        return self._done
+
+    def _error(self, pos: int) -> json.JSONDecodeError:
+        return json.JSONDecodeError(f"Expecting {self._expect}", self._buffer, pos)
+
+    def _check_blank(self, start: int, end: int) -> None:
+        """Raise unless the text between two top-level tokens is whitespace."""
+        extra = self._buffer[start:end].lstrip(_WHITESPACE)
+        if extra:
+            raise self._error(end - len(extra))
+
+    def _start_value(self, start: int) -> None:
+        """Mark where a string, object or array value opens."""
+        self._check_blank(self._value_start, start)
+        self._value_start = start
+
+    def _emit(self, end: int, new_fields: dict[str, Any]) -> None:
+        """Decode the current value, ending before ``end``, and record it."""
+        if self._key is None:
+            raise json.JSONDecodeError("Expecting property name before the value", self._buffer, self._value_start)
+        value = json.loads(self._buffer[self._value_start:end])
+        self.fields[self._key] = value
+        new_fields[self._key] = value
+        self._expect = _COMMA
+
+    def feed(self, chunk: str) -> dict[str, Any]:
+        """Consume the next chunk of model output.
+
+        Args:
+            chunk: Text as received from the stream
+
+        Returns:
+            Top-level fields completed by this chunk (empty if none)
+
+        Raises:
+            json.JSONDecodeError: If the output so far is not the start of a valid JSON object
+        """
+        if self._done or not chunk:
+            return {}
+
+        new_fields: dict[str, Any] = {}
+        self._buffer += chunk
+        buffer = self._buffer
+
+        if not self._started:
+            start = buffer.find("{", self._pos)
+            if start < 0:
+                self._pos = len(buffer)
+                return new_fields
+            self._started = True
+            self._depth = 1
+            self._pos = start + 1
+
+        pos = self._pos
+        while True:
+            if self._in_string:
+                match = _STRING_SPECIAL.search(buffer, pos)
+                if match is None:
+                    pos = len(buffer)
+                    break
+                pos = match.start()
+                if buffer[pos] == "\\":
+                    if pos + 1 >= len(buffer):
+                        break  # Escape split across chunks - wait for the rest
+                    pos += 2
+                    continue
+                self._in_string = False
+                pos += 1
+                if self._depth == 1:
+                    if self._expect == _KEY:
+                        self._key = json.loads(buffer[self._key_start:pos])
+                        self._expect = _COLON
+                    else:
+                        self._emit(pos, new_fields)
+                continue
+
+            match = _STRUCTURAL.search(buffer, pos)
+            end = len(buffer) if match is None else match.start()
+            if self._depth == 1 and self._expect != _VALUE:
+                self._check_blank(pos, end)
+            if match is None:
+                pos = end
+                break
+            char = buffer[end]
+            pos = end + 1
+
+            # Nested values are only tracked to find their end, json.loads validates them
+            if self._depth > 1:
+                if char == '"':
+                    self._in_string = True
+                elif char in "{[":
+                    self._depth += 1
+                elif char in "}]":
+                    self._depth -= 1
+                    if self._depth == 1:
+                        self._emit(pos, new_fields)
+                continue
+
+            if char == '"':
+                if self._expect in (_FIRST_KEY, _KEY):
+                    self._expect = _KEY
+                    self._key_start = end
+                elif self._expect == _VALUE:
+                    self._start_value(end)
+                else:
+                    raise self._error(end)
+                self._in_string = True
+            elif char in "{[":
+                if self._expect != _VALUE:
+                    raise self._error(end)
+                self._start_value(end)
+                self._depth += 1
+            elif char == ":":
+                if self._expect != _COLON:
+                    raise self._error(end)
+                self._expect = _VALUE
+                self._value_start = pos
+            elif char == ",":
+                if self._expect == _VALUE:
+                    self._emit(end, new_fields)
+                elif self._expect != _COMMA:
+                    raise self._error(end)
+                self._expect = _KEY
+                self._key = None
+            elif char == "}":
+                if self._expect == _VALUE:
+                    self._emit(end, new_fields)
+                elif self._expect not in (_FIRST_KEY, _COMMA):
+                    raise self._error(end)
+                self._depth = 0
+                self._done = True
+                break
+            else:  # A "]" that closes nothing
+                raise self._error(end)
+
+        self._pos = pos
+        return new_fields
+
+    def result(self) -> dict[str, Any]:
+        """Return the parsed object once the stream has finished.
+
+        Raises:
+            json.JSONDecodeError: If the object was never opened or closed
+        """
+        if not self._done:
+            message = "Incomplete JSON object" if self._started else "No JSON object found"
+            raise json.JSONDecodeError(message, self._buffer, len(self._buffer))
+        return dict(self.fields)
@@ -0,0 +1,68 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Tests for vision image preprocessing: EXIF orientation and downscaling."""
+
+import io
+
+import pytest
+from PIL import Image
+
+from image_preprocess import prepare_vision_image, vision_target_size
+
+
+def _jpeg(size: tuple[int, int], orientation: int | None = None) -> bytes:
+    """A white JPEG with a black top-left quarter and an optional orientation tag."""
+    image = Image.new("L", size, 255)
+    image.paste(0, (0, 0, size[0] // 2, size[1] // 2))
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[0x0112] = orientation
+    output = io.BytesIO()
+    image.save(output, format="JPEG", exif=exif.tobytes())
+    return output.getvalue()
+
+
+def _top_left_is_dark(data: bytes) -> bool:
+    with Image.open(io.BytesIO(data)) as image:
+        pixel = image.convert("L").getpixel((2, 2))
+    assert isinstance(pixel, int)
+    return pixel < 128
+
+
+def test_small_upright_jpeg_is_sent_unchanged() -> None:
+    data = _jpeg((200, 100), orientation=1)
+    assert _top_left_is_dark(data)
+    assert prepare_vision_image(data, "image/jpeg") == (data, "image/jpeg")
+
+
+@pytest.mark.parametrize("orientation", [2, 3, 4])
+def test_small_jpeg_with_same_size_orientation_is_re_encoded(orientation: int) -> None:
+    # Flips and 180-degree turns keep the image size, but still have to be applied
+    data = _jpeg((200, 100), orientation=orientation)
+    prepared, content_type = prepare_vision_image(data, "image/jpeg")
+
+    assert content_type == "image/jpeg"
+    assert prepared != data
+    assert not _top_left_is_dark(prepared)
+    with Image.open(io.BytesIO(prepared)) as image:
+        assert image.size == (200, 100)
+        assert image.getexif().get(0x0112, 1) == 1
+
+
+def test_rotated_jpeg_is_re_encoded_upright() -> None:
+    data = _jpeg((200, 100), orientation=6)
+    prepared, _ = prepare_vision_image(data, "image/jpeg")
+    with Image.open(io.BytesIO(prepared)) as image:
+        assert image.size == (100, 200)
+
+
+def test_large_image_is_downscaled() -> None:
+    data = _jpeg((4000, 3000))
+    prepared, content_type = prepare_vision_image(data, "image/jpeg")
+    with Image.open(io.BytesIO(prepared)) as image:
+        assert image.size == vision_target_size(4000, 3000) == (1024, 768)
+    assert content_type == "image/jpeg"
+
+
+def test_undecodable_image_is_sent_unchanged() -> None:
+    assert prepare_vision_image(b"not an image", "image/png") == (b"not an image", "image/png")
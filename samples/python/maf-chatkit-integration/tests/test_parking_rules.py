@@ -0,0 +1,71 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Tests for the parking rule engine: normalising sign text and evaluating overlapping rules."""
+
+from datetime import datetime
+
+from parking_rules import ParkingSchedule, normalise_restrictions, parse_days, parse_duration, parse_time_ranges
+from parking_widget import ParkingRestriction
+
+# 19 October 2026 is a Monday
+MONDAY = datetime(2026, 10, 19)
+
+
+def _schedule(*restrictions: ParkingRestriction) -> ParkingSchedule:
+    return normalise_restrictions(list(restrictions))
+
+
+def test_parses_sign_text() -> None:
+    assert parse_time_ranges("8am-6pm") == [(8 * 60, 18 * 60)]
+    assert parse_time_ranges("10pm to 6am") == [(22 * 60, 6 * 60)]
+    assert parse_time_ranges("All times") == [(0, 24 * 60)]
+    assert parse_days("Mon-Fri") == [0, 1, 2, 3, 4]
+    assert parse_days("Sat & Sun") == [5, 6]
+    assert parse_duration("2P") == 120
+    assert parse_duration("1/2P") == 30
+
+
+def test_time_limit_applies_inside_its_window() -> None:
+    schedule = _schedule(ParkingRestriction(type="2P", hours="8am-6pm", days="Mon-Fri"))
+
+    evaluation = schedule.evaluate(MONDAY.replace(hour=10))
+    assert evaluation.can_park
+    assert evaluation.verdict == "Yes, 2 hours max until 6:00 PM"
+
+    evaluation = schedule.evaluate(MONDAY.replace(hour=19))
+    assert evaluation.verdict == "Yes, no restrictions apply until Tue 8:00 AM"
+
+
+def test_overridden_time_limit_does_not_end_a_prohibition() -> None:
+    schedule = _schedule(
+        ParkingRestriction(type="2P", hours="8am-6pm", days="Mon-Fri"),
+        ParkingRestriction(type="No Stopping", hours="4pm-7pm", days="Mon-Fri"),
+    )
+
+    # The 2P window ends at 6pm, but No Stopping decides the answer until 7pm
+    evaluation = schedule.evaluate(MONDAY.replace(hour=17))
+    assert not evaluation.can_park
+    assert evaluation.verdict == "No, stopping is not allowed until 7:00 PM"
+    assert evaluation.time_limit is None
+    assert len(evaluation.active) == 2
+
+    evaluation = schedule.evaluate(MONDAY.replace(hour=15))
+    assert evaluation.verdict == "Yes, 2 hours max until 4:00 PM"
+
+
+def test_weekend_has_no_restrictions_until_monday() -> None:
+    schedule = _schedule(ParkingRestriction(type="No Parking", hours="7am-9am", days="Mon-Fri"))
+
+    evaluation = schedule.evaluate(datetime(2026, 10, 24, 12))
+    assert evaluation.can_park
+    assert evaluation.verdict == "Yes, no restrictions apply until Mon 7:00 AM"
+
+
+def test_unparsed_restrictions_make_the_answer_uncertain() -> None:
+    schedule = _schedule(
+        ParkingRestriction(type="2P", hours="8am-6pm", days="Mon-Fri"),
+        ParkingRestriction(type="Special Event", hours="see website"),
+    )
+
+    assert schedule.unparsed == ["Special Event"]
+    assert not schedule.evaluate(MONDAY.replace(hour=10)).certain
@@ -0,0 +1,99 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Tests for the AviationStack quota: token-bucket refill, priority ordering and shedding."""
+
+import asyncio
+import time
+
+import pytest
+
+from quota import Priority, QuotaExceededError, QuotaManager, TokenBucket
+
+
+def test_token_bucket_refills_over_time() -> None:
+    bucket = TokenBucket(capacity=2, refill_per_second=20.0)
+    assert bucket.try_take()
+    assert bucket.try_take()
+    assert not bucket.try_take()
+    assert 0 < bucket.seconds_until_available() <= 0.05
+
+    time.sleep(0.06)
+    assert bucket.try_take()
+    assert not bucket.try_take()
+
+
+def test_token_bucket_never_exceeds_capacity() -> None:
+    bucket = TokenBucket(capacity=2, refill_per_second=100.0)
+    time.sleep(0.05)
+    assert [bucket.try_take() for _ in range(3)] == [True, True, False]
+
+
+def test_drain_pauses_the_bucket() -> None:
+    bucket = TokenBucket(capacity=5, refill_per_second=10.0)
+    bucket.drain(0.1)
+    assert not bucket.try_take()
+    assert bucket.seconds_until_available() == pytest.approx(0.2, abs=0.02)
+
+
+def test_interactive_requests_are_served_before_background() -> None:
+    async def scenario() -> list[str]:
+        # One token a tenth of a second, none to start with
+        quota = QuotaManager("stub", per_minute=600, per_month=1000)
+        quota.report_throttled(0.0)
+        order: list[str] = []
+
+        async def request(name: str, priority: Priority) -> None:
+            await quota.acquire(priority, max_wait=5.0)
+            order.append(name)
+
+        background = [asyncio.create_task(request(f"background-{n}", Priority.BACKGROUND)) for n in range(2)]
+        await asyncio.sleep(0.01)
+        interactive = [asyncio.create_task(request(f"interactive-{n}", Priority.INTERACTIVE)) for n in range(2)]
+        await asyncio.gather(*background, *interactive)
+        return order
+
+    assert asyncio.run(scenario()) == ["interactive-0", "interactive-1", "background-0", "background-1"]
+
+
+def test_requests_are_shed_when_the_wait_is_too_long() -> None:
+    async def scenario() -> QuotaManager:
+        quota = QuotaManager("stub", per_minute=60, per_month=1000)
+        quota.report_throttled(5.0)
+        with pytest.raises(QuotaExceededError) as error:
+            await quota.acquire(Priority.INTERACTIVE, max_wait=0.1)
+        assert error.value.retry_after is not None and error.value.retry_after > 4
+        return quota
+
+    metrics = asyncio.run(scenario()).metrics()
+    assert metrics["shed"]["interactive"] == 1
+    assert metrics["month_used"] == 0
+
+
+def test_background_requests_leave_the_monthly_reserve() -> None:
+    async def scenario() -> None:
+        quota = QuotaManager("stub", per_minute=100, per_month=10, background_reserve=0.2)
+        for _ in range(8):
+            await quota.acquire(Priority.BACKGROUND)
+        with pytest.raises(QuotaExceededError):
+            await quota.acquire(Priority.BACKGROUND)
+        await quota.acquire(Priority.INTERACTIVE)
+        await quota.acquire(Priority.INTERACTIVE)
+        with pytest.raises(QuotaExceededError):
+            await quota.acquire(Priority.INTERACTIVE)
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_displaces_background_waiters() -> None:
+    async def scenario() -> None:
+        quota = QuotaManager("stub", per_minute=60, per_month=1000, max_queue=1)
+        quota.report_throttled(0.5)
+        background = asyncio.create_task(quota.acquire(Priority.BACKGROUND, max_wait=5.0))
+        await asyncio.sleep(0.01)
+        interactive = asyncio.create_task(quota.acquire(Priority.INTERACTIVE, max_wait=5.0))
+
+        with pytest.raises(QuotaExceededError):
+            await background
+        await interactive
+
+    asyncio.run(scenario())
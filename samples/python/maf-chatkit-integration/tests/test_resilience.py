@@ -0,0 +1,198 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Tests for circuit breaking, retries, deadlines and hedging against a fault-injecting stub server."""
+
+import asyncio
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+
+from resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    Upstream,
+    UpstreamStatusError,
+    raise_for_retryable_status,
+)
+
+# A fault is (seconds to wait before answering, status code), applied to requests in arrival order
+Fault = tuple[float, int]
+
+
+class _StubServer:
+    """A local HTTP server that answers each request with the next scripted fault."""
+
+    def __init__(self, faults: list[Fault], default: Fault = (0.0, 200)) -> None:
+        self.faults = list(faults)
+        self.default = default
+        self.requests = 0
+        self.url = ""
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            self.requests += 1
+            delay, status = self.faults.pop(0) if self.faults else self.default
+            await asyncio.sleep(delay)
+            body = f'{{"request": {self.requests}}}'.encode()
+            writer.write(
+                f"HTTP/1.1 {status} Stub\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    @asynccontextmanager
+    async def running(self) -> AsyncIterator["_StubServer"]:
+        server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/"
+        try:
+            yield self
+        finally:
+            server.close()
+
+
+def _get(client: httpx.AsyncClient, url: str) -> Callable[[], Awaitable[httpx.Response]]:
+    async def attempt() -> httpx.Response:
+        return raise_for_retryable_status(await client.get(url))
+
+    return attempt
+
+
+def test_breaker_opens_probes_and_closes() -> None:
+    breaker = CircuitBreaker("stub", failure_threshold=2, recovery_timeout=0.05)
+
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    breaker.before_call()  # The probe
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # Only one probe at a time
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.metrics()["trips"] == 1
+    assert breaker.metrics()["rejected"] == 2
+
+
+def test_failed_probe_reopens_the_breaker() -> None:
+    breaker = CircuitBreaker("stub", failure_threshold=1, recovery_timeout=0.05)
+    breaker.before_call()
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_cancelled_probe_is_released() -> None:
+    async def scenario() -> None:
+        upstream = Upstream("stub", attempt_timeout=5.0, deadline=5.0, failure_threshold=1, recovery_timeout=0.05)
+        upstream.breaker.before_call()
+        upstream.breaker.record_failure()
+        await asyncio.sleep(0.06)
+
+        async with _StubServer([(5.0, 200)]).running() as stub, httpx.AsyncClient() as client:
+            probe = asyncio.create_task(upstream.call(_get(client, stub.url)))
+            await asyncio.sleep(0.1)
+            assert upstream.breaker.state == "half_open"
+            probe.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await probe
+
+            # Without the release the breaker would reject every call from here on
+            response = await upstream.call(_get(client, stub.url))
+            assert response.status_code == 200
+            assert upstream.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_retries_then_succeeds() -> None:
+    async def scenario() -> None:
+        upstream = Upstream("stub", attempt_timeout=2.0, deadline=5.0, base_delay=0.01)
+        async with _StubServer([(0.0, 503), (0.0, 502)]).running() as stub, httpx.AsyncClient() as client:
+            response = await upstream.call(_get(client, stub.url))
+            assert response.status_code == 200
+            assert stub.requests == 3
+        assert upstream.metrics()["retries"] == 2
+        assert upstream.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_gives_up_after_max_attempts() -> None:
+    async def scenario() -> None:
+        upstream = Upstream("stub", attempt_timeout=2.0, deadline=5.0, max_attempts=3, base_delay=0.01)
+        async with _StubServer([], default=(0.0, 503)).running() as stub, httpx.AsyncClient() as client:
+            with pytest.raises(UpstreamStatusError) as error:
+                await upstream.call(_get(client, stub.url))
+            assert error.value.response.status_code == 503
+            assert stub.requests == 3
+        assert upstream.metrics()["failures"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_gives_up_at_the_deadline() -> None:
+    async def scenario() -> None:
+        upstream = Upstream("stub", attempt_timeout=0.2, deadline=0.5, max_attempts=10, base_delay=0.01)
+        async with _StubServer([], default=(5.0, 200)).running() as stub, httpx.AsyncClient() as client:
+            started = time.monotonic()
+            with pytest.raises(asyncio.TimeoutError):
+                await upstream.call(_get(client, stub.url))
+            assert time.monotonic() - started < 1.0
+            assert stub.requests < 10
+
+    asyncio.run(scenario())
+
+
+def test_non_retryable_status_is_returned_without_retrying() -> None:
+    async def scenario() -> None:
+        upstream = Upstream("stub", attempt_timeout=2.0, deadline=5.0, base_delay=0.01)
+        async with _StubServer([(0.0, 404)]).running() as stub, httpx.AsyncClient() as client:
+            response = await upstream.call(_get(client, stub.url))
+            assert response.status_code == 404
+            assert stub.requests == 1
+
+    asyncio.run(scenario())
+
+
+def test_hedged_request_wins_over_a_slow_first_attempt() -> None:
+    async def scenario() -> None:
+        upstream = Upstream("stub", attempt_timeout=5.0, deadline=5.0, hedge_after=0.1)
+        async with _StubServer([(3.0, 200), (0.0, 200)]).running() as stub, httpx.AsyncClient() as client:
+            started = time.monotonic()
+            response = await upstream.call(_get(client, stub.url), idempotent=True)
+            assert time.monotonic() - started < 1.0
+            assert response.json() == {"request": 2}
+        assert upstream.metrics()["hedges"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_non_idempotent_calls_are_not_hedged() -> None:
+    async def scenario() -> None:
+        upstream = Upstream("stub", attempt_timeout=5.0, deadline=5.0, hedge_after=0.05)
+        async with _StubServer([(0.2, 200)]).running() as stub, httpx.AsyncClient() as client:
+            await upstream.call(_get(client, stub.url))
+            assert stub.requests == 1
+        assert upstream.metrics()["hedges"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,142 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Tests for resumable turn streams: reconnecting mid-stream, ownership and buffer overruns."""
+
+import asyncio
+import json
+from collections.abc import AsyncIterator
+
+from resumable_stream import END_OF_TURN, ResumableStreams
+
+
+class _Pipeline:
+    """A fake turn that emits numbered SSE events and counts how often it runs."""
+
+    def __init__(self, events: int, delay: float = 0.0) -> None:
+        self.events = events
+        self.delay = delay
+        self.runs = 0
+        self.cancelled = False
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        self.runs += 1
+        try:
+            for n in range(1, self.events + 1):
+                await asyncio.sleep(self.delay)
+                yield f"data: {n}\n\n".encode()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+def _parse(frame: bytes) -> tuple[str | None, str | None]:
+    """Split an SSE frame into its id and data."""
+    event_id = data = None
+    for line in frame.decode().splitlines():
+        if line.startswith("id: "):
+            event_id = line[4:]
+        elif line.startswith("data: "):
+            data = line[6:]
+    return event_id, data
+
+
+def test_reconnect_after_connection_killed_mid_stream() -> None:
+    async def run() -> None:
+        streams = ResumableStreams(capacity=64, max_unsent=32, resume_grace=5.0)
+        pipeline = _Pipeline(events=20, delay=0.001)
+
+        received: list[str | None] = []
+        last_event_id = None
+        first = streams.start(pipeline.stream())
+        async for frame in first:
+            last_event_id, data = _parse(frame)
+            received.append(data)
+            if len(received) == 7:
+                break
+        await first.aclose()  # The connection dies
+
+        assert last_event_id is not None
+        resumed = streams.resume(last_event_id)
+        assert resumed is not None
+        frames = [frame async for frame in resumed]
+        assert frames[-1] == END_OF_TURN
+        received += [_parse(frame)[1] for frame in frames[:-1]]
+
+        assert received == [str(n) for n in range(1, 21)]
+        assert pipeline.runs == 1
+        assert streams.metrics()["resumed"] == 1
+
+    asyncio.run(run())
+
+
+def test_resume_is_refused_for_another_owner_or_unknown_turn() -> None:
+    async def run() -> None:
+        streams = ResumableStreams()
+        pipeline = _Pipeline(events=3)
+        frames = [frame async for frame in streams.start(pipeline.stream(), owner="alice")]
+        event_id, _ = _parse(frames[0])
+        assert event_id is not None
+
+        assert streams.resume(event_id, owner="bob") is None
+        assert streams.resume(event_id) is None
+        assert streams.resume("0123456789ab.1", owner="alice") is None
+        assert streams.resume(event_id, owner="alice") is not None
+
+    asyncio.run(run())
+
+
+def test_join_is_refused_for_another_owner() -> None:
+    async def run() -> None:
+        streams = ResumableStreams()
+        pipeline = _Pipeline(events=3, delay=0.01)
+        first = streams.start(pipeline.stream(), key="thread:message", owner="alice")
+
+        assert streams.join("thread:message", owner="bob") is None
+        joined = streams.join("thread:message", owner="alice")
+        assert joined is not None
+
+        await asyncio.gather(*(_drain(stream) for stream in (first, joined)))
+        assert pipeline.runs == 1
+
+    asyncio.run(run())
+
+
+def test_subscriber_behind_the_buffer_gets_an_error_event() -> None:
+    async def run() -> None:
+        streams = ResumableStreams(capacity=4, max_unsent=4)
+        pipeline = _Pipeline(events=12)
+        fast = streams.start(pipeline.stream(), key="k")
+        slow = streams.join("k")
+        assert slow is not None
+
+        await _drain(fast)
+        frames = [frame async for frame in slow]
+
+        assert len(frames) == 1
+        data = _parse(frames[0])[1]
+        assert data is not None
+        event = json.loads(data)
+        assert event["type"] == "error"
+        assert event["allow_retry"] is True
+
+    asyncio.run(run())
+
+
+def test_turn_without_a_client_is_cancelled_after_the_grace_period() -> None:
+    async def run() -> None:
+        streams = ResumableStreams(resume_grace=0.05)
+        pipeline = _Pipeline(events=1000, delay=0.01)
+        stream = streams.start(pipeline.stream())
+        await anext(stream)
+        await stream.aclose()
+
+        await asyncio.sleep(0.2)
+        assert pipeline.cancelled
+        assert streams.metrics()["abandoned"] == 1
+
+    asyncio.run(run())
+
+
+async def _drain(stream: AsyncIterator[bytes]) -> None:
+    async for _ in stream:
+        pass
@@ -0,0 +1,100 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Tests for StreamGuard: stalled and disconnected clients cancel the stream they were reading."""
+
+import asyncio
+from collections.abc import AsyncIterator
+from typing import Any
+
+from stream_guard import StreamGuard
+
+
+class _Source:
+    """An endless event stream that records how far it got and whether it was closed."""
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.produced = 0
+        self.closed = False
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        try:
+            while True:
+                await asyncio.sleep(self.delay)
+                self.produced += 1
+                yield f"data: {self.produced}\n\n".encode()
+        finally:
+            self.closed = True
+
+
+async def _connected() -> bool:
+    return False
+
+
+def test_stalled_client_is_dropped_and_the_producer_cancelled() -> None:
+    async def scenario() -> dict[str, Any]:
+        guard = StreamGuard(max_buffered=4, stall_timeout=0.2, disconnect_poll=0.05)
+        source = _Source()
+        stream = guard.guard(source.stream(), _connected)
+
+        assert await anext(stream) == b"data: 1\n\n"
+        # Stop reading: the buffer fills, then the stall timeout runs out
+        await asyncio.sleep(0.5)
+        assert source.closed
+        assert source.produced <= guard.max_buffered + 2
+
+        # The client finds the stream ended, without the undelivered events
+        assert [chunk async for chunk in stream] == []
+        return guard.metrics()
+
+    metrics = asyncio.run(scenario())
+    assert metrics["stalled"] == 1
+    assert metrics["completed"] == 0
+    assert metrics["active"] == 0
+    assert metrics["buffer_high_water"] == 4
+
+
+def test_slow_client_within_the_timeout_gets_every_event() -> None:
+    async def scenario() -> tuple[list[bytes], dict[str, Any]]:
+        guard = StreamGuard(max_buffered=2, stall_timeout=0.5)
+
+        async def finite() -> AsyncIterator[bytes]:
+            for n in range(10):
+                yield str(n).encode()
+
+        received: list[bytes] = []
+        async for chunk in guard.guard(finite(), _connected):
+            received.append(chunk)
+            await asyncio.sleep(0.02)
+        return received, guard.metrics()
+
+    received, metrics = asyncio.run(scenario())
+    assert received == [str(n).encode() for n in range(10)]
+    assert metrics["completed"] == 1
+    assert metrics["stalled"] == 0
+
+
+def test_disconnected_client_cancels_the_producer() -> None:
+    async def scenario() -> tuple[_Source, list[bytes], dict[str, Any]]:
+        guard = StreamGuard(disconnect_poll=0.05)
+        source = _Source(delay=0.01)
+        gone = asyncio.Event()
+
+        async def is_disconnected() -> bool:
+            return gone.is_set()
+
+        stream = guard.guard(source.stream(), is_disconnected)
+        await anext(stream)
+        gone.set()
+        remaining = [chunk async for chunk in stream]
+        await asyncio.sleep(0.1)
+        produced = source.produced
+        await asyncio.sleep(0.1)
+        assert source.produced == produced  # Nothing runs after the disconnect
+        return source, remaining, guard.metrics()
+
+    source, remaining, metrics = asyncio.run(scenario())
+    assert source.closed
+    assert len(remaining) < 20
+    assert metrics["disconnected"] == 1
+    assert metrics["active"] == 0
@@ -0,0 +1,118 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Tests for the incremental JSON parser: chunk boundaries, code fences and malformed input."""
+
+import json
+from typing import Any
+
+import pytest
+
+from streaming_json import IncrementalJSONParser
+
+ANSWER = {
+    "can_park": True,
+    "verdict": "Yes, for 2 hours",
+    "max_duration": 120,
+    "cost": None,
+    "restrictions": [{"days": ["Mon", "Fri"], "hours": "8am-6pm"}, "No \"stopping\"\\ here"],
+    "confidence": 0.9,
+    "detailed_analysis": "Line one\nLine two é",
+}
+
+
+def _feed_all(chunks: list[str]) -> tuple[IncrementalJSONParser, list[dict[str, Any]]]:
+    parser = IncrementalJSONParser()
+    updates = [parser.feed(chunk) for chunk in chunks]
+    return parser, updates
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_every_two_chunk_split_parses_the_same(indent: int | None) -> None:
+    text = json.dumps(ANSWER, indent=indent)
+    for split in range(len(text) + 1):
+        parser, _ = _feed_all([text[:split], text[split:]])
+        assert parser.result() == ANSWER, f"split at {split}"
+
+
+def test_one_character_chunks_report_each_field_once() -> None:
+    text = json.dumps(ANSWER)
+    parser, updates = _feed_all(list(text))
+
+    reported = [key for update in updates for key in update]
+    assert reported == list(ANSWER)
+    assert parser.complete
+    assert parser.result() == ANSWER
+
+
+def test_fields_are_reported_before_the_object_closes() -> None:
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"can_park": true, "verdict": "Yes') == {"can_park": True}
+    assert parser.feed('", "max_duration": 12') == {"verdict": "Yes"}
+    assert parser.feed("0") == {}
+    assert parser.feed(', "detailed') == {"max_duration": 120}
+    assert not parser.complete
+
+
+def test_escape_split_across_chunks() -> None:
+    parser, _ = _feed_all(['{"a": "x\\', '"y", "b": "\\', "u00e9", '"}'])
+    assert parser.result() == {"a": 'x"y', "b": "é"}
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        '```json\n{"can_park": false}\n```',
+        'Here is the analysis:\n```\n{"can_park": false}\n```\nLet me know if you need more.',
+        '  {"can_park": false} trailing {"ignored": true}',
+    ],
+)
+def test_text_around_the_object_is_ignored(text: str) -> None:
+    for size in (1, 3, len(text)):
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        parser, _ = _feed_all(chunks)
+        assert parser.result() == {"can_park": False}
+
+
+def test_empty_object() -> None:
+    parser, _ = _feed_all(["{ ", "}"])
+    assert parser.result() == {}
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        '{"a" 1}',
+        '{"a":1,,"b":2}',
+        '{"a":1 "b":2}',
+        '{"a":"x" "b":2}',
+        '{"a":[1] "b":2}',
+        '{"a":1,}',
+        '{,"a":1}',
+        '{"a"::1}',
+        '{"a":}',
+        '{"a":1:}',
+        '{"a":1]',
+        '{"a":[1}',
+        '{"a":tru}',
+        '{"a":1 2}',
+        '{"a":x"y"}',
+        '{a:1}',
+        '{"a":1 b}',
+    ],
+)
+def test_malformed_input_raises(text: str) -> None:
+    for size in (1, len(text)):
+        parser = IncrementalJSONParser()
+        with pytest.raises(json.JSONDecodeError):
+            for i in range(0, len(text), size):
+                parser.feed(text[i:i + size])
+            parser.result()
+
+
+@pytest.mark.parametrize("text", ["", "no json here", '```json\n{"a": 1'])
+def test_missing_or_unclosed_object_raises(text: str) -> None:
+    parser = IncrementalJSONParser()
+    parser.feed(text)
+    assert not parser.complete
+    with pytest.raises(json.JSONDecodeError):
+        parser.result()
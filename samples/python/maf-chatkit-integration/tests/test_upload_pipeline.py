@@ -0,0 +1,91 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Tests for post-upload processing: derived files and the in-memory result cache."""
+
+import asyncio
+import io
+from pathlib import Path
+from typing import cast
+
+from PIL import Image
+
+from attachment_store import FileBasedAttachmentStore
+from store import AttachmentProcessing, SQLiteStore
+from upload_pipeline import UploadPipeline, process_upload
+
+
+def _png(size: tuple[int, int] = (800, 600)) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", size, (200, 30, 30)).save(output, format="PNG")
+    return output.getvalue()
+
+
+class _AttachmentStore:
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.hashes: dict[str, str] = {}
+
+    async def read_attachment_bytes(self, attachment_id: str) -> bytes:
+        return _png((40, 30))
+
+    def get_derived_path(self, attachment_id: str, suffix: str) -> Path:
+        return self.root / f"{attachment_id}.{suffix}"
+
+    def record_content_hash(self, attachment_id: str, content_hash: str) -> None:
+        self.hashes[attachment_id] = content_hash
+
+
+class _DataStore:
+    def __init__(self) -> None:
+        self.saved: dict[str, AttachmentProcessing] = {}
+        self.loads = 0
+
+    async def save_attachment_processing(self, attachment_id: str, processing: AttachmentProcessing) -> None:
+        self.saved[attachment_id] = processing
+
+    async def load_attachment_processing(self, attachment_id: str) -> AttachmentProcessing | None:
+        self.loads += 1
+        return self.saved.get(attachment_id)
+
+
+def test_process_upload_writes_derived_files_without_leftovers(tmp_path: Path) -> None:
+    thumbnail_path = tmp_path / "ab" / "att.thumb.jpg"
+    vision_path = tmp_path / "ab" / "att.vision.jpg"
+
+    processing = process_upload(_png(), thumbnail_path, vision_path)
+
+    assert processing.status == "ready"
+    assert processing.mime_type == "image/png"
+    assert processing.error is None
+    with Image.open(thumbnail_path) as thumbnail:
+        assert max(thumbnail.size) == 320
+    assert vision_path.stat().st_size > 0
+    assert sorted(path.name for path in thumbnail_path.parent.iterdir()) == ["att.thumb.jpg", "att.vision.jpg"]
+
+
+def test_results_cache_is_bounded_and_falls_back_to_the_data_store(tmp_path: Path) -> None:
+    async def scenario() -> None:
+        data_store = _DataStore()
+        # The fakes implement only the methods the pipeline calls
+        pipeline = UploadPipeline(
+            cast(FileBasedAttachmentStore, _AttachmentStore(tmp_path)),
+            cast(SQLiteStore, data_store),
+            max_cached_results=3,
+        )
+        for n in range(5):
+            pipeline.submit(f"att_{n}")
+            processing = await pipeline.get(f"att_{n}", wait=5.0)
+            assert processing is not None and processing.status == "ready"
+
+        assert pipeline.metrics()["cached_results"] == 3
+        assert len(data_store.saved) == 5
+
+        # An evicted result is read back from the data store and cached again
+        processing = await pipeline.get("att_0")
+        assert processing is not None and processing.status == "ready"
+        assert data_store.loads == 1
+        await pipeline.get("att_0")
+        assert data_store.loads == 1
+        assert pipeline.metrics()["cached_results"] == 3
+
+    asyncio.run(scenario())
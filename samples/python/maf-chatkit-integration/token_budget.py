@@ -0,0 +1,405 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Local prompt token counting and per-intent context budgets.
+
+Nothing knew how large a prompt was until Azure OpenAI rejected or billed
+it. TokenCounter counts tokens locally. ContextBudget uses those counts to
+keep each turn's agent input and expense prompt within a budget per query
+intent.
+
+TokenCounter uses tiktoken's ``o200k_base`` encoding (the gpt-5.1 and o3
+vocabulary) when the ``tokens`` extra is installed and the encoding file is
+available locally. tiktoken downloads that file on first use, so on an
+offline host TIKTOKEN_CACHE_DIR must point at a pre-seeded copy. Otherwise
+TokenCounter falls back to a pure-Python approximation: text is split into
+word, number, punctuation and whitespace pieces the way ``o200k_base``
+pre-tokenises, and each piece is costed by length. Against ``o200k_base``
+on this sample's prompts, docs, widget JSON and expense data, the
+approximation is off by 7% on average (15% at p90). Four characters per
+token is off by 20%.
+
+Either way, counts of repeated strings and images are cached by a digest of
+the string, never the string itself, so the cache doesn't keep base64 images
+alive. History and instructions repeat every turn, so a turn only tokenises
+its new text.
+"""
+
+import base64
+import binascii
+import io
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from collections.abc import Callable, Sequence
+from typing import Any
+
+from agent_framework import ChatMessage, DataContent, Role, TextContent, UriContent
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Chat format overhead per message (role and separators) and per request (reply priming)
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REQUEST = 3
+
+# Image cost when the size can't be read, e.g. a remote URL: a 1024x1024 high-detail image
+DEFAULT_IMAGE_TOKENS = 765
+
+# Pieces of text as o200k_base pre-tokenises them: cased word parts, 1-3 digit groups,
+# other letters, punctuation runs, line breaks with their indentation, and space runs
+_PIECE = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d{1,3}|[^\W\d_]+|[^\w\s]+|\s*\n\s*|\s{2,}|_+")
+
+# Approximation constants, fitted against o200k_base
+_SHORT_WORD = 11  # Lowercase words up to this length are usually one token
+_LONG_WORD_CHARS = 7.0  # Characters per token in longer words
+_ACRONYM_CHARS = 5.0  # Characters per token in all-caps words
+_PUNCTUATION_CHARS = 3.0  # Characters per token in mixed punctuation runs
+_REPEAT_CHARS = 32  # Characters per token in runs of one character, like "-----"
+
+# Base64 characters decoded to read an image's size from its header
+_IMAGE_HEADER_CHARS = 64 * 1024
+
+
+def approximate_token_count(text: str) -> int:
+    """Approximate the o200k_base token count of ``text`` without a vocabulary."""
+    count = 0
+    for match in _PIECE.finditer(text):
+        piece = match.group()
+        first = piece[0]
+        if first.isascii() and first.isalpha():
+            if len(piece) > 1 and piece.isupper():
+                count += math.ceil(len(piece) / _ACRONYM_CHARS)
+            elif len(piece) <= _SHORT_WORD:
+                count += 1
+            else:
+                count += math.ceil(len(piece) / _LONG_WORD_CHARS)
+        elif first.isalpha():  # Non-ASCII letters are mostly a token each
+            count += len(piece)
+        elif first.isdigit() or first.isspace() or first == "_":
+            count += 1
+        elif len(set(piece)) == 1:
+            count += math.ceil(len(piece) / _REPEAT_CHARS)
+        else:
+            count += math.ceil(len(piece) / _PUNCTUATION_CHARS)
+    return count
+
+
+def image_tokens(width: int, height: int) -> int:
+    """Vision prompt tokens for a high-detail image of the given size.
+
+    The image is scaled to fit 2048x2048, then its shorter side to 768 pixels.
+    It then costs 85 tokens plus 170 per 512-pixel tile.
+    """
+    scale = min(1.0, 2048 / max(width, height))
+    scaled_width, scaled_height = width * scale, height * scale
+    scale = min(1.0, 768 / min(scaled_width, scaled_height))
+    scaled_width, scaled_height = scaled_width * scale, scaled_height * scale
+    return 85 + 170 * math.ceil(scaled_width / 512) * math.ceil(scaled_height / 512)
+
+
+def _load_encoding(name: str) -> Any:
+    """Load a tiktoken encoding, or None if tiktoken or the encoding file is unavailable."""
+    try:
+        import tiktoken
+    except ImportError:
+        logger.info("tiktoken not installed - using approximate token counts")
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:  # Typically no network to fetch the encoding file
+        logger.warning(f"tiktoken encoding {name} unavailable ({e}) - using approximate token counts")
+        return None
+
+
+class _CountCache:
+    """LRU cache of token counts, keyed by the length and hash of the counted string.
+
+    Keying on the string itself would keep every cached history message and
+    base64 image in memory. str hashes are SipHash, computed once per string
+    object, so re-counting a payload the attachment cache hands out again is
+    still O(1). A collision only costs a wrong estimate.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._counts: OrderedDict[tuple[int, int], int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text: str, count: Callable[[str], int]) -> int:
+        """The cached count of ``text``, computing it with ``count`` on a miss."""
+        key = (len(text), hash(text))
+        with self._lock:
+            cached = self._counts.get(key)
+            if cached is not None:
+                self._counts.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        tokens = count(text)
+        with self._lock:
+            self._counts[key] = tokens
+            if len(self._counts) > self.size:
+                self._counts.popitem(last=False)
+        return tokens
+
+    def metrics(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._counts)}
+
+
+class TokenCounter:
+    """Counts prompt tokens for text, images, agent messages and Responses API input.
+
+    Features:
+    - tiktoken ``o200k_base`` when available, a calibrated offline approximation otherwise
+    - Per-string and per-image count caches keyed by digest, so repeated history is never
+      re-tokenised and cached images aren't kept in memory
+    - Image costs read from the image header, not the whole decoded image
+    - Safe to call from worker threads
+    """
+
+    def __init__(self, encoding: str = "o200k_base", cache_size: int = 8192) -> None:
+        """Initialize the counter.
+
+        Args:
+            encoding: tiktoken encoding name
+            cache_size: Distinct strings and images whose counts are kept
+        """
+        self._encoding = _load_encoding(encoding)
+        self.tokenizer = encoding if self._encoding is not None else "approximate"
+        self._text_counts = _CountCache(cache_size)
+        self._image_counts = _CountCache(cache_size)
+
+    def _tokenise(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return approximate_token_count(text)
+
+    def _image_uri_tokens(self, uri: str) -> int:
+        """Tokens for a base64 data URI image, reading only as much as its header needs."""
+        payload = uri.partition(",")[2]
+        for chars in (_IMAGE_HEADER_CHARS, len(payload)):
+            try:
+                with Image.open(io.BytesIO(base64.b64decode(payload[: chars - chars % 4]))) as image:
+                    return image_tokens(*image.size)
+            except (OSError, ValueError, binascii.Error):
+                continue
+        return DEFAULT_IMAGE_TOKENS
+
+    def count(self, text: str) -> int:
+        """Count the tokens in a string."""
+        return self._text_counts.get(text, self._tokenise) if text else 0
+
+    def count_content(self, content: Any) -> int:
+        """Count the tokens of one agent message content item."""
+        if isinstance(content, TextContent):
+            return self.count(content.text)
+        if isinstance(content, (DataContent, UriContent)):
+            media_type = content.media_type or ""
+            if not media_type.startswith("image/"):
+                return self.count(content.uri)
+            if isinstance(content, DataContent) and content.uri.startswith("data:"):
+                return self._image_counts.get(content.uri, self._image_uri_tokens)
+            return DEFAULT_IMAGE_TOKENS
+        return self.count(getattr(content, "text", None) or "")
+
+    def count_message(self, message: ChatMessage) -> int:
+        """Count the tokens of an agent message, including its chat format overhead."""
+        return TOKENS_PER_MESSAGE + sum(self.count_content(content) for content in message.contents)
+
+    def count_messages(self, messages: Sequence[ChatMessage]) -> int:
+        """Count the tokens of a list of agent messages as one request."""
+        return TOKENS_PER_REQUEST + sum(self.count_message(message) for message in messages)
+
+    def count_input(self, items: Sequence[dict[str, Any]]) -> int:
+        """Count the tokens of Responses API input items with string content."""
+        return TOKENS_PER_REQUEST + sum(TOKENS_PER_MESSAGE + self.count(str(item["content"])) for item in items)
+
+    def metrics(self) -> dict[str, Any]:
+        """Tokenizer in use and count cache hit rates."""
+        return {
+            "tokenizer": self.tokenizer,
+            "text_cache": self._text_counts.metrics(),
+            "image_cache": self._image_counts.metrics(),
+        }
+
+
+class _IntentStats:
+    """Prompt sizes and budget actions for one intent."""
+
+    def __init__(self) -> None:
+        self.turns = 0
+        self.prompt_tokens = 0
+        self.max_prompt_tokens = 0
+        self.tokens_removed = 0
+        self.trimmed = 0
+        self.compacted = 0
+        self.over_budget = 0
+        self.messages_dropped = 0
+        self.images_dropped = 0
+        self.seconds = 0.0
+
+    def metrics(self, budget: int) -> dict[str, Any]:
+        return {
+            "budget": budget,
+            "turns": self.turns,
+            "avg_prompt_tokens": round(self.prompt_tokens / self.turns) if self.turns else 0,
+            "max_prompt_tokens": self.max_prompt_tokens,
+            "tokens_removed": self.tokens_removed,
+            "compacted_turns": self.compacted,
+            "trimmed_turns": self.trimmed,
+            "over_budget_turns": self.over_budget,
+            "messages_dropped": self.messages_dropped,
+            "images_dropped": self.images_dropped,
+            "avg_fit_ms": round(self.seconds / self.turns * 1000, 3) if self.turns else 0.0,
+        }
+
+
+class ContextBudget:
+    """Keeps the prompt of each query intent within its token budget.
+
+    Features:
+    - Budgets per intent, so a flight lookup can't carry an expense-sized context
+    - Compacts before trimming: older images are replaced by a placeholder first
+    - Trims the oldest messages, keeping a leading history summary and the latest message
+    - Rebuilds Responses API input in a compact form when it is over budget
+    - Prompt size and trimming counters per intent for the /metrics/tokens endpoint
+    """
+
+    def __init__(self, counter: TokenCounter, budgets: dict[str, int], default: int):
+        """Initialize the budgets.
+
+        Args:
+            counter: Counts the prompt tokens
+            budgets: Prompt token budget per intent
+            default: Budget for intents not listed in ``budgets``
+        """
+        self.counter = counter
+        self._budgets = budgets
+        self._default = default
+        self._stats: dict[str, _IntentStats] = defaultdict(_IntentStats)
+        self._lock = threading.Lock()
+
+    def budget(self, intent: str) -> int:
+        """Prompt token budget for an intent."""
+        return self._budgets.get(intent, self._default)
+
+    def fit_messages(self, intent: str, messages: list[ChatMessage], overhead: int = 0) -> list[ChatMessage]:
+        """Fit agent messages into an intent's budget.
+
+        Images in all but the latest message are replaced by a placeholder
+        first. If that isn't enough, the oldest messages are dropped. A leading
+        system message (the history summary) and the latest message are always kept.
+
+        Args:
+            intent: QueryIntent of the turn
+            messages: Agent messages, oldest first
+            overhead: Tokens sent with every request, e.g. instructions and tool schemas
+
+        Returns:
+            The messages to send, within budget unless the kept messages alone exceed it
+        """
+        started = time.perf_counter()
+        budget = self.budget(intent)
+        costs = [self.counter.count_message(message) for message in messages]
+        original = total = overhead + TOKENS_PER_REQUEST + sum(costs)
+        images_dropped = messages_dropped = 0
+
+        if total > budget:
+            messages = list(messages)
+            for index, message in enumerate(messages[:-1]):
+                images = [content for content in message.contents if self._is_image(content)]
+                if images:
+                    messages[index] = ChatMessage(
+                        role=message.role,
+                        contents=[
+                            TextContent(text="[image omitted]") if self._is_image(content) else content
+                            for content in message.contents
+                        ],
+                    )
+                    images_dropped += len(images)
+                    total -= costs[index]
+                    costs[index] = self.counter.count_message(messages[index])
+                    total += costs[index]
+
+        if total > budget:
+            keep_first = 1 if messages and messages[0].role == Role.SYSTEM else 0
+            drop = keep_first
+            while total > budget and drop < len(messages) - 1:
+                total -= costs[drop]
+                drop += 1
+            messages_dropped = drop - keep_first
+            messages = messages[:keep_first] + messages[drop:]
+
+        self._record(intent, original, total, budget, images_dropped, messages_dropped, False, started)
+        return messages
+
+    def fit_input(
+        self,
+        intent: str,
+        items: list[dict[str, Any]],
+        compact: Callable[[], list[dict[str, Any]]] | None = None,
+    ) -> list[dict[str, Any]]:
+        """Fit Responses API input into an intent's budget.
+
+        Args:
+            intent: QueryIntent the call serves
+            items: Input items with string content
+            compact: Builds a more compact equivalent of ``items`` when they are over budget
+
+        Returns:
+            ``items``, or their compact form if ``items`` were over budget
+        """
+        started = time.perf_counter()
+        budget = self.budget(intent)
+        original = total = self.counter.count_input(items)
+        compacted = False
+        if total > budget and compact is not None:
+            items = compact()
+            total = self.counter.count_input(items)
+            compacted = True
+        self._record(intent, original, total, budget, 0, 0, compacted, started)
+        return items
+
+    @staticmethod
+    def _is_image(content: Any) -> bool:
+        return isinstance(content, (DataContent, UriContent)) and (content.media_type or "").startswith("image/")
+
+    def _record(
+        self,
+        intent: str,
+        original: int,
+        total: int,
+        budget: int,
+        images_dropped: int,
+        messages_dropped: int,
+        compacted: bool,
+        started: float,
+    ) -> None:
+        with self._lock:
+            stats = self._stats[intent]
+            stats.turns += 1
+            stats.seconds += time.perf_counter() - started
+            stats.prompt_tokens += total
+            stats.max_prompt_tokens = max(stats.max_prompt_tokens, total)
+            stats.tokens_removed += original - total
+            stats.compacted += compacted or images_dropped > 0
+            stats.trimmed += messages_dropped > 0
+            stats.over_budget += total > budget
+            stats.images_dropped += images_dropped
+            stats.messages_dropped += messages_dropped
+        if original != total:
+            logger.info(f"Fitted {intent} prompt from {original} to {total} tokens (budget {budget})")
+        if total > budget:
+            logger.warning(f"{intent} prompt is {total} tokens, over its {budget} token budget")
+
+    def metrics(self) -> dict[str, Any]:
+        """Prompt token sizes and budget actions per intent."""
+        with self._lock:
+            intents = {intent: stats.metrics(self.budget(intent)) for intent, stats in self._stats.items()}
+        return {"counter": self.counter.metrics(), "intents": intents}
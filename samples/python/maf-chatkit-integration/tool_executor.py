@@ -0,0 +1,119 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Per-tool concurrency limits and deadlines for agent tool calls.
+
+When the model asks for several tools in one response, Agent Framework runs
+the calls concurrently. Nothing bounded them, though. Ten flight lookups in
+one response all hit AviationStack at once, two o3 expense analyses could run
+side by side, and one hung call held up the model's next step indefinitely.
+ToolExecutor wraps each registered tool:
+
+- each tool has its own concurrency limit, shared by every turn in the process
+- each call has a deadline covering both its wait for a slot and its run; a
+  call that misses it is cancelled and the model gets an error string back, so
+  the other calls' results are still used
+"""
+
+import asyncio
+import functools
+import inspect
+import logging
+import time
+from collections import Counter, defaultdict
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ToolLimits:
+    """Execution limits for one tool."""
+
+    concurrency: int  # Calls running at once, across all turns
+    deadline: float  # Seconds a call may take, including waiting for a slot
+
+
+class ToolExecutor:
+    """Runs agent tool calls under per-tool concurrency limits and deadlines.
+
+    Features:
+    - Per-tool semaphores, so a burst of calls to one tool can't flood its upstream
+    - Deadlines that turn a stuck call into an error result instead of a stuck turn
+    - Wrapped tools keep their name, signature and docstring, so their schemas are unchanged
+    - Call, timeout and concurrency counters for the /metrics/tools endpoint
+    """
+
+    def __init__(self, limits: dict[str, ToolLimits], default: ToolLimits):
+        """Initialize the executor.
+
+        Args:
+            limits: Limits per tool function name
+            default: Limits for tools not listed in ``limits``
+        """
+        self._limits = limits
+        self._default = default
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+
+        self._calls: Counter[str] = Counter()
+        self._timeouts: Counter[str] = Counter()
+        self._running: Counter[str] = Counter()
+        self._peak: Counter[str] = Counter()
+        self._seconds: defaultdict[str, float] = defaultdict(float)
+
+    def wrap(self, tool: Callable[..., Any]) -> Callable[..., Any]:
+        """Wrap a tool function so its calls are limited.
+
+        Args:
+            tool: A sync or async tool function
+
+        Returns:
+            An async function with the same name, signature and docstring
+        """
+        name = tool.__name__
+        limits = self._limits.get(name, self._default)
+        semaphore = self._semaphores.setdefault(name, asyncio.Semaphore(limits.concurrency))
+
+        async def run(*args: Any, **kwargs: Any) -> Any:
+            async with semaphore:
+                self._running[name] += 1
+                self._peak[name] = max(self._peak[name], self._running[name])
+                try:
+                    result = tool(*args, **kwargs)
+                    return await result if inspect.isawaitable(result) else result
+                finally:
+                    self._running[name] -= 1
+
+        @functools.wraps(tool)
+        async def limited(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            self._calls[name] += 1
+            try:
+                return await asyncio.wait_for(run(*args, **kwargs), limits.deadline)
+            except asyncio.TimeoutError:
+                self._timeouts[name] += 1
+                logger.warning(f"Tool {name} missed its {limits.deadline:.0f}s deadline")
+                return f"Error: {name} did not finish within {limits.deadline:.0f} seconds. Please try again later."
+            finally:
+                self._seconds[name] += time.perf_counter() - started
+
+        return limited
+
+    def wrap_all(self, tools: list[Callable[..., Any]]) -> list[Callable[..., Any]]:
+        """Wrap every tool in ``tools``."""
+        return [self.wrap(tool) for tool in tools]
+
+    def metrics(self) -> dict[str, Any]:
+        """Calls, timeouts, concurrency and average duration per tool."""
+        return {
+            name: {
+                "concurrency": self._limits.get(name, self._default).concurrency,
+                "running": self._running[name],
+                "peak_running": self._peak[name],
+                "calls": calls,
+                "timeouts": self._timeouts[name],
+                "avg_seconds": round(self._seconds[name] / calls, 3),
+            }
+            for name, calls in self._calls.items()
+        }
@@ -0,0 +1,261 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+"""Post-upload processing for attachments.
+
+Uploads only write the raw bytes, so without this pipeline every expensive step
+would run later on the latency-critical ``respond`` path. As soon as a file is
+stored, UploadPipeline processes it in a worker pool:
+
+- sniffs the real MIME type from the file's magic bytes
+- computes the SHA-256 content hash
+- renders a small JPEG preview thumbnail
+- pre-encodes a vision-ready copy with image_preprocess
+
+Results, including readiness, are recorded in the attachment's metadata so
+``respond``, the agent input converter and the preview endpoint can use them.
+"""
+
+import asyncio
+import hashlib
+import io
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from PIL import Image, ImageOps
+
+from attachment_store import write_file_atomically
+from image_preprocess import prepare_vision_image
+from store import AttachmentProcessing
+
+if TYPE_CHECKING:
+    from attachment_store import FileBasedAttachmentStore
+    from store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+# Suffixes of the files written next to each upload, see FileBasedAttachmentStore.get_derived_path
+THUMBNAIL_SUFFIX = "thumb.jpg"
+VISION_SUFFIX = "vision.jpg"
+
+THUMBNAIL_SIZE = 320
+THUMBNAIL_QUALITY = 80
+
+# (offset, signature, MIME type) - checked in order
+_MAGIC_SIGNATURES: list[tuple[int, bytes, str]] = [
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (0, b"BM", "image/bmp"),
+    (0, b"II*\x00", "image/tiff"),
+    (0, b"MM\x00*", "image/tiff"),
+    (0, b"%PDF-", "application/pdf"),
+    (0, b"PK\x03\x04", "application/zip"),
+]
+_HEIF_BRANDS = {b"heic", b"heix", b"hevc", b"heim", b"heis", b"mif1", b"msf1"}
+
+
+def sniff_mime_type(header: bytes) -> str | None:
+    """Identify a file's MIME type from its first bytes.
+
+    Args:
+        header: At least the first 16 bytes of the file
+
+    Returns:
+        The detected MIME type, or None if the format isn't recognised
+    """
+    for offset, signature, mime_type in _MAGIC_SIGNATURES:
+        if header.startswith(signature, offset):
+            return mime_type
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header[4:8] == b"ftyp":
+        brand = header[8:12]
+        if brand in (b"avif", b"avis"):
+            return "image/avif"
+        if brand in _HEIF_BRANDS:
+            return "image/heic"
+    return None
+
+
+def process_upload(data: bytes, thumbnail_path: Path, vision_path: Path) -> AttachmentProcessing:
+    """Run every post-upload step for one file.
+
+    Runs synchronously - call it from a worker thread.
+
+    Args:
+        data: The uploaded bytes
+        thumbnail_path: Where to write the preview thumbnail
+        vision_path: Where to write the vision-ready copy
+
+    Returns:
+        Processing results; image steps are skipped for files Pillow can't decode
+    """
+    started = time.perf_counter()
+    processing = AttachmentProcessing(
+        status="ready",
+        mime_type=sniff_mime_type(data[:16]),
+        content_hash=hashlib.sha256(data).hexdigest(),
+        size=len(data),
+    )
+
+    if processing.mime_type and processing.mime_type.startswith("image/"):
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                thumbnail = ImageOps.exif_transpose(image)
+                thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.Resampling.LANCZOS)
+                if thumbnail.mode not in ("RGB", "L"):
+                    thumbnail = thumbnail.convert("RGB")
+                output = io.BytesIO()
+                thumbnail.save(output, format="JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+            write_file_atomically(thumbnail_path, output.getvalue())
+            processing.thumbnail_path = str(thumbnail_path)
+
+            vision_data, processing.vision_mime_type = prepare_vision_image(data, processing.mime_type)
+            write_file_atomically(vision_path, vision_data)
+            processing.vision_path = str(vision_path)
+        except Exception as e:
+            processing.error = f"Image processing skipped: {e}"
+
+    processing.processing_seconds = round(time.perf_counter() - started, 3)
+    return processing
+
+
+class UploadPipeline:
+    """Processes stored uploads in the background and records the results.
+
+    A thread pool is used, like VisionImagePreprocessor, because hashing and
+    Pillow release the GIL, and worker processes would re-import the app.
+
+    Only the most recently used results are kept in memory; the rest are read
+    back from the data store, where every result is saved.
+    """
+
+    def __init__(
+        self,
+        attachment_store: "FileBasedAttachmentStore",
+        data_store: "SQLiteStore",
+        max_workers: int = 2,
+        max_cached_results: int = 1000,
+    ):
+        """Initialize the pipeline.
+
+        Args:
+            attachment_store: Store holding the uploaded files
+            data_store: Store holding attachment metadata
+            max_workers: Worker threads used for processing
+            max_cached_results: Processing results kept in memory
+        """
+        self.attachment_store = attachment_store
+        self.data_store = data_store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upload-pipeline")
+        self._tasks: dict[str, asyncio.Task[AttachmentProcessing]] = {}
+        self._results: OrderedDict[str, AttachmentProcessing] = OrderedDict()
+        self.max_cached_results = max_cached_results
+
+        self._processed = 0
+        self._failed = 0
+        self._total_seconds = 0.0
+
+    def forget(self, attachment_id: str) -> None:
+        """Drop cached results for a deleted attachment."""
+        self._results.pop(attachment_id, None)
+
+    def _remember(self, attachment_id: str, processing: AttachmentProcessing) -> None:
+        self._results[attachment_id] = processing
+        self._results.move_to_end(attachment_id)
+        while len(self._results) > self.max_cached_results:
+            self._results.popitem(last=False)
+
+    def submit(self, attachment_id: str) -> None:
+        """Start processing a freshly stored upload in the background."""
+        previous = self._tasks.get(attachment_id)
+        if previous is not None:
+            previous.cancel()
+        self._results.pop(attachment_id, None)
+        self._tasks[attachment_id] = asyncio.create_task(
+            self._process(attachment_id), name=f"upload-pipeline-{attachment_id}"
+        )
+
+    async def _process(self, attachment_id: str) -> AttachmentProcessing:
+        loop = asyncio.get_running_loop()
+        try:
+            data = await self.attachment_store.read_attachment_bytes(attachment_id)
+            processing = await loop.run_in_executor(
+                self._executor,
+                process_upload,
+                data,
+                self.attachment_store.get_derived_path(attachment_id, THUMBNAIL_SUFFIX),
+                self.attachment_store.get_derived_path(attachment_id, VISION_SUFFIX),
+            )
+            self._processed += 1
+            self._total_seconds += processing.processing_seconds or 0.0
+            if processing.content_hash:
+                self.attachment_store.record_content_hash(attachment_id, processing.content_hash)
+            logger.info(
+                f"Upload {attachment_id} processed in {processing.processing_seconds}s: "
+                f"{processing.mime_type}, {processing.size:,} bytes"
+            )
+        except Exception as e:
+            self._failed += 1
+            logger.warning(f"Upload {attachment_id} processing failed: {e}")
+            processing = AttachmentProcessing(status="failed", error=str(e))
+
+        self._remember(attachment_id, processing)
+        await self.data_store.save_attachment_processing(attachment_id, processing)
+        if self._tasks.get(attachment_id) is asyncio.current_task():
+            del self._tasks[attachment_id]
+        return processing
+
+    async def get(self, attachment_id: str, wait: float = 0.0) -> AttachmentProcessing | None:
+        """Get processing results for an attachment.
+
+        Args:
+            attachment_id: The attachment to look up
+            wait: Seconds to wait if processing is still running
+
+        Returns:
+            The results, a pending placeholder if still running, or None if the
+            attachment was never processed
+        """
+        task = self._tasks.get(attachment_id)
+        if task is not None:
+            if wait <= 0:
+                return AttachmentProcessing(status="pending")
+            try:
+                return await asyncio.wait_for(asyncio.shield(task), timeout=wait)
+            except asyncio.TimeoutError:
+                return AttachmentProcessing(status="pending")
+
+        processing = self._results.get(attachment_id)
+        if processing is None:
+            processing = await self.data_store.load_attachment_processing(attachment_id)
+        if processing is not None:
+            self._remember(attachment_id, processing)
+        return processing
+
+    async def ensure(self, attachment_id: str, wait: float = 0.0) -> AttachmentProcessing | None:
+        """Like get(), but starts processing uploads that were never submitted.
+
+        Uploads that go directly to a blob backend never reach the upload endpoint,
+        so they are processed the first time they are needed.
+        """
+        processing = await self.get(attachment_id, wait=wait)
+        if processing is None:
+            self.submit(attachment_id)
+            processing = await self.get(attachment_id, wait=wait)
+        return processing
+
+    def metrics(self) -> dict[str, Any]:
+        """Processing counters and average duration."""
+        return {
+            "pending": len(self._tasks),
+            "cached_results": len(self._results),
+            "processed": self._processed,
+            "failed": self._failed,
+            "avg_seconds": round(self._total_seconds / self._processed, 3) if self._processed else 0.0,
+        }